@@ -0,0 +1,111 @@
+"""
+Macro-benchmarks of whole API calls against a local
+dropbox.fakeserver.FakeDropboxServer: upload and download throughput,
+small-file operations per second and folder listing throughput.
+
+    python benchmarks/bench_macro.py [scale]
+
+The server runs in the same process without injected latency, so the
+numbers measure this library (plus the fake server) rather than a network.
+They are meant for comparing commits on one machine, not as absolutes.
+"""
+
+import os
+import sys
+import tempfile
+
+import harness
+
+from dropbox.client import DropboxClient
+from dropbox.fakeserver import FakeDropboxServer
+from dropbox.rest import RESTClientObject
+from dropbox.session import DropboxSession
+
+MB = 1024 * 1024
+
+
+def make_client(server):
+    rest_client = RESTClientObject()
+    session = DropboxSession('k3xmq7zp1q9v0fa', 'wn0h3bb2y5ydk4s', 'dropbox', rest_client=rest_client)
+    session.set_token('lz2yk6plgrd2gsf', '1p9tqahm6e6tnz9')
+    server.configure(session)
+    return DropboxClient(session, rest_client=rest_client)
+
+
+def run(results, scale=1):
+    server = FakeDropboxServer().start()
+    try:
+        client = make_client(server)
+        _transfers(results, client, scale)
+        _small_files(results, client, scale)
+        _listings(results, server, client, scale)
+    finally:
+        server.stop()
+
+
+def _transfers(results, client, scale):
+    size = 16 * MB * scale
+    fd, local_path = tempfile.mkstemp()
+    try:
+        f = os.fdopen(fd, 'wb')
+        f.write(os.urandom(MB) * (size // MB))
+        f.close()
+
+        def upload():
+            f = open(local_path, 'rb')
+            try:
+                client.put_file('/bench/large.bin', f, overwrite=True)
+            finally:
+                f.close()
+        results.add('macro.upload', harness.throughput(upload, size) / MB, 'MB/s', 'higher')
+
+        results.add('macro.download', harness.throughput(
+            lambda: client.get_file('/bench/large.bin'), size) / MB, 'MB/s', 'higher')
+        results.add('macro.download_to_path', harness.throughput(
+            lambda: client.get_file_to_path('/bench/large.bin', local_path), size) / MB, 'MB/s', 'higher')
+    finally:
+        os.remove(local_path)
+
+
+def _small_files(results, client, scale):
+    count = 200 * scale
+    data = 'x' * 1024
+
+    def put_files():
+        for i in xrange(count):
+            client.put_file('/bench/small/%d.txt' % i, data, overwrite=True)
+    results.add('macro.small_put', harness.throughput(put_files, count), 'ops/s', 'higher')
+
+    def get_files():
+        for i in xrange(count):
+            client.get_file('/bench/small/%d.txt' % i)
+    results.add('macro.small_get', harness.throughput(get_files, count), 'ops/s', 'higher')
+
+    def file_metadata():
+        for i in xrange(count):
+            client.metadata('/bench/small/%d.txt' % i)
+    results.add('macro.small_metadata', harness.throughput(file_metadata, count), 'ops/s', 'higher')
+
+
+def _listings(results, server, client, scale):
+    count = 10000
+    harness.fill_folder(server.store, '/bench/listing', count, size=0)
+
+    def listing():
+        for i in xrange(scale):
+            client.metadata('/bench/listing')
+    results.add('macro.listing', harness.throughput(listing, count * scale), 'entries/s', 'higher')
+
+    def stream():
+        for i in xrange(scale):
+            for entry in client.metadata('/bench/listing', stream=True):
+                pass
+    results.add('macro.listing_stream', harness.throughput(stream, count * scale), 'entries/s', 'higher')
+
+
+def main():
+    run(harness.Results(), int(sys.argv[1]) if len(sys.argv) > 1 else 1)
+
+
+if __name__ == '__main__':
+    main()
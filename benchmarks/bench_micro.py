@@ -0,0 +1,84 @@
+"""
+Micro-benchmarks of the CPU work done for every API call, in microseconds
+per call: path normalization, URL building, OAuth signing, building an
+ErrorResponse and decoding a 10,000 entry folder listing.
+
+    python benchmarks/bench_micro.py [scale]
+
+scale multiplies the number of iterations (default 1). See run.py for
+writing and comparing result files.
+"""
+
+import json
+import StringIO
+import sys
+
+import harness
+
+from dropbox import jsonstream
+from dropbox.client import format_path
+from dropbox.fakeserver import FakeStore
+from dropbox.rest import ErrorResponse
+from dropbox.session import DropboxSession
+
+PATHS = ['/Photos/2012/IMG_0042.JPG', 'Documents//Reports/', u'/Music/B\xe9la Bart\xf3k/01.mp3', '/']
+
+LISTING_SIZE = 10000
+
+
+def make_session(signature_method='PLAINTEXT'):
+    session = DropboxSession('k3xmq7zp1q9v0fa', 'wn0h3bb2y5ydk4s', 'dropbox',
+                             signature_method=signature_method)
+    session.set_token('lz2yk6plgrd2gsf', '1p9tqahm6e6tnz9')
+    return session
+
+
+def make_listing(count=LISTING_SIZE):
+    """Return the JSON text of a folder listing with count files, as the server sends it."""
+    store = FakeStore()
+    harness.fill_folder(store, '/Photos', count, size=0)
+    return json.dumps(store.metadata('dropbox', '/Photos'))
+
+
+def run(results, scale=1):
+    n = 20000 * scale
+    session = make_session()
+
+    def format_paths():
+        for path in PATHS:
+            format_path(path)
+    results.add('micro.format_path', harness.per_call(format_paths, n) / len(PATHS) * 1e6, 'us')
+
+    target = '/metadata/dropbox/Photos/2012/IMG_0042.JPG'
+    params = {'file_limit': 10000, 'list': 'true', 'include_deleted': False}
+    results.add('micro.build_path', harness.per_call(lambda: session.build_path(target, params), n) * 1e6, 'us')
+    results.add('micro.build_url',
+                harness.per_call(lambda: session.build_url(session.API_HOST, target, params), n) * 1e6, 'us')
+
+    url = session.build_url(session.API_HOST, target)
+    for signature_method in ('PLAINTEXT', 'HMAC-SHA1'):
+        signing_session = make_session(signature_method)
+        results.add('micro.build_access_headers.%s' % signature_method,
+                    harness.per_call(lambda: signing_session.build_access_headers('GET', url, params), n) * 1e6,
+                    'us')
+
+    headers = {'content-type': 'application/json', 'content-length': '38'}
+    body = '{"error": "Path \'/Photos\' not found"}'
+    results.add('micro.error_response', harness.per_call(lambda: ErrorResponse(404, headers, body), n) * 1e6, 'us')
+
+    listing = make_listing()
+    results.add('micro.decode_listing.json',
+                harness.per_call(lambda: json.loads(listing), max(1, scale)) * 1e3, 'ms')
+
+    def stream_listing():
+        for entry in jsonstream.JSONListing(StringIO.StringIO(listing)):
+            pass
+    results.add('micro.decode_listing.stream', harness.per_call(stream_listing, max(1, scale)) * 1e3, 'ms')
+
+
+def main():
+    run(harness.Results(), int(sys.argv[1]) if len(sys.argv) > 1 else 1)
+
+
+if __name__ == '__main__':
+    main()
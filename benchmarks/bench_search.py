@@ -0,0 +1,83 @@
+"""
+Measures type-ahead searches (one query per keystroke) answered by a
+local dropbox.searchindex.SearchIndex against the same searches sent to a
+dropbox.fakeserver.FakeDropboxServer, and how fast the index is filled:
+
+    python benchmarks/bench_search.py [scale]
+
+The fake server runs in the same process without injected latency, so the
+server numbers are a lower bound for a real round trip.
+"""
+
+import sys
+
+import harness
+
+from dropbox.client import DropboxClient
+from dropbox.fakeserver import FakeDropboxServer
+from dropbox.rest import RESTClientObject
+from dropbox.searchindex import SearchIndex
+from dropbox.session import DropboxSession
+
+WORDS = ['beach', 'birthday', 'budget', 'invoice', 'holiday', 'report', 'scan', 'summer']
+TYPED = ['be', 'bea', 'beac', 'beach', 'beach 2', 'beach 20', 'beach 201']
+
+
+def make_client(server, search_index=None):
+    rest_client = RESTClientObject()
+    session = DropboxSession('k3xmq7zp1q9v0fa', 'wn0h3bb2y5ydk4s', 'dropbox', rest_client=rest_client)
+    session.set_token('lz2yk6plgrd2gsf', '1p9tqahm6e6tnz9')
+    server.configure(session)
+    return DropboxClient(session, rest_client=rest_client, search_index=search_index)
+
+
+def fill_tree(store, count, root='dropbox'):
+    """Put count empty files with varied names into 100 folders of a FakeStore."""
+    for i in xrange(count):
+        word = WORDS[i % len(WORDS)]
+        store.write(root, '/bench/search/%s/%02d/%s %d.txt' % (word, i % 100, word, i), '')
+
+
+def run(results, scale=1):
+    count = 10000 * scale
+    server = FakeDropboxServer().start()
+    try:
+        fill_tree(server.store, count)
+        search_index = SearchIndex()
+        client = make_client(server, search_index)
+        remote = make_client(server)
+
+        results.add('search.fill', harness.throughput(
+            lambda: search_index.fill(client, '/bench/search'), count, repeat=1), 'entries/s', 'higher')
+
+        # The server needs at least three characters.
+        queries = [query for query in TYPED if len(query) >= 3]
+
+        def server_search():
+            for query in queries:
+                remote.search('/bench/search', query)
+
+        def local_search():
+            for query in queries:
+                client.search('/bench/search', query)
+
+        def local_prefix():
+            for query in TYPED:
+                client.search('/bench/search', query, file_limit=20, prefix=True)
+
+        before = harness.per_call(server_search, 3) / len(queries)
+        after = harness.per_call(local_search, 20) / len(queries)
+        results.add('search.server', before * 1e6, 'us')
+        results.add('search.local', after * 1e6, 'us')
+        results.add('search.local_prefix', harness.per_call(local_prefix, 200) / len(TYPED) * 1e6, 'us')
+        print '%-40s %12.1fx' % ('search.speedup', before / after)
+    finally:
+        server.stop()
+
+
+def main():
+    run(harness.Results(), int(sys.argv[1]) if len(sys.argv) > 1 else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Measures the per-call overhead of DropboxSession.build_access_headers.
+
+For each signature method, compares the generic oauth.OAuthRequest signing
+path (what every call used to go through) with the session's cached fast
+path, over the parameters of a few typical calls:
+
+    python benchmarks/bench_signing.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dropbox import oauth
+from dropbox.session import DropboxSession
+
+CALLS = [
+    ('account_info', 'GET', 'https://api.dropbox.com/1/account/info', {}),
+    ('metadata', 'GET', 'https://api.dropbox.com/1/metadata/dropbox/Photos/2012',
+     {'file_limit': 10000, 'list': 'true', 'include_deleted': 'false',
+      'hash': '37eb1ba1849d4b0fb0b28caf7ef3af52'}),
+    ('files_put', 'PUT', 'https://api-content.dropbox.com/1/files_put/dropbox/Documents/report%20final.pdf',
+     {'overwrite': 'false', 'parent_rev': '1f44b0ab1c'}),
+    ('search', 'GET', 'https://api.dropbox.com/1/search/dropbox/Music',
+     {'query': u'B\xe9la Bart\xf3k', 'file_limit': 1000, 'include_deleted': 'false'}),
+    ('fileops/move', 'POST', 'https://api.dropbox.com/1/fileops/move',
+     {'root': 'dropbox', 'from_path': u'/Photos/Paris 2011/IMG_0042.JPG',
+      'to_path': u'/Photos/Best of/IMG_0042.JPG'}),
+]
+
+
+def make_session(signature_method):
+    session = DropboxSession('k3xmq7zp1q9v0fa', 'wn0h3bb2y5ydk4s', 'dropbox',
+                             signature_method=signature_method)
+    session.set_token('lz2yk6plgrd2gsf', '1p9tqahm6e6tnz9')
+    return session
+
+
+def generic_build_access_headers(session, method, resource_url, params=None):
+    """build_access_headers as it is done for signature methods without a fast path."""
+    params = dict(params or {})
+    params.update({
+        'oauth_consumer_key': session.consumer.key,
+        'oauth_timestamp': oauth.generate_timestamp(),
+        'oauth_nonce': oauth.generate_nonce(),
+        'oauth_version': oauth.OAuthRequest.version,
+        'oauth_token': session.token.key,
+    })
+    oauth_request = oauth.OAuthRequest.from_request(method, resource_url, parameters=params)
+    oauth_request.sign_request(session.signature_method, session.consumer, session.token)
+    return oauth_request.to_header(), params
+
+
+def run(session, func, iterations):
+    def sign_all():
+        for name, method, url, params in CALLS:
+            func(session, method, url, params)
+    return min(timeit.repeat(sign_all, number=iterations, repeat=3)) / (iterations * len(CALLS))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print '%-10s %12s %12s %8s' % ('method', 'generic', 'fast', 'speedup')
+    for signature_method in ('PLAINTEXT', 'HMAC-SHA1'):
+        session = make_session(signature_method)
+        before = run(session, generic_build_access_headers, iterations)
+        after = run(session, DropboxSession.build_access_headers, iterations)
+        print '%-10s %9.2f us %9.2f us %7.1fx' % (signature_method, before * 1e6, after * 1e6,
+                                                  before / after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Measures the CPU time DropboxClient spends preparing a request (path
+normalization, URL building and signing) before anything is sent.
+
+Compares the way requests used to be prepared (format_path with a regular
+expression, "/metadata/%s%s" formatting and the whole URL built twice,
+once for signing and once for sending) with the precomputed endpoint URLs
+and memoized path quoting, for a metadata-heavy workload over a set of
+paths that are requested again and again:
+
+    python benchmarks/bench_urls.py [iterations]
+"""
+
+import re
+import sys
+import urlparse
+
+import harness
+
+from dropbox.client import DropboxClient
+from dropbox.session import DropboxSession
+
+PATHS = ['/Photos/2012/IMG_%04d.JPG' % i for i in range(50)] + \
+        [u'/Music/B\xe9la Bart\xf3k/%02d.mp3' % i for i in range(25)] + \
+        ['Documents//Reports/Q%d/' % i for i in range(25)]
+
+
+def make_client(locale=None):
+    session = DropboxSession('k3xmq7zp1q9v0fa', 'wn0h3bb2y5ydk4s', 'dropbox', locale=locale)
+    session.set_token('lz2yk6plgrd2gsf', '1p9tqahm6e6tnz9')
+    return DropboxClient(session)
+
+
+def legacy_format_path(path):
+    if not path:
+        return path
+    path = re.sub(r'/+', '/', path)
+    if path == '/':
+        return ""
+    else:
+        return '/' + path.strip('/')
+
+
+def legacy_metadata_request(client, path):
+    """What DropboxClient.metadata() used to do before sending the request."""
+    session = client.session
+    target = "/metadata/%s%s" % (session.root, legacy_format_path(path))
+    params = {'file_limit': 10000, 'list': 'true', 'include_deleted': False}
+    host = session.API_HOST
+    base = session.build_url(host, target)
+    headers, params = session.build_access_headers('GET', base, params)
+    url = session.build_url(host, target, params)
+    return url, params, headers
+
+
+def metadata_request(client, path):
+    """What DropboxClient.metadata() does now before sending the request."""
+    params = {'file_limit': 10000, 'list': 'true', 'include_deleted': False}
+    return client._request("/metadata", path, params, method='GET')
+
+
+def _comparable(url):
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+    params = dict((k, v) for k, v in urlparse.parse_qsl(query)
+                  if k not in ('oauth_timestamp', 'oauth_nonce'))
+    return scheme, netloc, path, params
+
+
+def check(client):
+    """Make sure both ways produce the same request, apart from timestamp and nonce."""
+    for path in PATHS:
+        legacy = legacy_metadata_request(client, path)[0]
+        current = metadata_request(client, path)[0]
+        assert _comparable(legacy) == _comparable(current), (legacy, current)
+
+
+def run(results, scale=1, iterations=None):
+    iterations = iterations or 200 * scale
+    for locale in (None, 'de'):
+        client = make_client(locale)
+        check(client)
+
+        def legacy():
+            for path in PATHS:
+                legacy_metadata_request(client, path)
+
+        def current():
+            for path in PATHS:
+                metadata_request(client, path)
+
+        name = 'urls.metadata_request%s' % ('.locale' if locale else '')
+        before = harness.per_call(legacy, iterations) / len(PATHS)
+        after = harness.per_call(current, iterations) / len(PATHS)
+        results.add(name + '.legacy', before * 1e6, 'us')
+        results.add(name, after * 1e6, 'us')
+        print '%-40s %12.1fx' % (name + '.speedup', before / after)
+
+
+def main():
+    run(harness.Results(), iterations=int(sys.argv[1]) if len(sys.argv) > 1 else None)
+
+
+if __name__ == '__main__':
+    main()
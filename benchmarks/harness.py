@@ -0,0 +1,113 @@
+"""
+Helpers shared by the benchmark scripts: timing, and writing, reading and
+comparing result files.
+
+A result file is a JSON document with the environment the benchmarks ran
+in and one entry per measurement:
+
+    {"environment": {"commit": "35b5964...", "python": "2.7.18", ...},
+     "results": {"micro.format_path": {"value": 1.9, "unit": "us", "better": "lower"}, ...}}
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, ROOT)
+
+
+def per_call(func, number, repeat=3):
+    """Return the best time in seconds one call of func took, over repeat runs of number calls."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def throughput(func, amount, repeat=3):
+    """Return the best rate (amount per second) of repeat calls of func, each handling amount."""
+    best = None
+    for i in xrange(repeat):
+        started = time.time()
+        func()
+        elapsed = time.time() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return amount / max(best, 1e-9)
+
+
+class Results(object):
+    """The measurements of one benchmark run."""
+
+    def __init__(self):
+        self.results = {}
+
+    def add(self, name, value, unit, better='lower'):
+        """Record a measurement; better says whether 'lower' or 'higher' values are better."""
+        assert better in ('lower', 'higher'), "expected better of 'lower' or 'higher'"
+        self.results[name] = {'value': value, 'unit': unit, 'better': better}
+        print '%-40s %12.2f %s' % (name, value, unit)
+
+    def as_dict(self):
+        return {'environment': environment(), 'results': self.results}
+
+    def write(self, path):
+        f = open(path, 'w')
+        try:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+        finally:
+            f.close()
+
+
+def environment():
+    """Describe where the benchmarks ran, so result files can be told apart."""
+    try:
+        commit = subprocess.Popen(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE).communicate()[0].strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            }
+
+
+def load(path):
+    f = open(path)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+def compare(baseline, current, threshold=0.1):
+    """Compare two result documents (as returned by load()).
+
+    Returns:
+        A list of (name, old value, new value, relative change, regressed) for
+        the measurements in both, where regressed means the value got worse
+        by more than threshold (a fraction).
+    """
+    rows = []
+    old_results, new_results = baseline['results'], current['results']
+    for name in sorted(set(old_results) & set(new_results)):
+        old, new = old_results[name], new_results[name]
+        if not old['value']:
+            continue
+        change = (new['value'] - old['value']) / float(old['value'])
+        worse = change if new['better'] == 'lower' else -change
+        rows.append((name, old['value'], new['value'], change, worse > threshold))
+    return rows
+
+
+def fill_folder(store, path, count, size=1024, root='dropbox'):
+    """Put count files of size bytes into a folder of a dropbox.fakeserver.FakeStore."""
+    data = 'x' * size
+    for i in xrange(count):
+        store.write(root, '%s/IMG_%05d.JPG' % (path, i), data)
@@ -0,0 +1,56 @@
+"""
+Runs the micro-, URL building, search and macro-benchmarks and writes the results to a JSON file,
+optionally comparing them with the results of an earlier run:
+
+    python benchmarks/run.py --output before.json
+    git checkout my-branch
+    python benchmarks/run.py --output after.json --compare before.json
+
+With --compare, the exit status is 1 if a measurement got worse by more
+than --threshold (a fraction, default 0.1).
+"""
+
+import optparse
+import sys
+
+import harness
+import bench_macro
+import bench_micro
+import bench_search
+import bench_urls
+
+SUITES = {'micro': bench_micro, 'macro': bench_macro, 'search': bench_search, 'urls': bench_urls}
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--output', help='write the results to this JSON file')
+    parser.add_option('--compare', metavar='BASELINE', help='compare with the results in this JSON file')
+    parser.add_option('--threshold', type='float', default=0.1,
+                      help='relative change that counts as a regression [default %default]')
+    parser.add_option('--suite', action='append', choices=sorted(SUITES),
+                      help='run only this suite (micro, macro, search or urls); may be repeated')
+    parser.add_option('--scale', type='int', default=1, help='multiply the amount of work [default %default]')
+    options, args = parser.parse_args()
+
+    results = harness.Results()
+    for name in options.suite or sorted(SUITES, reverse=True):
+        SUITES[name].run(results, options.scale)
+    if options.output:
+        results.write(options.output)
+
+    if options.compare:
+        regressions = 0
+        print
+        print '%-40s %12s %12s %8s' % ('benchmark', 'baseline', 'current', 'change')
+        for name, old, new, change, regressed in harness.compare(harness.load(options.compare),
+                                                                 results.as_dict(), options.threshold):
+            print '%-40s %12.2f %12.2f %+7.1f%%%s' % (name, old, new, change * 100,
+                                                      '  REGRESSION' if regressed else '')
+            regressions += regressed
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+A non-blocking variant of dropbox.client.DropboxClient.
+
+Every API method of AsyncDropboxClient returns a dropbox.workers.Future
+right away; the call itself runs on a pool of worker threads with their own
+connection pool. Requests are signed exactly like DropboxClient's (through
+DropboxSession.build_access_headers).
+
+    client = AsyncDropboxClient(session, max_workers=64)
+    futures = [client.metadata(path) for path in paths]
+    listings = [f.result() for f in futures]
+
+Event loops can get notified with Future.add_done_callback() instead of
+blocking on result().
+"""
+
+from dropbox.client import DropboxClient
+from dropbox.rest import ConnectionPool
+from dropbox.rest import RESTClientObject
+from dropbox.workers import WorkerPool
+
+
+class AsyncDropboxClient(object):
+    """
+    Runs DropboxClient calls in the background. The methods take the same
+    arguments as their DropboxClient counterparts and return a Future whose
+    result() is what the DropboxClient method would have returned (or raised).
+
+    The helpers walk(), batch(), apply_operations() and get_chunked_uploader()
+    aren't wrapped: they already run their requests concurrently or drive
+    them step by step. Use them on the underlying client attribute, or run
+    them with submit().
+    """
+
+    def __init__(self, session, max_workers=32, rest_client=None):
+        """Initialize the AsyncDropboxClient object.
+
+        Args:
+            session: A dropbox.session.DropboxSession object to use for making requests.
+            max_workers: The number of requests in flight at the same time. [default 32]
+            rest_client: A dropbox.rest.RESTClient-like object to use for making requests. [optional]
+                By default a RESTClientObject with a private connection pool that
+                keeps max_workers idle connections per host is used.
+        """
+        if rest_client is None:
+            rest_client = RESTClientObject(ConnectionPool(maxsize=max_workers))
+        self.client = DropboxClient(session, rest_client)
+        self.session = session
+        self.rest_client = rest_client
+        self.pool = WorkerPool(max_workers)
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the worker pool and return a Future."""
+        return self.pool.submit(fn, *args, **kwargs)
+
+    def close(self, wait=True):
+        """Stop the worker threads once the outstanding calls have finished."""
+        self.pool.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _async_method(name):
+    def method(self, *args, **kwargs):
+        return self.pool.submit(getattr(self.client, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = ("Like DropboxClient.%s(), but returns a dropbox.workers.Future for its result."
+                      % name)
+    return method
+
+
+for _name in ('account_info', 'put_file', 'get_file', 'get_file_and_metadata', 'get_file_to_path',
+              'file_copy', 'file_create_folder', 'file_delete', 'file_move', 'metadata',
+              'path_exists', 'thumbnail', 'thumbnail_and_metadata', 'search', 'delta',
+              'revisions', 'restore', 'media', 'share', 'chunked_upload', 'commit_chunked_upload'):
+    setattr(AsyncDropboxClient, _name, _async_method(_name))
+del _name
@@ -0,0 +1,335 @@
+"""
+Runs many file operations (copy, move, delete, create folder) at once.
+
+Operations that touch unrelated paths are sent concurrently; operations on
+overlapping paths are ordered so that the batch does what a sequential run
+would do, only faster:
+
+    with client.batch(max_workers=16) as batch:
+        batch.create_folder('/Archive/2011')
+        for name in names:
+            batch.move('/Inbox/' + name, '/Archive/2011/' + name)
+        batch.delete('/Inbox')
+    for result in batch.report.failed:
+        print result.operation, result.error
+
+or, in one call:
+
+    report = client.apply_operations([('create_folder', '/Archive'),
+                                      ('move', '/Inbox/a.txt', '/Archive/a.txt')])
+"""
+
+import Queue
+import time
+
+from dropbox.workers import WorkerPool
+
+
+class Operation(object):
+    """A single file operation.
+
+    Attributes:
+        action: One of COPY, MOVE, DELETE and CREATE_FOLDER.
+        path: The path operated on (the source for copies and moves).
+        to_path: The destination of a copy or move, None otherwise.
+    """
+
+    COPY = 'copy'
+    MOVE = 'move'
+    DELETE = 'delete'
+    CREATE_FOLDER = 'create_folder'
+
+    ACTIONS = (COPY, MOVE, DELETE, CREATE_FOLDER)
+
+    def __init__(self, action, path, to_path=None):
+        assert action in self.ACTIONS, "expected an action of %s" % ', '.join(repr(a) for a in self.ACTIONS)
+        assert (to_path is not None) == (action in (self.COPY, self.MOVE)), \
+            "copy and move need a to_path, delete and create_folder don't"
+        self.action = action
+        self.path = path
+        self.to_path = to_path
+
+    def __repr__(self):
+        if self.to_path is None:
+            return '<Operation %s %r>' % (self.action, self.path)
+        return '<Operation %s %r -> %r>' % (self.action, self.path, self.to_path)
+
+    def apply(self, client):
+        """Perform the operation with client and return the resulting metadata."""
+        if self.action == self.COPY:
+            return client.file_copy(self.path, self.to_path)
+        elif self.action == self.MOVE:
+            return client.file_move(self.path, self.to_path)
+        elif self.action == self.DELETE:
+            return client.file_delete(self.path)
+        else:
+            return client.file_create_folder(self.path)
+
+
+class OperationResult(object):
+    """The outcome of an Operation.
+
+    Attributes:
+        operation: The Operation.
+        metadata: The metadata the call returned, None on failure.
+        error: The exception the operation failed with, None on success.
+        attempts: The number of times the operation was sent.
+        elapsed: The number of seconds the operation took, including retries.
+    """
+
+    def __init__(self, operation, metadata=None, error=None, attempts=1, elapsed=0.0):
+        self.operation = operation
+        self.metadata = metadata
+        self.error = error
+        self.attempts = attempts
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        return {'action': self.operation.action,
+                'path': self.operation.path,
+                'to_path': self.operation.to_path,
+                'ok': self.ok,
+                'error': str(self.error) if self.error is not None else None,
+                'attempts': self.attempts,
+                'elapsed': self.elapsed,
+                }
+
+
+class BatchReport(object):
+    """The outcome of a batch.
+
+    Attributes:
+        results: A list of OperationResult objects in the order the operations were added.
+        elapsed: The wall-clock time the whole batch took, in seconds.
+    """
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    def as_dict(self):
+        return {'operations': len(self.results),
+                'succeeded': len(self.succeeded),
+                'failed': len(self.failed),
+                'elapsed': self.elapsed,
+                'results': [result.as_dict() for result in self.results],
+                }
+
+
+class Batch(object):
+    """
+    Collects operations and runs them on a bounded pool of worker threads.
+
+    Operations are ordered by the paths they touch. Two operations whose
+    paths overlap (one is the other or inside it) run one after the other,
+    in the order they were added, except that:
+
+    - A folder is created before operations that put something inside it.
+    - A copy or move out of a path runs before a delete of that path (or of
+      a folder containing it).
+
+    All other operations run concurrently. An operation runs even if one it
+    waited for failed (creating a folder that already exists fails, but
+    moving files into it still works); its own outcome is reported.
+
+    Used as a context manager, the batch runs when the block exits without
+    an exception and the BatchReport is left in the report attribute.
+    """
+
+    def __init__(self, client, max_workers=8, retry_policy=None):
+        """Initialize a Batch.
+
+        Args:
+            client: The DropboxClient to perform the operations with.
+            max_workers: The number of operations in flight at the same time. [default 8]
+            retry_policy: A dropbox.rest.RetryPolicy. [optional]
+                Operations that fail with an error the policy counts as a failure
+                (socket errors, 5xx) are retried up to its max_retries times, after
+                its backoff_delay(). Note that these writes are retried although they
+                aren't idempotent: if the lost attempt went through, a retried move
+                fails with a 404 and a retried copy creates a renamed second copy.
+        """
+        self.client = client
+        self.max_workers = max_workers
+        self.retry_policy = retry_policy
+        self.operations = []
+        self.report = None
+
+    def add(self, operation):
+        """Add an Operation, or an (action, path[, to_path]) tuple."""
+        if not isinstance(operation, Operation):
+            operation = Operation(*operation)
+        self.operations.append(operation)
+        return operation
+
+    def copy(self, from_path, to_path):
+        return self.add(Operation(Operation.COPY, from_path, to_path))
+
+    def move(self, from_path, to_path):
+        return self.add(Operation(Operation.MOVE, from_path, to_path))
+
+    def delete(self, path):
+        return self.add(Operation(Operation.DELETE, path))
+
+    def create_folder(self, path):
+        return self.add(Operation(Operation.CREATE_FOLDER, path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.run()
+
+    def run(self):
+        """Run the operations added so far and return a BatchReport."""
+        operations, self.operations = self.operations, []
+        start = time.time()
+        dependencies, dependents = _dependencies(operations)
+        results = [None] * len(operations)
+        done = Queue.Queue()
+        waiting = set(range(len(operations)))
+        running = 0
+
+        pool = WorkerPool(self.max_workers)
+        try:
+            def submit(i):
+                waiting.discard(i)
+                future = pool.submit(self._apply, operations[i])
+                future.add_done_callback(lambda future: done.put((i, future)))
+
+            for i in range(len(operations)):
+                if not dependencies[i]:
+                    submit(i)
+                    running += 1
+
+            while running:
+                i, future = done.get()
+                running -= 1
+                results[i] = future.result()
+                for j in dependents[i]:
+                    dependencies[j].discard(i)
+                    if not dependencies[j] and j in waiting:
+                        submit(j)
+                        running += 1
+                if not running and waiting:
+                    # Only possible with contradictory orderings; fall back to the order added.
+                    submit(min(waiting))
+                    running += 1
+        finally:
+            pool.shutdown(wait=False)
+
+        self.report = BatchReport(results, time.time() - start)
+        return self.report
+
+    def _apply(self, operation):
+        start = time.time()
+        attempt = 0
+        while True:
+            try:
+                metadata = operation.apply(self.client)
+            except Exception, e:
+                policy = self.retry_policy
+                if policy is not None and attempt < policy.max_retries and policy.is_failure(e):
+                    time.sleep(policy.backoff_delay(attempt))
+                    attempt += 1
+                    continue
+                return OperationResult(operation, error=e, attempts=attempt + 1,
+                                       elapsed=time.time() - start)
+            return OperationResult(operation, metadata, attempts=attempt + 1,
+                                   elapsed=time.time() - start)
+
+
+def apply_operations(client, operations, max_workers=8, retry_policy=None):
+    """Run operations (Operation objects or (action, path[, to_path]) tuples) as a Batch.
+
+    Returns:
+        A BatchReport.
+    """
+    batch = Batch(client, max_workers, retry_policy)
+    for operation in operations:
+        batch.add(operation)
+    return batch.run()
+
+
+def _key(path):
+    """Return the key operations are ordered by; the same as dropbox.index uses."""
+    # Imported here, as dropbox.index imports dropbox.client, which imports this module.
+    from dropbox.index import normalize_path
+    return normalize_path(path)
+
+
+def _ancestors(key):
+    """Yield the keys of the folders containing key, innermost first, ending with the root ('')."""
+    while key:
+        key = key.rsplit('/', 1)[0]
+        yield key
+
+
+def _is_within(key, folder):
+    return key == folder or folder == '' or key.startswith(folder + '/')
+
+
+def _order(a, b):
+    """Given overlapping operations a and b, a added first, return True if b must wait for a."""
+    if b.action == Operation.CREATE_FOLDER and a.action != Operation.DELETE:
+        # a puts something inside (or at) the folder b creates: create first
+        target = _key(a.to_path if a.to_path is not None else a.path)
+        if target != _key(b.path) and _is_within(target, _key(b.path)):
+            return False
+    if a.action == Operation.DELETE and b.action in (Operation.COPY, Operation.MOVE):
+        # b reads from what a deletes: copy or move it out first
+        if _is_within(_key(b.path), _key(a.path)):
+            return False
+    return True
+
+
+def _dependencies(operations):
+    """Return, for each operation, the set of operations it waits for and the list waiting for it."""
+    keys = []
+    for operation in operations:
+        paths = [_key(operation.path)]
+        if operation.to_path is not None:
+            paths.append(_key(operation.to_path))
+        keys.append(paths)
+
+    exact = {}    # key -> operations touching exactly that path
+    subtree = {}  # key -> operations touching a path strictly below it
+    for i, paths in enumerate(keys):
+        for key in paths:
+            exact.setdefault(key, []).append(i)
+            for ancestor in _ancestors(key):
+                subtree.setdefault(ancestor, []).append(i)
+
+    dependencies = [set() for _ in operations]
+    dependents = [[] for _ in operations]
+    for i, paths in enumerate(keys):
+        overlapping = set()
+        for key in paths:
+            overlapping.update(exact.get(key, ()))
+            overlapping.update(subtree.get(key, ()))
+            for ancestor in _ancestors(key):
+                overlapping.update(exact.get(ancestor, ()))
+        for j in overlapping:
+            if j <= i:
+                continue
+            if _order(operations[i], operations[j]):
+                before, after = i, j
+            else:
+                before, after = j, i
+            if before not in dependencies[after]:
+                dependencies[after].add(before)
+                dependents[before].append(after)
+    return dependencies, dependents
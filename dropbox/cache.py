@@ -0,0 +1,157 @@
+"""
+An in-memory cache of folder listings for DropboxClient.metadata().
+
+Every folder listing comes with a hash. When a DropboxClient has a
+MetadataCache, metadata() sends the hash of the listing it already has and
+the server answers 304 if the folder hasn't changed, in which case the
+cached listing is returned without transferring or decoding it again.
+
+    client = DropboxClient(session, metadata_cache=MetadataCache(max_entries=5000))
+
+Cached listings are shared between callers and must not be modified.
+"""
+
+import threading
+import time
+
+
+class MetadataCache(object):
+    """
+    A thread-safe LRU cache of folder listings, keyed by root and normalized path
+    (plus the include_deleted and file_limit they were listed with).
+
+    Attributes (counters):
+        hits: Listings served from the cache after the server answered 304.
+        misses: Lookups that found nothing usable in the cache.
+        revalidations: Requests that were sent with a cached hash.
+        stale: Revalidations the server answered with a new listing.
+        evictions: Entries dropped because of max_entries, max_bytes or ttl.
+    """
+
+    ENTRY_OVERHEAD = 512  # rough size of one decoded metadata dict, in bytes
+
+    def __init__(self, max_entries=1000, ttl=None, max_bytes=None):
+        """Initialize a MetadataCache.
+
+        Args:
+            max_entries: The maximum number of folder listings kept. [default 1000]
+            ttl: Seconds after which a listing the server hasn't confirmed since
+                is dropped rather than revalidated. [optional]
+            max_bytes: An approximate cap on the memory used by the cached
+                listings, in bytes. [optional]
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # key -> [previous link, next link, key, entry], in a circular list
+        # from least to most recently used (collections.OrderedDict needs Python 2.7)
+        self._entries = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached listing for key, or None."""
+        self._lock.acquire()
+        try:
+            entry = self._pop(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            metadata, size, stored = entry
+            if self.ttl is not None and time.time() - stored > self.ttl:
+                self.size -= size
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._append(key, entry)
+            self.revalidations += 1
+            return metadata
+        finally:
+            self._lock.release()
+
+    def put(self, key, metadata):
+        """Store a listing that came with a hash, replacing any older one."""
+        size = self.ENTRY_OVERHEAD * (1 + len(metadata.get('contents', ()))) + len(metadata.get('path', ''))
+        self._lock.acquire()
+        try:
+            old = self._pop(key)
+            if old is not None:
+                self.size -= old[1]
+                self.stale += 1
+            self._append(key, (metadata, size, time.time()))
+            self.size += size
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     (self.max_bytes is not None and self.size > self.max_bytes)):
+                _, evicted_size, _ = self._pop(self._root[1][2])
+                self.size -= evicted_size
+                self.evictions += 1
+        finally:
+            self._lock.release()
+
+    def not_modified(self, key):
+        """Record that the server confirmed the cached listing for key (a 304)."""
+        self._lock.acquire()
+        try:
+            self.hits += 1
+            link = self._entries.get(key)
+            if link is not None:
+                metadata, size, _ = link[3]
+                link[3] = (metadata, size, time.time())
+        finally:
+            self._lock.release()
+
+    def invalidate(self, key=None):
+        """Drop the listing for key, or everything if key is omitted."""
+        self._lock.acquire()
+        try:
+            if key is None:
+                self._entries.clear()
+                self._root[:] = [self._root, self._root, None, None]
+                self.size = 0
+            else:
+                entry = self._pop(key)
+                if entry is not None:
+                    self.size -= entry[1]
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _append(self, key, entry):
+        """Store entry as the most recently used one."""
+        root = self._root
+        last = root[0]
+        last[1] = root[0] = self._entries[key] = [last, root, key, entry]
+
+    def _pop(self, key):
+        """Remove and return the entry for key, or None."""
+        link = self._entries.pop(key, None)
+        if link is None:
+            return None
+        previous, next = link[0], link[1]
+        previous[1] = next
+        next[0] = previous
+        return link[3]
+
+    def stats(self):
+        """Return a dictionary with the cache's counters."""
+        self._lock.acquire()
+        try:
+            return {'entries': len(self._entries),
+                    'size': self.size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'revalidations': self.revalidations,
+                    'stale': self.stale,
+                    'evictions': self.evictions,
+                    }
+        finally:
+            self._lock.release()
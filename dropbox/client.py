@@ -4,14 +4,28 @@ configure a dropbox.session.DropboxSession for this to work, but otherwise
 it's fairly self-explanatory.
 """
 
+import os
+import random
 import re
+import time
+import urllib
 try:
     import json
 except ImportError:
     import simplejson as json
 
 from dropbox.rest import ErrorResponse
+from dropbox.rest import endpoint_name
 from dropbox.rest import RESTClient
+from dropbox.rest import RESTSocketError
+import dropbox.metadata
+from dropbox import batch
+from dropbox import jsonstream
+from dropbox import walker
+from dropbox.rest import RESTResponse
+from dropbox.session import quote, QUOTE_CACHE_SIZE
+
+_SLASHES_RE = re.compile(r'/+')
 
 def format_path(path):
     """Normalize path for use with the Dropbox API.
@@ -23,13 +37,59 @@ def format_path(path):
     if not path:
         return path
 
-    path = re.sub(r'/+', '/', path)
+    if path[0] == '/' and path[-1] != '/' and '//' not in path:
+        return path  # already normalized
+
+    path = _SLASHES_RE.sub('/', path)
 
     if path == '/':
         return ""
     else:
         return '/' + path.strip('/')
 
+_quoted_paths = {}
+
+def _quote_path(path):
+    """Return quote(format_path(path)), memoized like dropbox.session.quote()."""
+    quoted = _quoted_paths.get(path)
+    if quoted is None:
+        if len(_quoted_paths) >= QUOTE_CACHE_SIZE:
+            _quoted_paths.clear()
+        quoted = _quoted_paths[path] = quote(format_path(path) or '')
+    return quoted
+
+_encoded_params = {}
+
+_VOLATILE_PARAMS = frozenset(['oauth_nonce', 'oauth_timestamp', 'oauth_signature'])
+
+# Other values (e.g. lists) may be unhashable or change between calls.
+_MEMOIZED_TYPES = frozenset([str, unicode, int, long, bool])
+
+def _urlencode(params):
+    """urllib.urlencode() params, memoizing the encoded pairs that recur between calls."""
+    pairs = []
+    for k, v in params.iteritems():
+        if k in _VOLATILE_PARAMS or type(v) not in _MEMOIZED_TYPES:
+            pairs.append('%s=%s' % (urllib.quote_plus(str(k)), urllib.quote_plus(str(v))))
+            continue
+        key = (k, v, type(v))
+        pair = _encoded_params.get(key)
+        if pair is None:
+            if len(_encoded_params) >= QUOTE_CACHE_SIZE:
+                _encoded_params.clear()
+            pair = _encoded_params[key] = '%s=%s' % (urllib.quote_plus(str(k)), urllib.quote_plus(str(v)))
+        pairs.append(pair)
+    return '&'.join(pairs)
+
+def _byte_range(start, length):
+    """Return the value of a Range header for length bytes from start."""
+    if start is None:
+        return 'bytes=-%d' % length
+    if length is None:
+        return 'bytes=%d-' % start
+    assert length > 0, "length must be positive"
+    return 'bytes=%d-%d' % (start, start + length - 1)
+
 class DropboxClient(object):
     """
     The main access point of doing REST calls on Dropbox. You should
@@ -44,13 +104,33 @@ class DropboxClient(object):
     point indicates that the user needs to be reauthenticated.
     """
 
-    def __init__(self, session):
+    def __init__(self, session, rest_client=RESTClient, metadata_cache=None, index=None,
+                 typed_metadata=False, search_index=None):
         """Initialize the DropboxClient object.
 
         Args:
             session: A dropbox.session.DropboxSession object to use for making requests.
+            rest_client: A dropbox.rest.RESTClient-like object to use for making requests. [optional]
+                The default shares its connection pool with every other DropboxClient
+                and DropboxSession in the process.
+            metadata_cache: A dropbox.cache.MetadataCache for folder listings. [optional]
+                metadata() then revalidates cached listings by their hash instead
+                of downloading them again.
+            index: A dropbox.index.MetadataIndex to keep current with the results of
+                metadata() and of all write operations. [optional]
+                path_exists() is then answered from it while its information is fresh.
+            typed_metadata: Whether metadata(), search() and revisions() return compact
+                dropbox.metadata objects instead of dictionaries. [default False]
+                They still support read-only dictionary access.
+            search_index: A dropbox.searchindex.SearchIndex to keep current the same way. [optional]
+                search() is then answered from it below the folders it was filled with.
         """
         self.session = session
+        self.rest_client = rest_client
+        self.metadata_cache = metadata_cache
+        self.index = index
+        self.typed_metadata = typed_metadata
+        self.search_index = search_index
 
     def request(self, target, params=None, method='POST', content_server=False):
         """Make an HTTP request to a target API method.
@@ -71,18 +151,41 @@ class DropboxClient(object):
             A tuple of (url, params, headers) that should be used to make the request.
             OAuth authentication information will be added as needed within these fields.
         """
+        host = self.session.API_CONTENT_HOST if content_server else self.session.API_HOST
+        base = "%s://%s/%d%s" % (self.session.API_SCHEME, host, self.session.API_VERSION, quote(target))
+        return self._sign(method, base, params)
+
+    def _request(self, endpoint, path=None, params=None, method='POST', content_server=False):
+        """Like request(), for an endpoint (e.g. '/metadata') and, if it takes one, a path.
+
+        The endpoint's URL comes from the session's precomputed ones and the
+        normalized and quoted path from a cache, so the URL is built just once.
+        """
+        host = self.session.API_CONTENT_HOST if content_server else self.session.API_HOST
+        base = self.session.build_endpoint_url(host, endpoint, path is not None)
+        if path is not None:
+            base += _quote_path(path)
+        return self._sign(method, base, params)
+
+    def _sign(self, method, base, params):
+        """Sign a request to base (a URL without query) and add the query for GET and PUT."""
         assert method in ['GET','POST', 'PUT'], "Only 'GET', 'POST', and 'PUT' are allowed."
+        started = time.time()
         if params is None:
             params = {}
+        if self.session.locale:
+            params = dict(params, locale=self.session.locale)
 
-        host = self.session.API_CONTENT_HOST if content_server else self.session.API_HOST
-        base = self.session.build_url(host, target)
         headers, params = self.session.build_access_headers(method, base, params)
 
-        if method in ('GET', 'PUT'):
-            url = self.session.build_url(host, target, params)
+        if method in ('GET', 'PUT') and params:
+            url = "%s?%s" % (base, _urlencode(params))
         else:
-            url = self.session.build_url(host, target)
+            url = base
+
+        instrumentation = getattr(getattr(self.rest_client, 'IMPL', self.rest_client), 'instrumentation', None)
+        if instrumentation is not None:
+            instrumentation.observe(endpoint_name(url), 'sign', time.time() - started)
 
         return url, params, headers
 
@@ -96,9 +199,9 @@ class DropboxClient(object):
             For a detailed description of what this call returns, visit:
             https://www.dropbox.com/developers/docs#account-info
         """
-        url, params, headers = self.request("/account/info", method='GET')
+        url, params, headers = self._request("/account/info", method='GET')
 
-        return RESTClient.GET(url, headers)
+        return self.rest_client.GET(url, headers)
 
 
     def put_file(self, full_path, file_obj, overwrite=False, parent_rev=None):
@@ -108,6 +211,8 @@ class DropboxClient(object):
             full_path: The full path to upload the file to, *including the file name*.
                 If the destination directory does not yet exist, it will be created.
             file_obj: A file-like object to upload. If you would like, you can pass a string as file_obj.
+                The file is streamed from its current position in fixed-size blocks;
+                an mmap, bytearray or memoryview is sent without being copied.
             overwrite: Whether to overwrite an existing file at the given path. [default False]
                 If overwrite is False and a file already exists there, Dropbox
                 will rename the upload to make sure it doesn't overwrite anything.
@@ -134,12 +239,7 @@ class DropboxClient(object):
             A dropbox.rest.ErrorResponse with an HTTP status of
                400: Bad request (may be due to many things; check e.error for details)
                503: User over quota
-
-        Note: In Python versions below version 2.6, httplib doesn't handle file-like objects.
-            In that case, this code will read the entire file into memory (!).
         """
-        path = "/files_put/%s%s" % (self.session.root, format_path(full_path))
-
         params = {
             'overwrite': bool(overwrite),
             }
@@ -147,39 +247,49 @@ class DropboxClient(object):
         if parent_rev is not None:
             params['parent_rev'] = parent_rev
 
-        url, params, headers = self.request(path, params, method='PUT', content_server=True)
+        url, params, headers = self._request("/files_put", full_path, params, method='PUT', content_server=True)
 
-        return RESTClient.PUT(url, file_obj.read(), headers)
+        return self._record(self.rest_client.PUT(url, file_obj, headers))
 
-    def get_file(self, from_path, rev=None):
+    def get_file(self, from_path, rev=None, stream=False, start=None, length=None):
         """Download a file.
 
-        Unlike most other calls, get_file returns a raw HTTPResponse with the connection open.
-        You should call .read() and perform any processing you need, then close the HTTPResponse.
+        By default the whole file is read into memory. Pass stream=True to get
+        a dropbox.rest.RESTResponse with the connection open instead; read it in
+        chunks with .read(n), .readinto(buf) or by iterating over it, then close it.
+
+        Pass start and/or length to download only part of the file with a
+        Range request; the status is then 206. See also
+        dropbox.transfer.SegmentedDownloader.
 
         Args:
             from_path: The path to the file to be downloaded.
             rev: A previous rev value of the file to be downloaded. [optional]
+            stream: Whether to return a streaming RESTResponse. [default False]
+            start: The offset of the first byte to download. [optional]
+            length: The number of bytes to download. [optional]
+                With start omitted, the last length bytes are downloaded.
 
         Returns:
-            An httplib.HTTPResponse that is the result of the request.
+            A (status, headers, body) tuple, or a dropbox.rest.RESTResponse if stream is True.
 
         Raises:
             A dropbox.rest.ErrorResponse with an HTTP status of
                400: Bad request (may be due to many things; check e.error for details)
                404: No file was found at the given path, or the file that was there was deleted.
+               416: The requested range starts beyond the end of the file.
                200: Request was okay but response was malformed in some way.
         """
-        path = "/files/%s%s" % (self.session.root, format_path(from_path))
-
         params = {}
         if rev is not None:
             params['rev'] = rev
 
-        url, params, headers = self.request(path, params, method='GET', content_server=True)
-        return RESTClient.request("GET", url, headers=headers, raw_response=True)
+        url, params, headers = self._request("/files", from_path, params, method='GET', content_server=True)
+        if start is not None or length is not None:
+            headers['Range'] = _byte_range(start, length)
+        return self.rest_client.request("GET", url, headers=headers, raw_response=True, stream=stream)
 
-    def get_file_and_metadata(self, from_path, rev=None):
+    def get_file_and_metadata(self, from_path, rev=None, stream=False, start=None, length=None):
         """Download a file alongwith its metadata.
 
         Acts as a thin wrapper around get_file() (see get_file() comments for
@@ -188,9 +298,11 @@ class DropboxClient(object):
         Args:
             from_path: The path to the file to be downloaded.
             rev: A previous rev value of the file to be downloaded. [optional]
+            stream: Whether to return a streaming RESTResponse. [default False]
+            start, length: The part of the file to download (see get_file()). [optional]
 
         Returns:
-            - An httplib.HTTPResponse that is the result of the request.
+            - The result of get_file().
             - A dictionary containing the metadata of the file (see
               https://www.dropbox.com/developers/docs#metadata for details).
 
@@ -200,16 +312,63 @@ class DropboxClient(object):
                404: No file was found at the given path, or the file that was there was deleted.
                200: Request was okay but response was malformed in some way.
         """
-        file_res = self.get_file(from_path, rev)
+        file_res = self.get_file(from_path, rev, stream=stream, start=start, length=length)
         metadata = DropboxClient.__parse_metadata_as_dict(file_res)
 
         return file_res, metadata
 
+    def get_file_to_path(self, from_path, to_path, rev=None, chunk_size=RESTResponse.CHUNK_SIZE,
+                         callback=None):
+        """Download a file straight to disk.
+
+        The body is streamed through a single buffer of chunk_size bytes, so
+        memory use doesn't depend on the size of the file. If the download
+        fails, the partially written file is removed.
+
+        Args:
+            from_path: The path to the file to be downloaded.
+            to_path: The local path to write the file to.
+            rev: A previous rev value of the file to be downloaded. [optional]
+            chunk_size: The size of the read buffer in bytes. [default 64 KiB]
+            callback: A callable that is passed the number of bytes after each
+                chunk was written. [optional]
+
+        Returns:
+            A dictionary containing the metadata of the downloaded file.
+
+        Raises:
+            A dropbox.rest.ErrorResponse (see get_file()).
+        """
+        response, metadata = self.get_file_and_metadata(from_path, rev, stream=True)
+        buf = bytearray(chunk_size)
+        try:
+            out = open(to_path, 'wb')
+            try:
+                while True:
+                    n = response.readinto(buf)
+                    if not n:
+                        break
+                    out.write(buffer(buf, 0, n))
+                    if callback:
+                        callback(n)
+            finally:
+                out.close()
+        except:
+            response.close()
+            if os.path.exists(to_path):
+                os.remove(to_path)
+            raise
+        return metadata
+
     @staticmethod
-    def __parse_metadata_as_dict((status, headers, response)):
+    def __parse_metadata_as_dict(file_res):
         """Parses file metadata from a raw dropbox HTTP response, raising a
         dropbox.rest.ErrorResponse if parsing fails.
         """
+        if isinstance(file_res, RESTResponse):
+            status, headers, response = file_res.status, file_res.headers, None
+        else:
+            status, headers, response = file_res
         metadata = None
         for header, header_val in headers.items():
             if header.lower() == 'x-dropbox-metadata':
@@ -251,9 +410,12 @@ class DropboxClient(object):
                   'to_path': format_path(to_path),
                   }
 
-        url, params, headers = self.request("/fileops/copy", params)
+        url, params, headers = self._request("/fileops/copy", params=params)
 
-        return RESTClient.POST(url, params, headers)
+        metadata = self.rest_client.POST(url, params, headers)
+        if self.search_index is not None:
+            self.search_index.copy(from_path, to_path, metadata)
+        return self._record(metadata)
 
 
     def file_create_folder(self, path):
@@ -275,9 +437,9 @@ class DropboxClient(object):
         """
         params = {'root': self.session.root, 'path': format_path(path)}
 
-        url, params, headers = self.request("/fileops/create_folder", params)
+        url, params, headers = self._request("/fileops/create_folder", params=params)
 
-        return RESTClient.POST(url, params, headers)
+        return self._record(self.rest_client.POST(url, params, headers))
 
 
     def file_delete(self, path):
@@ -300,9 +462,14 @@ class DropboxClient(object):
         """
         params = {'root': self.session.root, 'path': format_path(path)}
 
-        url, params, headers = self.request("/fileops/delete", params)
+        url, params, headers = self._request("/fileops/delete", params=params)
 
-        return RESTClient.POST(url, params, headers)
+        metadata = self.rest_client.POST(url, params, headers)
+        if self.index is not None:
+            self.index.remove(path)
+        if self.search_index is not None:
+            self.search_index.remove(path)
+        return metadata
 
 
     def file_move(self, from_path, to_path):
@@ -331,12 +498,18 @@ class DropboxClient(object):
         """
         params = {'root': self.session.root, 'from_path': format_path(from_path), 'to_path': format_path(to_path)}
 
-        url, params, headers = self.request("/fileops/move", params)
+        url, params, headers = self._request("/fileops/move", params=params)
 
-        return RESTClient.POST(url, params, headers)
+        metadata = self.rest_client.POST(url, params, headers)
+        if self.index is not None:
+            self.index.move(from_path, to_path, metadata)
+        if self.search_index is not None:
+            self.search_index.move(from_path, to_path, metadata)
+        return metadata
 
 
-    def metadata(self, path, list=True, file_limit=10000, hash=None, rev=None, include_deleted=False):
+    def metadata(self, path, list=True, file_limit=10000, hash=None, rev=None, include_deleted=False,
+                 stream=False):
         """Retrieve metadata for a file or folder.
 
         Args:
@@ -352,13 +525,18 @@ class DropboxClient(object):
                 can then be passed back into this function later to save on\
                 bandwidth. Rather than returning an unchanged folder's contents,\
                 the server will instead return a 304.\
+                With a metadata_cache, the hash of the cached listing is sent
+                automatically and the cached listing is returned on a 304.
             rev: The revision of the file to retrieve the metadata for. [optional]
                 This parameter only applies for files. If omitted, you'll receive
                 the most recent revision metadata.
+            stream: Whether to return a dropbox.jsonstream.JSONListing that decodes
+                the contained files one at a time while the response is read. [default False]
+                Streamed listings bypass the metadata_cache and the indexes.
 
         Returns:
             A dictionary containing the metadata of the file or folder
-            (and contained files if appropriate).
+            (and contained files if appropriate), or a JSONListing if stream is True.
 
             For a detailed description of what this call returns, visit:
             https://www.dropbox.com/developers/docs#metadata
@@ -371,13 +549,22 @@ class DropboxClient(object):
             - 404: No file was found at given path.
             - 406: Too many file entries to return.
         """
-        path = "/metadata/%s%s" % (self.session.root, format_path(path))
-
         params = {'file_limit': file_limit,
                   'list': 'true',
                   'include_deleted': include_deleted,
                   }
 
+        cache, cached = self.metadata_cache, None
+        if cache is not None and list and hash is None and not rev and not stream:
+            # A listing fetched with a higher file_limit may be too long for this caller (a 406).
+            cache_key = ("/metadata/%s%s" % (self.session.root, format_path(path)), bool(include_deleted),
+                         file_limit)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                hash = cached['hash']
+        else:
+            cache = None
+
         if not list:
             params['list'] = 'false'
         if hash is not None:
@@ -385,12 +572,100 @@ class DropboxClient(object):
         if rev:
             params['rev'] = rev
 
-        url, params, headers = self.request(path, params, method='GET')
+        url, params, headers = self._request("/metadata", path, params, method='GET')
+
+        try:
+            if stream:
+                response = self.rest_client.request("GET", url, headers=headers, stream=True)
+            else:
+                metadata = self.rest_client.GET(url, headers)
+        except ErrorResponse, e:
+            if e.status == 304 and cached is not None:
+                cache.not_modified(cache_key)
+                return self._record(cached)
+            if e.status == 404 and not rev:
+                if self.index is not None:
+                    self.index.remove(path)
+                if self.search_index is not None:
+                    self.search_index.remove(path)
+            raise
+
+        if stream:
+            return jsonstream.JSONListing(response, 'contents', self._entry_converter())
+        metadata = self._typed(metadata)
+        if cache is not None and 'hash' in metadata:
+            cache.put(cache_key, metadata)
+        return metadata if rev else self._record(metadata)
+
+    def _typed(self, result):
+        """Convert a metadata result to dropbox.metadata objects if typed_metadata is set."""
+        if self.typed_metadata:
+            return dropbox.metadata.from_json(result)
+        return result
+
+    def _entry_converter(self):
+        """Return the conversion for the entries of a streamed listing, or None."""
+        if self.typed_metadata:
+            return dropbox.metadata.from_json
+        return None
+
+    def _record(self, metadata):
+        """Record metadata returned by the server in the indexes, if there are any."""
+        if self.index is not None:
+            self.index.update(metadata)
+        if self.search_index is not None:
+            self.search_index.update(metadata)
+        return metadata
+
+    def walk(self, path, max_workers=8, prune=None, file_limit=10000, include_deleted=False,
+             on_error=None):
+        """Yield the metadata of every file and folder below path.
+
+        Folders are listed concurrently with at most max_workers requests in
+        flight. See dropbox.walker.walk() for the details.
+        """
+        return walker.walk(self, path, max_workers, prune, file_limit, include_deleted, on_error)
+
+    def batch(self, max_workers=8, retry_policy=None):
+        """Return a dropbox.batch.Batch that runs file operations concurrently.
+
+        Use it as a context manager; the operations added in the block run
+        when it exits, and the outcome is left in the batch's report attribute.
+        See dropbox.batch.Batch for how operations are ordered.
+        """
+        return batch.Batch(self, max_workers, retry_policy)
 
-        return RESTClient.GET(url, headers)
+    def apply_operations(self, operations, max_workers=8, retry_policy=None):
+        """Run many file operations concurrently, ordered by the paths they touch.
+
+        Args:
+            operations: A list of dropbox.batch.Operation objects or tuples like
+                ('copy', from_path, to_path), ('move', from_path, to_path),
+                ('delete', path) and ('create_folder', path).
+            max_workers: The number of operations in flight at the same time. [default 8]
+            retry_policy: A dropbox.rest.RetryPolicy to retry failed operations with. [optional]
+
+        Returns:
+            A dropbox.batch.BatchReport with the result or error of every operation.
+        """
+        return batch.apply_operations(self, operations, max_workers, retry_policy)
 
     def path_exists(self, path):
-        """Returns metadata if the path exists, None if it doesn't"""
+        """Returns metadata if the path exists, None if it doesn't
+
+        With an index, fresh indexed information is used instead of asking the
+        server; the returned dictionary then only has the keys documented for
+        dropbox.index.MetadataIndex.lookup().
+        """
+        if self.index is not None:
+            exists = self.index.exists(path)
+            if exists is False:
+                return None
+            if exists:
+                # The root has no row of its own until it has been listed.
+                metadata = self.index.lookup(path)
+                if metadata is not None:
+                    return metadata
         try:
             metadata = self.metadata(path)
             if metadata.get('is_deleted', False):
@@ -401,11 +676,11 @@ class DropboxClient(object):
                 return None
             raise
 
-    def thumbnail(self, from_path, size='large', format='JPEG'):
+    def thumbnail(self, from_path, size='large', format='JPEG', stream=False):
         """Download a thumbnail for an image.
 
-        Unlike most other calls, thumbnail returns a raw HTTPResponse with the connection open.
-        You should call .read() and perform any processing you need, then close the HTTPResponse.
+        By default the whole thumbnail is read into memory. Pass stream=True to get
+        a dropbox.rest.RESTResponse with the connection open instead (see get_file()).
 
         Args:
             from_path: The path to the file to be thumbnailed.
@@ -415,9 +690,11 @@ class DropboxClient(object):
                respectively), though others may be available. Check
                https://www.dropbox.com/developers/docs#thumbnails for
                more details.
+            format: The image format of the thumbnail, 'JPEG' or 'PNG'. [default 'JPEG']
+            stream: Whether to return a streaming RESTResponse. [default False]
 
         Returns:
-            An httplib.HTTPResponse that is the result of the request.
+            A (status, headers, body) tuple, or a dropbox.rest.RESTResponse if stream is True.
 
         Raises:
             A dropbox.rest.ErrorResponse with an HTTP status of
@@ -428,12 +705,11 @@ class DropboxClient(object):
         """
         assert format in ['JPEG', 'PNG'], "expected a thumbnail format of 'JPEG' or 'PNG', got %s" % format
 
-        path = "/thumbnails/%s%s" % (self.session.root, format_path(from_path))
+        url, params, headers = self._request("/thumbnails", from_path, {'size': size, 'format': format},
+                                             method='GET', content_server=True)
+        return self.rest_client.request("GET", url, headers=headers, raw_response=True, stream=stream)
 
-        url, params, headers = self.request(path, {'size': size}, method='GET', content_server=True)
-        return RESTClient.request("GET", url, headers=headers, raw_response=True)  # TODO: raw_response
-
-    def thumbnail_and_metadata(self, from_path, size='large', format='JPEG'):
+    def thumbnail_and_metadata(self, from_path, size='large', format='JPEG', stream=False):
         """Download a thumbnail for an image alongwith its metadata.
 
         Acts as a thin wrapper around thumbnail() (see thumbnail() comments for
@@ -443,9 +719,10 @@ class DropboxClient(object):
             from_path: The path to the file to be thumbnailed.
             size: A string describing the desired thumbnail size. See thumbnail()
                for details.
+            stream: Whether to return a streaming RESTResponse. [default False]
 
         Returns:
-            - An httplib.HTTPResponse that is the result of the request.
+            - The result of thumbnail().
             - A dictionary containing the metadata of the file whose thumbnail
               was downloaded (see https://www.dropbox.com/developers/docs#metadata
               for details).
@@ -458,27 +735,43 @@ class DropboxClient(object):
             - 415: Image is invalid and cannot be thumbnailed.
             - 200: Request was okay but response was malformed in some way.
         """
-        thumbnail_res = self.thumbnail(from_path, size, format)
+        thumbnail_res = self.thumbnail(from_path, size, format, stream=stream)
         metadata = DropboxClient.__parse_metadata_as_dict(thumbnail_res)
 
         return thumbnail_res, metadata
 
-    def search(self, path, query, file_limit=1000, include_deleted=False):
+    def search(self, path, query, file_limit=1000, include_deleted=False, stream=False, prefix=False):
         """Search directory for filenames matching query.
 
+        With a search_index that was filled with path or a folder containing
+        it (and not longer than its max_age ago), the search is answered
+        locally without a request; see dropbox.searchindex.SearchIndex.search().
+        Searches for deleted files and streamed searches always go to the server.
+
         Args:
             path: The directory to search within.
 
-            query: The query to search on (minimum 3 characters).
+            query: The query to search on (minimum 3 characters, unless answered locally).
 
             file_limit: The maximum number of file entries to return within a folder.
-               The server will return at max 1,000 files.
+               The server will return at max 1,000 files. None returns every
+               match when answered locally.
 
             include_deleted: Whether to include deleted files in search results.
 
+            stream: Whether to return a dropbox.jsonstream.JSONListing that decodes
+                the results one at a time while the response is read. [default False]
+
+            prefix: Only return the files and folders whose names start with query. [default False]
+                Can't be combined with stream. The server doesn't support
+                this, so without a covering search_index the server's first
+                1,000 matches for query are filtered, and a query shorter
+                than 3 characters returns an empty list without a request.
+
         Returns:
             A list of the metadata of all matching files (up to
-            file_limit entries).  For a detailed description of what
+            file_limit entries), or a JSONListing of them if stream is True.
+            For a detailed description of what
             this call returns, visit:
             https://www.dropbox.com/developers/docs#search
 
@@ -487,17 +780,76 @@ class DropboxClient(object):
             400: Bad request (may be due to many things; check e.error
             for details)
         """
-        path = "/search/%s%s" % (self.session.root, format_path(path))
+        search_index = self.search_index
+        if search_index is not None and not include_deleted and not stream:
+            results = search_index.search(path, query, file_limit, prefix)
+            if results is not None:
+                return self._typed(results)
+
+        if prefix:
+            assert not stream, "prefix searches can't be streamed"
+            name_prefix = (query.decode('utf8') if isinstance(query, str) else query).lower()
+            if len(name_prefix) < 3:
+                return self._typed([])  # the server would reject the query
 
         params = {
             'query': query,
-            'file_limit': file_limit,
+            # Filtering by prefix happens afterwards, so ask for as many matches as possible.
+            'file_limit': 1000 if file_limit is None or prefix else file_limit,
             'include_deleted': include_deleted,
             }
 
-        url, params, headers = self.request(path, params)
+        url, params, headers = self._request("/search", path, params)
+
+        if stream:
+            response = self.rest_client.request("POST", url, post_params=params, headers=headers,
+                                                stream=True)
+            return jsonstream.JSONListing(response, None, self._entry_converter())
+        results = self.rest_client.POST(url, params, headers)
+        if prefix:
+            results = [entry for entry in results
+                       if entry['path'].rsplit('/', 1)[-1].lower().startswith(name_prefix)][:file_limit]
+        if search_index is not None and not include_deleted:
+            for entry in results:
+                search_index.update(entry)
+        return self._typed(results)
+
+    def delta(self, cursor=None):
+        """A way of letting you keep up with changes to files and folders in a
+        user's Dropbox.  You can periodically call delta() to get a list of "delta
+        entries", which are instructions on how to update your local state to
+        match the server's state.
+
+        Args:
+            cursor: A string that encodes the latest information that has been
+                returned. On the first call, omit this argument or pass in None.
+                On subsequent calls, pass in the cursor string returned by the
+                previous call.
+
+        Returns:
+            A dictionary with the following keys:
+
+            - entries: A list of [path, metadata] pairs. If metadata is None, the
+              file or folder at path (and everything below it) has been deleted.
+              Otherwise it has been created or changed. Paths are lowercased.
+            - reset: If True, clear your local state before applying the entries.
+            - cursor: The string to pass to the next delta() call.
+            - has_more: If True, call delta() again right away to get more entries.
+
+            For a detailed description of what this call returns, visit:
+            https://www.dropbox.com/developers/docs#delta
+
+        Raises:
+            A dropbox.rest.ErrorResponse with an HTTP status of
+               400: Bad request (may be due to many things; check e.error for details)
+        """
+        params = {}
+        if cursor is not None:
+            params['cursor'] = cursor
+
+        url, params, headers = self._request("/delta", params=params)
 
-        return RESTClient.POST(url, params, headers)
+        return self.rest_client.POST(url, params, headers)
 
     def revisions(self, path, rev_limit=1000):
         """Retrieve revisions of a file.
@@ -520,15 +872,13 @@ class DropboxClient(object):
             - 400: Bad request (may be due to many things; check e.error for details)
             - 404: No revisions were found at the given path.
         """
-        path = "/revisions/%s%s" % (self.session.root, format_path(path))
-
         params = {
             'rev_limit': rev_limit,
             }
 
-        url, params, headers = self.request(path, params, method='GET')
+        url, params, headers = self._request("/revisions", path, params, method='GET')
 
-        return RESTClient.GET(url, headers)
+        return self._typed(self.rest_client.GET(url, headers))
 
     def restore(self, path, rev):
         """Restore a file to a previous revision.
@@ -549,15 +899,13 @@ class DropboxClient(object):
             - 400: Bad request (may be due to many things; check e.error for details)
             - 404: Unable to find the file at the given revision.
         """
-        path = "/restore/%s%s" % (self.session.root, format_path(path))
-
         params = {
             'rev': rev,
             }
 
-        url, params, headers = self.request(path, params)
+        url, params, headers = self._request("/restore", path, params)
 
-        return RESTClient.POST(url, params, headers)
+        return self._record(self.rest_client.POST(url, params, headers))
 
     def media(self, path):
         """Get a temporary unauthenticated URL for a media file.
@@ -585,11 +933,9 @@ class DropboxClient(object):
             - 400: Bad request (may be due to many things; check e.error for details)
             - 404: Unable to find the file at the given path.
         """
-        path = "/media/%s%s" % (self.session.root, format_path(path))
-
-        url, params, headers = self.request(path, method='GET')
+        url, params, headers = self._request("/media", path, method='GET')
 
-        return RESTClient.GET(url, headers)
+        return self.rest_client.GET(url, headers)
 
     def share(self, path):
         """Create a shareable link to a file or folder.
@@ -616,11 +962,9 @@ class DropboxClient(object):
             - 400: Bad request (may be due to many things; check e.error for details)
             - 404: Unable to find the file at the given path.
         """
-        path = "/shares/%s%s" % (self.session.root, format_path(path))
+        url, params, headers = self._request("/shares", path, method='GET')
 
-        url, params, headers = self.request(path, method='GET')
-
-        return RESTClient.GET(url, headers)
+        return self.rest_client.GET(url, headers)
 
     def chunked_upload(self, file_obj, upload_id=None, offset=0):
         """
@@ -641,15 +985,14 @@ class DropboxClient(object):
                400: Bad request (may be due to many things; check e.error for details)
                404 The upload_id does not exist or has expired.
         """
-        path = "/chunked_upload"
-
         params = {}
         if upload_id is not None:
             params['upload_id'] = upload_id
             params['offset'] = offset
 
-        url, params, headers = self.request(path, params, method='PUT', content_server=True)
-        return RESTClient.PUT(url, file_obj.read(), headers)
+        url, params, headers = self._request("/chunked_upload", params=params, method='PUT',
+                                             content_server=True)
+        return self.rest_client.PUT(url, file_obj, headers)
 
     def commit_chunked_upload(self, full_path, upload_id, overwrite=False, parent_rev=None):
         """
@@ -685,8 +1028,6 @@ class DropboxClient(object):
             A dropbox.rest.ErrorResponse with an HTTP status of
                400: Bad request (may be due to many things; check e.error for details)
         """
-        path = '/commit_chunked_upload/%s%s' % (self.session.root, format_path(full_path))
-
         params = {
             'upload_id': upload_id,
             'overwrite': bool(overwrite),
@@ -695,6 +1036,151 @@ class DropboxClient(object):
         if parent_rev is not None:
             params['parent_rev'] = parent_rev
 
-        url, params, headers = self.request(path, params, method='PUT', content_server=True)
+        url, params, headers = self._request("/commit_chunked_upload", full_path, params, content_server=True)
 
-        return RESTClient.POST(url, headers)
+        return self._record(self.rest_client.POST(url, params, headers))
+
+    def get_chunked_uploader(self, file_obj, length=None, upload_id=None, offset=0, checkpoint=None):
+        """Create a ChunkedUploader to upload a large file in resumable chunks.
+
+        See ChunkedUploader for the meaning of the arguments.
+        """
+        return ChunkedUploader(self, file_obj, length, upload_id, offset, checkpoint)
+
+
+class ChunkedUploader(object):
+    """
+    Uploads a large file to Dropbox via /chunked_upload, one chunk at a time.
+
+    Failed chunks are retried, continuing from the offset the server reports,
+    so a network error never means starting over. Pass a checkpoint callable
+    to persist (upload_id, offset) after every chunk; after a restart, a new
+    ChunkedUploader created with those values picks up where the old one
+    stopped:
+
+        uploader = client.get_chunked_uploader(open(path, 'rb'), upload_id=upload_id,
+                                               offset=offset, checkpoint=save_checkpoint)
+        uploader.upload_chunked()
+        uploader.finish('/backups/2012-01-31.tar')
+
+    Upload ids expire after a day on the server.
+    """
+
+    def __init__(self, client, file_obj, length=None, upload_id=None, offset=0, checkpoint=None):
+        """Initialize a ChunkedUploader.
+
+        Args:
+            client: The DropboxClient to upload with.
+            file_obj: A file-like object positioned at the start of the data to upload.
+                If offset is given, the first offset bytes are skipped (by seeking
+                if possible).
+            length: The number of bytes to upload. [optional]
+                If omitted, everything up to the end of file_obj is uploaded.
+            upload_id: The upload id of an upload to resume. [optional]
+            offset: The offset the server has confirmed for upload_id. [default 0]
+            checkpoint: A callable taking (upload_id, offset), called after every
+                chunk the server confirmed. [optional]
+        """
+        self.client = client
+        self.file_obj = file_obj
+        self.target_length = length
+        self.upload_id = upload_id
+        self.offset = 0
+        self.checkpoint = checkpoint
+        self._block = None
+        try:
+            self._base = file_obj.tell()
+        except (AttributeError, IOError):
+            self._base = None
+        if offset:
+            self._seek(offset)
+
+    def upload_chunked(self, chunk_size=4 * 1024 * 1024, max_retries=5):
+        """Upload the rest of the file.
+
+        Only one chunk is held in memory at a time.
+
+        Args:
+            chunk_size: The size of each chunk in bytes. [default 4 MiB]
+            max_retries: How often a chunk is retried after a socket error,
+                a 5xx response or an offset mismatch before giving up. [default 5]
+
+        Raises:
+            A dropbox.rest.ErrorResponse or dropbox.rest.RESTSocketError once a chunk
+            failed more than max_retries times in a row. upload_id and offset still
+            describe the server's state, so upload_chunked() can be called again.
+        """
+        failures = 0
+        while True:
+            if self._block is None:
+                if self.target_length is not None:
+                    chunk_size = min(chunk_size, self.target_length - self.offset)
+                self._block = self.file_obj.read(chunk_size) if chunk_size > 0 else ''
+            # An empty file still needs an upload_id to commit, so it is sent as one empty chunk.
+            if not self._block and self.upload_id is not None:
+                self._block = None
+                return
+
+            try:
+                reply = self.client.chunked_upload(self._block, self.upload_id, self.offset)
+            except (ErrorResponse, RESTSocketError), e:
+                failures += 1
+                if failures > max_retries:
+                    raise
+                server_offset = self._server_offset(e)
+                if server_offset is not None:
+                    self._seek(server_offset)
+                elif isinstance(e, ErrorResponse) and e.status < 500:
+                    raise
+                else:
+                    # Full jitter, so uploaders that failed together don't retry in lockstep.
+                    time.sleep(random.uniform(0, min(2 ** failures, 30)))
+                continue
+
+            failures = 0
+            self._seek(reply['offset'])
+            self.upload_id = reply['upload_id']
+            if self.checkpoint:
+                self.checkpoint(self.upload_id, self.offset)
+
+    def finish(self, path, overwrite=False, parent_rev=None):
+        """Commit the uploaded chunks to a file at path.
+
+        Args and return value are the same as for DropboxClient.commit_chunked_upload().
+        """
+        return self.client.commit_chunked_upload(path, self.upload_id, overwrite, parent_rev)
+
+    def _server_offset(self, e):
+        """Return the offset from an offset-mismatch error, None for any other error."""
+        if not isinstance(e, ErrorResponse) or e.status != 400:
+            return None
+        try:
+            reply = json.loads(e.body)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(reply, dict) or 'offset' not in reply:
+            return None
+        if self.upload_id is not None and reply.get('upload_id', self.upload_id) != self.upload_id:
+            return None
+        return reply['offset']
+
+    def _seek(self, offset):
+        """Make offset the server's confirmed offset and position the file after it."""
+        block = self._block
+        if block is not None and self.offset <= offset <= self.offset + len(block):
+            block = block[offset - self.offset:]
+            self._block = block or None
+        elif self._base is not None:
+            self.file_obj.seek(self._base + offset)
+            self._block = None
+        else:
+            consumed = self.offset + len(block or '')
+            if offset < consumed:
+                raise ValueError("can't rewind file_obj to offset %d" % offset)
+            while consumed < offset:
+                data = self.file_obj.read(min(offset - consumed, 64 * 1024))
+                if not data:
+                    raise ValueError('file_obj ended before offset %d' % offset)
+                consumed += len(data)
+            self._block = None
+        self.offset = offset
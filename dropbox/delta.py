@@ -0,0 +1,128 @@
+"""
+Incremental change feeds on top of DropboxClient.delta().
+
+A DeltaFeed follows delta() pages until has_more is False and yields the
+changed entries one by one. The cursor is saved to a CursorStore after each
+page has been consumed, so the next sync cycle only fetches what changed
+since then:
+
+    feed = DeltaFeed(client, FileCursorStore('/var/lib/myapp/dropbox.cursor'),
+                     on_reset=local_state.clear)
+    for path, metadata in feed:
+        if metadata is None:
+            local_state.delete_tree(path)
+        else:
+            local_state.update(path, metadata)
+
+Entries are delivered at least once: if the loop stops in the middle of a
+page, that page is fetched again next time.
+"""
+
+import os
+import tempfile
+
+
+class CursorStore(object):
+    """Where a DeltaFeed keeps its cursor. Subclasses implement load() and save()."""
+
+    def load(self):
+        """Return the saved cursor, or None if there is none yet."""
+        raise NotImplementedError
+
+    def save(self, cursor):
+        """Persist cursor, replacing the saved one."""
+        raise NotImplementedError
+
+
+class MemoryCursorStore(CursorStore):
+    """Keeps the cursor in memory, for the lifetime of the process."""
+
+    def __init__(self, cursor=None):
+        self.cursor = cursor
+
+    def load(self):
+        return self.cursor
+
+    def save(self, cursor):
+        self.cursor = cursor
+
+
+class FileCursorStore(CursorStore):
+    """Keeps the cursor in a file.
+
+    The file is replaced atomically (written to a temporary file in the same
+    directory, synced and renamed), so a crash never leaves a partial cursor.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            f = open(self.path, 'rb')
+        except IOError:
+            return None
+        try:
+            return f.read().strip() or None
+        finally:
+            f.close()
+
+    def save(self, cursor):
+        if isinstance(cursor, unicode):
+            cursor = cursor.encode('utf-8')
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cursor-')
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(cursor)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                f.close()
+            if os.name == 'nt' and os.path.exists(self.path):
+                os.remove(self.path)  # rename doesn't replace on Windows
+            os.rename(tmp_path, self.path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class DeltaFeed(object):
+    """
+    Iterates over the changes reported by DropboxClient.delta(), yielding
+    (path, metadata) pairs; metadata is None for deleted paths.
+    """
+
+    def __init__(self, client, store=None, on_reset=None):
+        """Initialize a DeltaFeed.
+
+        Args:
+            client: The DropboxClient to call delta() on.
+            store: The CursorStore to load the cursor from and save it to. [optional]
+                Defaults to a MemoryCursorStore, i.e. the first iteration starts
+                from scratch.
+            on_reset: A callable invoked without arguments when the server asks
+                to clear the local state, before that page's entries are yielded. [optional]
+        """
+        self.client = client
+        self.store = store if store is not None else MemoryCursorStore()
+        self.on_reset = on_reset
+
+    def __iter__(self):
+        return self.changes()
+
+    def changes(self):
+        """Yield the changes since the saved cursor, following has_more pages lazily."""
+        cursor = self.store.load()
+        while True:
+            page = self.client.delta(cursor)
+            if page.get('reset') and self.on_reset:
+                self.on_reset()
+            for path, metadata in page['entries']:
+                yield path, metadata
+            cursor = page['cursor']
+            self.store.save(cursor)
+            if not page.get('has_more'):
+                return
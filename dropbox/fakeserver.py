@@ -0,0 +1,994 @@
+"""
+A stand-in for the Dropbox API that runs in-process, for load tests and
+benchmarks that shouldn't depend on the network or the real service.
+
+A FakeDropboxServer serves the API and content hosts (and the /oauth calls
+of the web host) on one local port, over plain HTTP with keep-alive.
+configure() points a DropboxSession at it:
+
+    server = FakeDropboxServer(latency=0.02, bandwidth=10 * 1024 * 1024).start()
+    session = DropboxSession('key', 'secret', 'dropbox')
+    session.set_token('token', 'secret')
+    server.configure(session)
+    client = DropboxClient(session)
+    client.put_file('/hello.txt', 'Hello, world!')
+    ...
+    server.stop()
+
+Implemented calls: /account/info, /metadata, /files, /files_put,
+/chunked_upload, /commit_chunked_upload, /fileops/copy, /fileops/move,
+/fileops/delete, /fileops/create_folder, /search, /revisions, /thumbnails,
+/oauth/request_token, /oauth/authorize and /oauth/access_token. Files are
+kept in a FakeStore, in memory or in a directory. Requests must carry an
+OAuth token, but signatures aren't checked.
+
+Faults can be injected, and changed while the server is running:
+
+    latency        seconds added to every request, or a (min, max) range
+    bandwidth      bytes per second for all request and response bodies together
+    error_rate     fraction of requests answered 500
+    throttle_rate  fraction of requests answered 503 with a Retry-After header
+    max_rps        requests per second above which requests are answered 503
+
+The server can also be run on its own, e.g. for clients in other processes:
+
+    python -m dropbox.fakeserver --port 8080 --latency 0.05
+"""
+
+import BaseHTTPServer
+import cgi
+import hashlib
+try:
+    import json
+except ImportError:
+    import simplejson as json
+import os
+import random
+import socket
+import SocketServer
+import threading
+import time
+import urllib
+import urlparse
+
+from dropbox.ratelimit import TokenBucket
+
+IMAGE_EXTENSIONS = frozenset(['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff'])
+
+THUMBNAIL_SIZES = {'xs': 1024, 'small': 1536, 's': 3072, 'medium': 4096, 'm': 8192,
+                   'large': 12288, 'l': 24576, 'xl': 49152}
+
+_MIME_TYPES = {'.txt': 'text/plain', '.html': 'text/html', '.pdf': 'application/pdf',
+               '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png',
+               '.gif': 'image/gif', '.bmp': 'image/bmp', '.tif': 'image/tiff',
+               '.tiff': 'image/tiff', '.mp3': 'audio/mpeg', '.mp4': 'video/mp4',
+               '.zip': 'application/zip', '.json': 'application/json'}
+
+
+class FakeError(Exception):
+    """An error response of the fake API, with the same JSON body as the real one."""
+
+    def __init__(self, status, error, headers=None):
+        Exception.__init__(self, error)
+        self.status = status
+        self.error = error
+        self.headers = headers or {}
+
+
+class _Entry(object):
+    """A file or folder in a FakeStore. Files keep all their revisions, newest last."""
+
+    __slots__ = ('path', 'is_dir', 'deleted', 'revisions', 'children')
+
+    def __init__(self, path, is_dir):
+        self.path = path
+        self.is_dir = is_dir
+        self.deleted = False
+        self.revisions = []
+        self.children = set() if is_dir else None
+
+
+class FakeStore(object):
+    """
+    The files and folders of a FakeDropboxServer, for both roots ('dropbox'
+    and 'sandbox'). It is safe to share between threads.
+
+    Paths are compared case-insensitively and keep the case they were
+    created with. Deleted entries are kept, marked is_deleted.
+    """
+
+    def __init__(self, directory=None):
+        """Initialize a FakeStore.
+
+        Args:
+            directory: A directory to keep file contents in, one file per revision. [optional]
+                By default, contents are kept in memory.
+        """
+        self.directory = directory
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._blobs = {}
+        self._revision = 0
+        self._uploads = {}
+        for root in ('dropbox', 'sandbox'):
+            self._entries[(root, '')] = self._new_folder('/')
+
+    # Reading
+
+    def metadata(self, root, path, list=True, file_limit=10000, hash=None, rev=None,
+                 include_deleted=False):
+        """Return the metadata of path, with the listing of a folder's contents if list is set.
+
+        Raises:
+            FakeError: 404 if nothing is at path, 304 if hash matches the
+                folder's hash, 406 for folders with more than file_limit entries.
+        """
+        self._lock.acquire()
+        try:
+            entry = self._get(root, path)
+            if rev is not None and not entry.is_dir:
+                for revision in entry.revisions:
+                    if revision['rev'] == rev:
+                        return self._metadata(root, entry, revision)
+                raise FakeError(404, 'Unable to find revision %s of %s' % (rev, entry.path))
+            if not entry.is_dir or not list:
+                return self._metadata(root, entry)
+
+            children = [self._entries[(root, key)] for key in entry.children]
+            if not include_deleted:
+                children = [child for child in children if not child.deleted]
+            if len(children) > file_limit:
+                raise FakeError(406, 'Too many file entries to return')
+            folder_hash = self._hash(children)
+            if hash == folder_hash:
+                raise FakeError(304, 'Not modified')
+            result = self._metadata(root, entry)
+            result['hash'] = folder_hash
+            result['contents'] = [self._metadata(root, child)
+                                  for child in sorted(children, key=lambda child: child.path.lower())]
+            return result
+        finally:
+            self._lock.release()
+
+    def read(self, root, path, rev=None):
+        """Return (metadata, contents) of a file, or of one of its revisions."""
+        self._lock.acquire()
+        try:
+            entry = self._get(root, path)
+            if entry.is_dir or entry.deleted and rev is None:
+                raise FakeError(404, 'File not found')
+            revision = entry.revisions[-1]
+            if rev is not None:
+                matches = [r for r in entry.revisions if r['rev'] == rev]
+                if not matches:
+                    raise FakeError(404, 'Unable to find revision %s of %s' % (rev, entry.path))
+                revision = matches[0]
+            metadata = self._metadata(root, entry, revision)
+            blob = revision['blob']
+        finally:
+            self._lock.release()
+        return metadata, self._read_blob(blob)
+
+    def search(self, root, path, query, file_limit=1000, include_deleted=False):
+        """Return the metadata of entries below path whose names contain every word of query."""
+        words = query.lower().split()
+        if not words or len(query) < 3:
+            raise FakeError(400, 'Search string must be at least three characters')
+        self._lock.acquire()
+        try:
+            folder = self._get(root, path)
+            if not folder.is_dir:
+                raise FakeError(400, 'Search path is not a folder')
+            prefix = _key(path) + '/'
+            results = []
+            for (entry_root, key), entry in self._entries.iteritems():
+                if entry_root != root or not key.startswith(prefix):
+                    continue
+                if entry.deleted and not include_deleted:
+                    continue
+                name = key.rsplit('/', 1)[1]
+                if all(word in name for word in words):
+                    results.append(entry)
+            results.sort(key=lambda entry: entry.path.lower())
+            return [self._metadata(root, entry) for entry in results[:min(file_limit, 1000)]]
+        finally:
+            self._lock.release()
+
+    def revisions(self, root, path, rev_limit=1000):
+        """Return the metadata of a file's revisions, newest first."""
+        self._lock.acquire()
+        try:
+            entry = self._get(root, path)
+            if entry.is_dir:
+                raise FakeError(404, 'Revisions are not available for folders')
+            return [self._metadata(root, entry, revision)
+                    for revision in reversed(entry.revisions[-min(rev_limit, 1000):])]
+        finally:
+            self._lock.release()
+
+    # Writing
+
+    def write(self, root, path, contents, overwrite=False, parent_rev=None):
+        """Store contents as a new file or a new revision of one, returning its metadata.
+
+        Like the real server, a write that would clobber a file it isn't
+        allowed to (overwrite is false and no matching parent_rev) goes to a
+        new name like 'name (1).txt' instead.
+        """
+        self._lock.acquire()
+        try:
+            key = _key(path)
+            existing = self._entries.get((root, key))
+            if existing is not None and existing.is_dir and not existing.deleted:
+                raise FakeError(400, 'A folder already exists at %s' % existing.path)
+            if existing is not None and not existing.deleted:
+                current = existing.revisions[-1]['rev']
+                if parent_rev != current and (parent_rev is not None or not overwrite):
+                    path = self._unique_path(root, path)
+                    existing = None
+            entry = self._ensure(root, path, is_dir=False)
+            if entry.deleted:
+                entry.path = _display(path)
+                entry.deleted = False
+            revision = self._revise(entry)
+            revision['bytes'] = len(contents)
+            revision['blob'] = revision['rev']
+            self._write_blob(revision['blob'], contents)
+            return self._metadata(root, entry)
+        finally:
+            self._lock.release()
+
+    def create_folder(self, root, path):
+        self._lock.acquire()
+        try:
+            existing = self._entries.get((root, _key(path)))
+            if existing is not None and not existing.deleted:
+                raise FakeError(403, 'A file or folder already exists at %s' % existing.path)
+            entry = self._ensure(root, path, is_dir=True)
+            entry.deleted = False
+            self._revise(entry)
+            return self._metadata(root, entry)
+        finally:
+            self._lock.release()
+
+    def delete(self, root, path):
+        self._lock.acquire()
+        try:
+            entry = self._get(root, path)
+            if entry.deleted:
+                raise FakeError(404, 'Path %s not found' % entry.path)
+            self._mark_deleted(root, _key(path))
+            return self._metadata(root, entry)
+        finally:
+            self._lock.release()
+
+    def copy(self, root, from_path, to_path):
+        return self._transfer(root, from_path, to_path, move=False)
+
+    def move(self, root, from_path, to_path):
+        return self._transfer(root, from_path, to_path, move=True)
+
+    # Chunked uploads
+
+    def append_chunk(self, upload_id, offset, data):
+        """Add data to an upload at offset, starting a new upload if upload_id is None.
+
+        Returns:
+            A dictionary with upload_id, the new offset and an expiry date.
+
+        Raises:
+            FakeError: 400 with the expected offset if offset doesn't match it,
+                404 for an unknown upload_id.
+        """
+        self._lock.acquire()
+        try:
+            if upload_id is None:
+                upload_id = hashlib.md5('%s-%s' % (time.time(), random.random())).hexdigest()[:22]
+                self._uploads[upload_id] = []
+                offset = 0
+            chunks = self._uploads.get(upload_id)
+            if chunks is None:
+                raise FakeError(404, 'The upload_id does not exist or has expired')
+            length = sum(len(chunk) for chunk in chunks)
+            if offset != length:
+                raise FakeError(400, {'upload_id': upload_id, 'offset': length})
+            chunks.append(data)
+            return {'upload_id': upload_id, 'offset': length + len(data),
+                    'expires': _format_date(time.time() + 86400)}
+        finally:
+            self._lock.release()
+
+    def commit_upload(self, root, path, upload_id, overwrite=False, parent_rev=None):
+        self._lock.acquire()
+        try:
+            chunks = self._uploads.pop(upload_id, None)
+            if chunks is None:
+                raise FakeError(400, 'The upload_id does not exist or has expired')
+            return self.write(root, path, ''.join(chunks), overwrite, parent_rev)
+        finally:
+            self._lock.release()
+
+    # Internals; callers hold the lock.
+
+    def _get(self, root, path):
+        entry = self._entries.get((root, _key(path)))
+        if entry is None:
+            raise FakeError(404, 'Path %s not found' % _display(path))
+        return entry
+
+    def _new_folder(self, path):
+        entry = _Entry(path, True)
+        self._revise(entry)
+        return entry
+
+    def _ensure(self, root, path, is_dir):
+        """Return the entry at path, creating it and any missing parent folders."""
+        key = _key(path)
+        entry = self._entries.get((root, key))
+        if not key:
+            return entry
+        # The parents come first: an entry that is still there may be inside a deleted folder.
+        parent_key = key.rsplit('/', 1)[0]
+        parent_path = _display(path).rsplit('/', 1)[0]
+        parent = self._entries.get((root, parent_key))
+        if parent is None or parent.deleted or not parent.is_dir:
+            if parent is not None and not parent.is_dir and not parent.deleted:
+                raise FakeError(400, 'Parent %s is a file' % parent.path)
+            parent = self._ensure(root, parent_path, is_dir=True)
+            if parent.deleted:
+                parent.deleted = False
+                self._revise(parent)
+        if entry is not None and entry.is_dir == is_dir:
+            return entry
+        if entry is not None:
+            self._discard(root, key)
+        entry = _Entry(_display(path), is_dir)
+        if is_dir:
+            self._revise(entry)
+        self._entries[(root, key)] = entry
+        parent.children.add(key)
+        return entry
+
+    def _mark_deleted(self, root, key):
+        for descendant in self._subtree(root, key):
+            entry = self._entries[(root, descendant)]
+            if not entry.deleted:
+                entry.deleted = True
+                self._revise(entry, copy_last=True)
+
+    def _discard(self, root, key):
+        """Remove the entries at and below key altogether."""
+        for descendant in self._subtree(root, key):
+            self._entries.pop((root, descendant), None)
+        parent = self._entries.get((root, key.rsplit('/', 1)[0]))
+        if parent is not None:
+            parent.children.discard(key)
+
+    def _subtree(self, root, key):
+        """Return the keys of the entry at key and of all its descendants."""
+        keys = [key]
+        for key in keys:
+            entry = self._entries.get((root, key))
+            if entry is not None and entry.is_dir:
+                keys.extend(entry.children)
+        return keys
+
+    def _transfer(self, root, from_path, to_path, move):
+        self._lock.acquire()
+        try:
+            source = self._get(root, from_path)
+            if source.deleted:
+                raise FakeError(404, 'Path %s not found' % source.path)
+            from_key, to_key = _key(from_path), _key(to_path)
+            if to_key == from_key or to_key.startswith(from_key + '/'):
+                raise FakeError(403, 'Cannot %s a folder into itself' % ('move' if move else 'copy'))
+            target = self._entries.get((root, to_key))
+            if target is not None and not target.deleted:
+                raise FakeError(403, 'A file or folder already exists at %s' % target.path)
+            to_display = _display(to_path)
+            for key in self._subtree(root, from_key):
+                entry = self._entries[(root, key)]
+                if entry.deleted:
+                    continue
+                new = self._ensure(root, to_display + entry.path[len(source.path):], entry.is_dir)
+                new.deleted = False
+                if entry.is_dir:
+                    self._revise(new)
+                else:
+                    revision = self._revise(new)
+                    revision['bytes'] = entry.revisions[-1]['bytes']
+                    revision['blob'] = entry.revisions[-1]['blob']
+            if move:
+                self._mark_deleted(root, from_key)
+            return self._metadata(root, self._entries[(root, to_key)])
+        finally:
+            self._lock.release()
+
+    def _revise(self, entry, copy_last=False):
+        """Give entry a new rev and return the revision's dictionary."""
+        self._revision += 1
+        revision = {'rev': '%x%08x' % (self._revision, id(self) & 0xffffffff),
+                    'revision': self._revision,
+                    'modified': time.time(),
+                    'bytes': 0,
+                    'blob': None}
+        if copy_last and entry.revisions:
+            revision['bytes'] = entry.revisions[-1]['bytes']
+            revision['blob'] = entry.revisions[-1]['blob']
+        if entry.is_dir:
+            entry.revisions = [revision]
+        else:
+            entry.revisions.append(revision)
+        return revision
+
+    def _unique_path(self, root, path):
+        base, ext = os.path.splitext(_display(path))
+        n = 1
+        while True:
+            candidate = '%s (%d)%s' % (base, n, ext)
+            existing = self._entries.get((root, _key(candidate)))
+            if existing is None or existing.deleted:
+                return candidate
+            n += 1
+
+    def _hash(self, children):
+        digest = hashlib.md5()
+        for child in sorted(children, key=lambda child: child.path.lower()):
+            digest.update('%s:%s:%d\n' % (child.path.encode('utf-8'), child.revisions[-1]['rev'],
+                                           child.deleted))
+        return digest.hexdigest()
+
+    def _metadata(self, root, entry, revision=None):
+        revision = revision or entry.revisions[-1]
+        ext = os.path.splitext(entry.path)[1].lower()
+        metadata = {'path': entry.path,
+                    'is_dir': entry.is_dir,
+                    'rev': revision['rev'],
+                    'revision': revision['revision'],
+                    'modified': _format_date(revision['modified']),
+                    'root': 'app_folder' if root == 'sandbox' else 'dropbox',
+                    'bytes': revision['bytes'],
+                    'size': _human_size(revision['bytes']),
+                    'thumb_exists': not entry.is_dir and ext in IMAGE_EXTENSIONS,
+                    }
+        if entry.is_dir:
+            metadata['icon'] = 'folder'
+        else:
+            metadata['icon'] = 'page_white_picture' if ext in IMAGE_EXTENSIONS else 'page_white'
+            metadata['mime_type'] = _MIME_TYPES.get(ext, 'application/octet-stream')
+            metadata['client_mtime'] = metadata['modified']
+        if entry.deleted:
+            metadata['is_deleted'] = True
+        return metadata
+
+    def _write_blob(self, name, contents):
+        if self.directory is None:
+            self._blobs[name] = contents
+            return
+        f = open(os.path.join(self.directory, name), 'wb')
+        try:
+            f.write(contents)
+        finally:
+            f.close()
+
+    def _read_blob(self, name):
+        if self.directory is None:
+            return self._blobs[name]
+        f = open(os.path.join(self.directory, name), 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+
+def _display(path):
+    """Normalize a path like dropbox.client.format_path(), but keep '/' for the root."""
+    if isinstance(path, str):
+        path = path.decode('utf-8')
+    parts = [part for part in path.split('/') if part]
+    return '/' + '/'.join(parts)
+
+
+def _key(path):
+    key = _display(path).lower()
+    return '' if key == '/' else key
+
+
+def _format_date(timestamp):
+    return time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.gmtime(timestamp))
+
+
+def _human_size(n):
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            if unit == 'bytes':
+                return '%d bytes' % n
+            return '%.1f %s' % (n, unit)
+        n /= 1024.0
+
+
+def thumbnail_data(metadata, size, format):
+    """Return the (fake) thumbnail the server sends for a file: a few bytes
+    that look like an image of the given format, derived from the file's rev
+    and the size, with the length THUMBNAIL_SIZES gives for size."""
+    length = THUMBNAIL_SIZES.get(size, THUMBNAIL_SIZES['large'])
+    seed = hashlib.sha1('%s:%s:%s' % (metadata['rev'], size, format)).digest()
+    if format.upper() == 'PNG':
+        head, tail = '\x89PNG\r\n\x1a\n', 'IEND\xaeB`\x82'
+    else:
+        head, tail = '\xff\xd8\xff\xe0', '\xff\xd9'
+    body = seed * ((length - len(head) - len(tail)) // len(seed) + 1)
+    return head + body[:length - len(head) - len(tail)] + tail
+
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Keeps track of the open connections, so stopping closes kept-alive ones too."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class):
+        BaseHTTPServer.HTTPServer.__init__(self, server_address, handler_class)
+        self.stopping = False
+        self._connections = set()
+        self._connections_lock = threading.Condition()
+
+    def process_request(self, request, client_address):
+        self._connections_lock.acquire()
+        try:
+            self._connections.add(request)
+        finally:
+            self._connections_lock.release()
+        SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+    def close_request(self, request):
+        self._connections_lock.acquire()
+        try:
+            self._connections.discard(request)
+            self._connections_lock.notifyAll()
+        finally:
+            self._connections_lock.release()
+        BaseHTTPServer.HTTPServer.close_request(self, request)
+
+    def close_connections(self, timeout=5):
+        """Shut down every open connection and wait up to timeout seconds for
+        their handler threads to finish."""
+        self.stopping = True
+        deadline = time.time() + timeout
+        self._connections_lock.acquire()
+        try:
+            for connection in self._connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+            while self._connections and time.time() < deadline:
+                self._connections_lock.wait(deadline - time.time())
+        finally:
+            self._connections_lock.release()
+
+    def handle_error(self, request, client_address):
+        if not self.stopping:
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+
+class FakeDropboxServer(object):
+    """
+    Serves a FakeStore through the Dropbox REST API on a local port.
+
+    Attributes (counters):
+        requests: Requests received.
+        errors: Requests answered with an injected 500.
+        throttled: Requests answered with an injected 503.
+        bytes_in: Request body bytes received.
+        bytes_out: Response body bytes sent.
+    """
+
+    def __init__(self, store=None, host='127.0.0.1', port=0, latency=0, bandwidth=None,
+                 error_rate=0, throttle_rate=0, max_rps=None, retry_after=1, seed=None):
+        """Initialize a FakeDropboxServer.
+
+        Args:
+            store: The FakeStore to serve. [default: a new in-memory FakeStore]
+            host: The address to listen on. [default '127.0.0.1']
+            port: The port to listen on. [default: any free port]
+            latency: Seconds to wait before answering each request, or a
+                (min, max) tuple to wait a random time in between. [default 0]
+            bandwidth: The maximum number of body bytes per second, sent and
+                received, summed over all connections. [optional]
+            error_rate: The fraction of requests answered with a 500. [default 0]
+            throttle_rate: The fraction of requests answered with a 503. [default 0]
+            max_rps: The maximum number of requests per second; requests
+                beyond it are answered with a 503. [optional]
+            retry_after: The Retry-After header sent with 503s, in seconds. [default 1]
+            seed: A seed for the random numbers deciding which requests fail. [optional]
+        """
+        self.store = store or FakeStore()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_rps = max_rps
+        self.retry_after = retry_after
+        self.auto_authorize = True
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._tokens = {}
+        self._thread = None
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+        self._httpd = _HTTPServer((host, port), _Handler)
+        self._httpd.app = self
+        self.address = self._httpd.server_address
+
+    @property
+    def host(self):
+        """The 'host:port' to use as DropboxSession.API_HOST and API_CONTENT_HOST."""
+        return '%s:%d' % self.address
+
+    def start(self):
+        """Start serving in a background thread; returns the server."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever)
+            self._thread.setDaemon(True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving, close the listening socket and every open connection."""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+        self._httpd.close_connections()
+
+    def serve_forever(self):
+        """Serve in the calling thread until interrupted."""
+        self._httpd.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def configure(self, session):
+        """Point a DropboxSession (or, given the class, all of them) at this server."""
+        session.API_SCHEME = 'http'
+        session.API_HOST = session.API_CONTENT_HOST = session.WEB_HOST = self.host
+
+    def stats(self):
+        """Return a dictionary with the server's counters."""
+        self._lock.acquire()
+        try:
+            return {'requests': self.requests,
+                    'errors': self.errors,
+                    'throttled': self.throttled,
+                    'bytes_in': self.bytes_in,
+                    'bytes_out': self.bytes_out,
+                    }
+        finally:
+            self._lock.release()
+
+    def _count(self, name, n=1):
+        self._lock.acquire()
+        try:
+            setattr(self, name, getattr(self, name) + n)
+        finally:
+            self._lock.release()
+
+    def _bucket(self, name, rate):
+        """Return the TokenBucket for rate, replacing it when the rate was changed."""
+        self._lock.acquire()
+        try:
+            bucket = self._buckets.get(name)
+            if bucket is None or bucket.rate != rate:
+                bucket = self._buckets[name] = TokenBucket(rate)
+            return bucket
+        finally:
+            self._lock.release()
+
+    def _throttle_bytes(self, n):
+        if self.bandwidth:
+            self._bucket('bandwidth', float(self.bandwidth)).consume(n)
+
+    def _inject(self):
+        """Sleep for the configured latency and raise a FakeError for an injected failure."""
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            latency = self._random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+        retry_after = {'Retry-After': str(self.retry_after)}
+        if self.max_rps and not self._bucket('rps', float(self.max_rps)).try_consume():
+            self._count('throttled')
+            raise FakeError(503, 'Too many requests (injected)', retry_after)
+        roll = self._random.random()
+        if roll < self.throttle_rate:
+            self._count('throttled')
+            raise FakeError(503, 'Service unavailable (injected)', retry_after)
+        if roll < self.throttle_rate + self.error_rate:
+            self._count('errors')
+            raise FakeError(500, 'Internal server error (injected)')
+
+    def _issue_token(self, authorized):
+        key = hashlib.sha1('key-%s' % self._random.random()).hexdigest()[:15]
+        secret = hashlib.sha1('secret-%s' % self._random.random()).hexdigest()[:15]
+        self._lock.acquire()
+        try:
+            self._tokens[key] = authorized
+        finally:
+            self._lock.release()
+        return 'oauth_token_secret=%s&oauth_token=%s' % (secret, key)
+
+    def _authorize(self, token):
+        self._lock.acquire()
+        try:
+            self._tokens[token] = True
+        finally:
+            self._lock.release()
+
+    def _is_authorized(self, token):
+        self._lock.acquire()
+        try:
+            return self._tokens.get(token, False)
+        finally:
+            self._lock.release()
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Dispatches the requests of one connection to the FakeDropboxServer's store."""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeDropbox/1.0'
+    timeout = 60
+    # Send each response in as few packets as possible; small unbuffered
+    # writes stall on Nagle's algorithm and delayed ACKs.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    @property
+    def server_app(self):
+        return self.server.app
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_PUT(self):
+        self._handle()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        app = self.server_app
+        app._count('requests')
+        body = self._read_body()
+        path, query = urlparse.urlsplit(self.path)[2:4]
+        params = dict(cgi.parse_qsl(query, keep_blank_values=True))
+        if self.command == 'POST' and body and 'urlencoded' in self.headers.get('Content-Type', ''):
+            params.update(cgi.parse_qsl(body, keep_blank_values=True))
+            body = ''
+        try:
+            app._inject()
+            parts = urllib.unquote(path).decode('utf-8').split('/', 3)
+            if len(parts) < 3 or parts[1] != '1':
+                raise FakeError(404, 'Unknown API version or endpoint')
+            endpoint, rest = parts[2], parts[3] if len(parts) > 3 else ''
+            if endpoint == 'oauth':
+                return self._oauth(rest, params)
+            if not self._has_token(params):
+                raise FakeError(401, 'Missing OAuth token')
+            handler = getattr(self, '_call_' + endpoint, None)
+            if handler is None:
+                raise FakeError(404, 'Unknown endpoint /%s' % endpoint)
+            return handler(rest, params, body)
+        except FakeError, e:
+            body = e.error if isinstance(e.error, dict) else {'error': e.error}
+            self._send(e.status, '' if e.status == 304 else json.dumps(body), e.headers)
+        except Exception, e:
+            self._send(500, json.dumps({'error': 'Internal server error: %s' % e}))
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(';', 1)[0], 16)
+                if not size:
+                    while self.rfile.readline() not in ('\r\n', '\n', ''):
+                        pass
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = ''.join(chunks)
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server_app._count('bytes_in', len(body))
+        self.server_app._throttle_bytes(len(body))
+        return body
+
+    def _send(self, status, body, headers=None, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in (headers or {}).iteritems():
+            self.send_header(header, value)
+        self.end_headers()
+        for offset in xrange(0, len(body), 64 * 1024):
+            block = body[offset:offset + 64 * 1024]
+            self.server_app._throttle_bytes(len(block))
+            self.wfile.write(block)
+        self.server_app._count('bytes_out', len(body))
+
+    def _send_json(self, result):
+        self._send(200, json.dumps(result))
+
+    def _has_token(self, params):
+        return 'oauth_token' in self.headers.get('Authorization', '') or 'oauth_token' in params
+
+    def _root_path(self, rest):
+        root, path = (rest.split('/', 1) + [''])[:2]
+        if root not in ('dropbox', 'sandbox'):
+            raise FakeError(404, 'Unknown root %s' % root)
+        return root, path
+
+    def _params_root(self, params):
+        root = params.get('root')
+        if root not in ('dropbox', 'sandbox'):
+            raise FakeError(400, 'Invalid root parameter')
+        return root
+
+    def _oauth(self, rest, params):
+        app = self.server_app
+        if rest == 'request_token':
+            return self._send(200, app._issue_token(app.auto_authorize), content_type='text/plain')
+        if rest == 'authorize':
+            app._authorize(params.get('oauth_token'))
+            return self._send(200, '<html><body>Authorized</body></html>', content_type='text/html')
+        if rest == 'access_token':
+            token = params.get('oauth_token')
+            if token is None:
+                header = self.headers.get('Authorization', '')
+                token = header.split('oauth_token="', 1)[-1].split('"', 1)[0] if 'oauth_token="' in header else None
+            if not app._is_authorized(token):
+                raise FakeError(401, 'Request token has not been authorized')
+            return self._send(200, app._issue_token(True), content_type='text/plain')
+        raise FakeError(404, 'Unknown endpoint /oauth/%s' % rest)
+
+    def _call_account(self, rest, params, body):
+        if rest != 'info':
+            raise FakeError(404, 'Unknown endpoint /account/%s' % rest)
+        self._send_json({'uid': 12345678, 'display_name': 'Fake User', 'country': 'US',
+                         'referral_link': 'https://www.dropbox.com/referrals/fake',
+                         'quota_info': {'shared': 0, 'quota': 2 ** 40, 'normal': 0}})
+
+    def _call_metadata(self, rest, params, body):
+        root, path = self._root_path(rest)
+        self._send_json(self.server_app.store.metadata(
+            root, path, params.get('list', 'true') != 'false', int(params.get('file_limit', 10000)),
+            params.get('hash'), params.get('rev'), params.get('include_deleted') in ('true', 'True')))
+
+    def _call_files(self, rest, params, body):
+        root, path = self._root_path(rest)
+        metadata, contents = self.server_app.store.read(root, path, params.get('rev'))
+        headers = {'x-dropbox-metadata': json.dumps(metadata), 'Accept-Ranges': 'bytes'}
+        status = 200
+        byte_range = self.headers.get('Range')
+        if byte_range:
+            start, end = _parse_range(byte_range, len(contents))
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, len(contents))
+            contents = contents[start:end + 1]
+            status = 206
+        self._send(status, contents, headers, metadata['mime_type'])
+
+    def _call_files_put(self, rest, params, body):
+        root, path = self._root_path(rest)
+        self._send_json(self.server_app.store.write(root, path, body, params.get('overwrite') in ('true', 'True'),
+                                                    params.get('parent_rev')))
+
+    def _call_chunked_upload(self, rest, params, body):
+        offset = int(params.get('offset', 0))
+        self._send_json(self.server_app.store.append_chunk(params.get('upload_id'), offset, body))
+
+    def _call_commit_chunked_upload(self, rest, params, body):
+        root, path = self._root_path(rest)
+        if 'upload_id' not in params:
+            raise FakeError(400, 'Missing upload_id')
+        self._send_json(self.server_app.store.commit_upload(
+            root, path, params['upload_id'], params.get('overwrite') in ('true', 'True'), params.get('parent_rev')))
+
+    def _call_fileops(self, rest, params, body):
+        store = self.server_app.store
+        root = self._params_root(params)
+        try:
+            if rest == 'copy':
+                result = store.copy(root, params['from_path'], params['to_path'])
+            elif rest == 'move':
+                result = store.move(root, params['from_path'], params['to_path'])
+            elif rest == 'delete':
+                result = store.delete(root, params['path'])
+            elif rest == 'create_folder':
+                result = store.create_folder(root, params['path'])
+            else:
+                raise FakeError(404, 'Unknown endpoint /fileops/%s' % rest)
+        except KeyError, e:
+            raise FakeError(400, 'Missing parameter %s' % e)
+        self._send_json(result)
+
+    def _call_search(self, rest, params, body):
+        root, path = self._root_path(rest)
+        self._send_json(self.server_app.store.search(
+            root, path, params.get('query', '').decode('utf-8'), int(params.get('file_limit', 1000)),
+            params.get('include_deleted') in ('true', 'True')))
+
+    def _call_revisions(self, rest, params, body):
+        root, path = self._root_path(rest)
+        self._send_json(self.server_app.store.revisions(root, path, int(params.get('rev_limit', 1000))))
+
+    def _call_thumbnails(self, rest, params, body):
+        root, path = self._root_path(rest)
+        metadata = self.server_app.store.metadata(root, path, list=False)
+        if metadata['is_dir'] or metadata.get('is_deleted') or not metadata['thumb_exists']:
+            raise FakeError(404, 'No thumbnail available for %s' % metadata['path'])
+        format = params.get('format', 'jpeg').upper()
+        self._send(200, thumbnail_data(metadata, params.get('size', 's'), format),
+                   {'x-dropbox-metadata': json.dumps(metadata)},
+                   'image/png' if format == 'PNG' else 'image/jpeg')
+
+
+def _parse_range(value, length):
+    """Return the (first, last) byte positions a Range header asks for."""
+    try:
+        unit, spec = value.split('=', 1)
+        first, last = spec.split(',')[0].strip().split('-', 1)
+        if unit.strip() != 'bytes' or (not first and not last):
+            raise ValueError(value)
+        if not first:
+            first, last = max(0, length - int(last)), length - 1
+        else:
+            first, last = int(first), min(int(last), length - 1) if last else length - 1
+    except ValueError:
+        raise FakeError(400, 'Invalid Range header')
+    if first >= length or first > last:
+        raise FakeError(416, 'Requested range not satisfiable',
+                        {'Content-Range': 'bytes */%d' % length})
+    return first, last
+
+
+def main():
+    import optparse
+    parser = optparse.OptionParser(usage='%prog [options]', description='Serve a fake Dropbox API.')
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=8080)
+    parser.add_option('--directory', help='keep file contents in this directory')
+    parser.add_option('--latency', type='float', default=0, help='seconds added to every request')
+    parser.add_option('--bandwidth', type='int', help='bytes per second')
+    parser.add_option('--error-rate', type='float', default=0, help='fraction of requests answered 500')
+    parser.add_option('--throttle-rate', type='float', default=0, help='fraction of requests answered 503')
+    parser.add_option('--max-rps', type='float', help='requests per second before answering 503')
+    options, args = parser.parse_args()
+
+    server = FakeDropboxServer(FakeStore(options.directory), options.host, options.port,
+                               options.latency, options.bandwidth, options.error_rate,
+                               options.throttle_rate, options.max_rps)
+    print 'Serving a fake Dropbox API on http://%s' % server.host
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+A local, persistent index of remote metadata.
+
+A DropboxClient with a MetadataIndex records every metadata() result and
+the metadata returned by its write operations (put_file, file_copy,
+file_move, file_delete, file_create_folder, restore, commit_chunked_upload)
+in an SQLite database. path_exists() is then answered locally as long as
+the indexed information is younger than max_age:
+
+    index = MetadataIndex('/var/lib/myapp/dropbox-index.db', max_age=300)
+    client = DropboxClient(session, index=index)
+    client.metadata('/Photos')          # fills the index
+    index.size('/Photos/beach.jpg')     # no network
+
+Paths are normalized with format_path() and compared case-insensitively,
+like on the server.
+"""
+
+import sqlite3
+import threading
+import time
+
+from dropbox.client import format_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    display_path TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    rev TEXT,
+    bytes INTEGER,
+    modified TEXT,
+    hash TEXT,
+    updated REAL NOT NULL,
+    listed REAL
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+"""
+
+_COLUMNS = ('path', 'is_dir', 'rev', 'bytes', 'modified', 'hash', 'updated')
+
+
+def normalize_path(path):
+    """Return the key a path is indexed under: normalized and lowercased.
+
+    Byte strings are decoded as UTF-8 (the encoding quote() sends unicode
+    paths in), so both kinds of path have the same key.
+    """
+    return display_path(path).lower()
+
+
+def display_path(path):
+    """Return path normalized with format_path() as unicode."""
+    path = format_path(path or '')
+    if isinstance(path, str):
+        path = path.decode('utf8')
+    return path
+
+
+def _parent(path):
+    return path.rsplit('/', 1)[0]
+
+
+class MetadataIndex(object):
+    """
+    An SQLite-backed map from remote paths to rev, size, modified time and
+    (for folders) hash. It is safe to share between threads.
+    """
+
+    def __init__(self, filename=':memory:', max_age=None):
+        """Initialize a MetadataIndex.
+
+        Args:
+            filename: The SQLite database file. [default ':memory:']
+            max_age: The default staleness bound in seconds for lookups. [optional]
+                Information older than that is treated as unknown. None means
+                indexed information never goes stale.
+        """
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def update(self, metadata):
+        """Record a metadata dictionary as returned by the API.
+
+        If it is a folder listing, the folder's children are replaced with
+        the listed ones. Deleted entries are removed from the index.
+        """
+        now = time.time()
+        path = normalize_path(metadata['path'])
+        self._lock.acquire()
+        try:
+            if metadata.get('is_deleted'):
+                self._remove(path)
+            else:
+                listed = now if 'contents' in metadata else None
+                self._upsert([self._row(path, metadata, now, listed)])
+
+            if 'contents' in metadata:
+                rows = []
+                for child in metadata['contents']:
+                    child_path = normalize_path(child['path'])
+                    if child.get('is_deleted'):
+                        self._remove(child_path)
+                    else:
+                        rows.append(self._row(child_path, child, now, None))
+                listed_paths = set(row[0] for row in rows)
+                known = self._db.execute('SELECT path FROM entries WHERE parent = ? AND path != ?',
+                                         (path, path)).fetchall()
+                for (child_path,) in known:
+                    if child_path not in listed_paths:
+                        self._remove(child_path)
+                self._upsert(rows)
+            self._db.commit()
+        finally:
+            self._lock.release()
+
+    def remove(self, path):
+        """Forget path and everything below it (e.g. after a delete)."""
+        self._lock.acquire()
+        try:
+            self._remove(normalize_path(path))
+            self._db.commit()
+        finally:
+            self._lock.release()
+
+    def move(self, from_path, to_path, metadata=None):
+        """Move the indexed subtree at from_path to to_path.
+
+        Args:
+            metadata: The metadata returned by the move, recorded for to_path. [optional]
+        """
+        to_display_path = display_path(to_path)
+        from_path, to_path = normalize_path(from_path), normalize_path(to_path)
+        start = len(from_path) + 1
+        self._lock.acquire()
+        try:
+            self._remove(to_path)
+            self._db.execute('UPDATE entries SET path = ? || substr(path, ?), parent = ? || substr(parent, ?), '
+                             'display_path = ? || substr(display_path, ?) WHERE path > ? AND path < ?',
+                             (to_path, start, to_path, start, to_display_path, start,
+                              from_path + '/', from_path + '0'))
+            self._db.execute('DELETE FROM entries WHERE path = ?', (from_path,))
+            self._db.commit()
+        finally:
+            self._lock.release()
+        if metadata is not None:
+            self.update(metadata)
+
+    def apply_delta(self, path, metadata):
+        """Apply one entry of a DropboxClient.delta() page (see dropbox.delta.DeltaFeed)."""
+        if metadata is None:
+            self.remove(path)
+        else:
+            self.update(metadata)
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._db.execute('DELETE FROM entries')
+            self._db.commit()
+        finally:
+            self._lock.release()
+
+    def lookup(self, path, max_age=None):
+        """Return what is indexed about path as a dictionary, or None.
+
+        The dictionary has the keys path, is_dir, rev, bytes, modified, hash
+        and updated (the time it was indexed). None is also returned if the
+        information is older than max_age (defaulting to the index's max_age).
+        """
+        path = normalize_path(path)
+        row = self._query('SELECT display_path, is_dir, rev, bytes, modified, hash, updated '
+                          'FROM entries WHERE path = ?', (path,))
+        if not row or self._is_stale(row[0][-1], max_age):
+            return None
+        return self._as_dict(row[0])
+
+    def exists(self, path, max_age=None):
+        """Tell whether path exists, as far as the index knows.
+
+        Returns:
+            True or False if the index knows, None if it has no fresh information:
+            a path is known not to exist if its parent folder was listed
+            within max_age and the path wasn't in that listing.
+        """
+        path = normalize_path(path)
+        if not path:
+            return True
+        rows = self._query('SELECT path, updated, listed FROM entries WHERE path IN (?, ?)',
+                           (path, _parent(path)))
+        for row_path, updated, listed in rows:
+            if row_path == path and not self._is_stale(updated, max_age):
+                return True
+        for row_path, updated, listed in rows:
+            if row_path == _parent(path) and listed is not None and not self._is_stale(listed, max_age):
+                return False
+        return None
+
+    def size(self, path, max_age=None):
+        """Return the indexed size of path in bytes, or None if unknown or stale."""
+        entry = self.lookup(path, max_age)
+        return entry['bytes'] if entry else None
+
+    def rev(self, path, max_age=None):
+        """Return the indexed rev of path, or None if unknown or stale."""
+        entry = self.lookup(path, max_age)
+        return entry['rev'] if entry else None
+
+    def subtree(self, path, max_age=None):
+        """Return the indexed entries below path (not including path itself), sorted by path."""
+        path = normalize_path(path)
+        rows = self._query('SELECT display_path, is_dir, rev, bytes, modified, hash, updated '
+                           'FROM entries WHERE path > ? AND path < ? ORDER BY path',
+                           (path + '/', path + '0'))
+        return [self._as_dict(row) for row in rows if not self._is_stale(row[-1], max_age)]
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM entries', ())[0][0]
+
+    def _upsert(self, rows):
+        # A folder's hash and listing time describe its last listing; keep them
+        # when the folder is updated from its parent's listing.
+        self._db.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, '
+                             'COALESCE(?, (SELECT hash FROM entries WHERE path = ?)), ?, '
+                             'COALESCE(?, (SELECT listed FROM entries WHERE path = ?)))',
+                             [row[:8] + (row[0], row[8], row[9], row[0]) for row in rows])
+
+    def _remove(self, path):
+        self._db.execute('DELETE FROM entries WHERE path = ? OR (path > ? AND path < ?)',
+                         (path, path + '/', path + '0'))
+
+    def _query(self, sql, args):
+        self._lock.acquire()
+        try:
+            return self._db.execute(sql, args).fetchall()
+        finally:
+            self._lock.release()
+
+    def _is_stale(self, timestamp, max_age):
+        if max_age is None:
+            max_age = self.max_age
+        return max_age is not None and time.time() - timestamp > max_age
+
+    @staticmethod
+    def _row(path, metadata, now, listed):
+        return (path, _parent(path), display_path(metadata['path']), bool(metadata.get('is_dir')),
+                metadata.get('rev'), metadata.get('bytes'), metadata.get('modified'),
+                metadata.get('hash'), now, listed)
+
+    @staticmethod
+    def _as_dict(row):
+        entry = dict(zip(_COLUMNS, row))
+        entry['is_dir'] = bool(entry['is_dir'])
+        return entry
@@ -0,0 +1,248 @@
+"""
+Timing and traffic statistics for REST requests.
+
+    instrumentation = Instrumentation()
+    RESTClient.IMPL.instrumentation = instrumentation
+    ...
+    print instrumentation.prometheus()
+
+Every request sent by a RESTClientObject with an Instrumentation (each
+attempt, when a RetryPolicy retries) is recorded under its endpoint, as
+returned by dropbox.rest.endpoint_name(), with the time spent in each phase:
+
+    sign      building the URL and OAuth parameters (DropboxClient.request)
+    connect   opening a new connection; not recorded when a pooled one is reused
+    ttfb      sending the request until the response headers arrived
+    transfer  reading the response body
+    decode    parsing the JSON response
+"""
+
+import bisect
+import threading
+import time
+
+from dropbox.rest import endpoint_name
+
+PHASES = ('sign', 'connect', 'ttfb', 'transfer', 'decode')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram(object):
+    """Counts observations into buckets with fixed upper bounds, like a Prometheus histogram."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Return a list of (upper bound, number of observations <= it), ending with '+Inf'."""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def as_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'buckets': self.cumulative()}
+
+
+class RequestSample(object):
+    """
+    One request as seen by an Instrumentation. It is passed to the pre
+    request callbacks before the request is sent and to the post request
+    callbacks once the response has been read (for streamed responses: once
+    the RESTResponse has been closed or read completely).
+
+    Attributes:
+        method, url, headers: The request.
+        endpoint: The API endpoint, e.g. '/metadata'.
+        status: The HTTP status, or None if no response was received.
+        error: The exception the request failed with, or None.
+        bytes_out: The number of body bytes sent.
+        bytes_in: The number of body bytes received.
+        timings: A dictionary mapping phases (see PHASES) to seconds.
+    """
+
+    def __init__(self, method, url, headers):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.endpoint = endpoint_name(url)
+        self.status = None
+        self.error = None
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.timings = {}
+        self.started = time.time()
+
+    @property
+    def duration(self):
+        """The total time spent in all phases, in seconds."""
+        return sum(self.timings.itervalues())
+
+
+class _EndpointStats(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.requests = 0
+        self.statuses = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.phases = {}
+
+    def observe(self, phase, seconds):
+        histogram = self.phases.get(phase)
+        if histogram is None:
+            histogram = self.phases[phase] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+
+class Instrumentation(object):
+    """
+    Collects per-endpoint latency histograms, byte counts and status counts
+    for the requests of a RESTClientObject, and calls hooks around each
+    request. It is safe to share between threads.
+
+    Callbacks are called in the requesting thread and should be quick; an
+    exception raised by a callback propagates to the caller of the request.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Initialize an Instrumentation.
+
+        Args:
+            buckets: The upper bounds of the latency histogram buckets, in seconds.
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._pre_request = []
+        self._post_request = []
+
+    def add_pre_request(self, callback):
+        """Call callback with a RequestSample before each request is sent."""
+        self._pre_request.append(callback)
+
+    def add_post_request(self, callback):
+        """Call callback with the finished RequestSample after each request."""
+        self._post_request.append(callback)
+
+    def start(self, method, url, headers):
+        """Return a RequestSample for a request that is about to be sent."""
+        sample = RequestSample(method, url, headers)
+        for callback in self._pre_request:
+            callback(sample)
+        return sample
+
+    def finish(self, sample, error=None):
+        """Record a finished request, successful or not."""
+        if error is not None:
+            sample.error = error
+            if sample.status is None:
+                sample.status = getattr(error, 'status', None)
+        self._lock.acquire()
+        try:
+            stats = self._stats(sample.endpoint)
+            stats.requests += 1
+            status = sample.status if sample.status is not None else 'error'
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.bytes_in += sample.bytes_in
+            stats.bytes_out += sample.bytes_out
+            for phase, seconds in sample.timings.iteritems():
+                stats.observe(phase, seconds)
+        finally:
+            self._lock.release()
+        for callback in self._post_request:
+            callback(sample)
+
+    def observe(self, endpoint, phase, seconds):
+        """Record the time a request to endpoint spent in phase outside of the REST layer."""
+        self._lock.acquire()
+        try:
+            self._stats(endpoint).observe(phase, seconds)
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        """Forget all recorded statistics."""
+        self._lock.acquire()
+        try:
+            self._endpoints.clear()
+        finally:
+            self._lock.release()
+
+    def snapshot(self):
+        """Return the statistics as a dictionary keyed by endpoint.
+
+        Each value is a dictionary with the keys requests, statuses (status ->
+        count, with 'error' for requests that got no response), bytes_in,
+        bytes_out and phases (phase -> Histogram.as_dict()).
+        """
+        self._lock.acquire()
+        try:
+            return dict((endpoint, {'requests': stats.requests,
+                                    'statuses': dict(stats.statuses),
+                                    'bytes_in': stats.bytes_in,
+                                    'bytes_out': stats.bytes_out,
+                                    'phases': dict((phase, histogram.as_dict())
+                                                   for phase, histogram in stats.phases.iteritems()),
+                                    })
+                        for endpoint, stats in self._endpoints.iteritems())
+        finally:
+            self._lock.release()
+
+    def prometheus(self, prefix='dropbox'):
+        """Return the statistics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        endpoints = sorted(snapshot)
+        lines = ['# HELP %s_request_phase_seconds Time spent in each phase of a request.' % prefix,
+                 '# TYPE %s_request_phase_seconds histogram' % prefix]
+        for endpoint in endpoints:
+            phases = snapshot[endpoint]['phases']
+            for phase in sorted(phases, key=_phase_order):
+                labels = 'endpoint="%s",phase="%s"' % (_escape(endpoint), phase)
+                histogram = phases[phase]
+                for bound, count in histogram['buckets']:
+                    lines.append('%s_request_phase_seconds_bucket{%s,le="%s"} %d'
+                                 % (prefix, labels, bound, count))
+                lines.append('%s_request_phase_seconds_sum{%s} %r' % (prefix, labels, histogram['sum']))
+                lines.append('%s_request_phase_seconds_count{%s} %d' % (prefix, labels, histogram['count']))
+
+        lines += ['# HELP %s_requests_total Requests by endpoint and HTTP status.' % prefix,
+                  '# TYPE %s_requests_total counter' % prefix]
+        for endpoint in endpoints:
+            for status, count in sorted(snapshot[endpoint]['statuses'].items()):
+                lines.append('%s_requests_total{endpoint="%s",status="%s"} %d'
+                             % (prefix, _escape(endpoint), status, count))
+
+        lines += ['# HELP %s_request_bytes_total Body bytes sent (out) and received (in).' % prefix,
+                  '# TYPE %s_request_bytes_total counter' % prefix]
+        for endpoint in endpoints:
+            for direction in ('in', 'out'):
+                lines.append('%s_request_bytes_total{endpoint="%s",direction="%s"} %d'
+                             % (prefix, _escape(endpoint), direction, snapshot[endpoint]['bytes_' + direction]))
+        return '\n'.join(lines) + '\n'
+
+    def _stats(self, endpoint):
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = _EndpointStats(self.buckets)
+        return stats
+
+
+def _phase_order(phase):
+    return PHASES.index(phase) if phase in PHASES else len(PHASES)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,188 @@
+"""
+Incremental decoding of large JSON listings.
+
+DropboxClient.metadata(stream=True) and DropboxClient.search(stream=True)
+return a JSONListing instead of the decoded response. It reads the body
+from the socket as it is iterated and yields the entries of the listing one
+at a time, so processing starts with the first entry and only about one
+chunk of the body is held in memory, however long the listing is:
+
+    with client.metadata('/Photos', stream=True) as listing:
+        for entry in listing:
+            print entry['path']
+        print listing.fields['hash']
+
+The other fields of the response are collected in the fields dictionary as
+they are read. Depending on the order the server sends them in, some of
+them only appear once all entries have been iterated.
+"""
+
+import re
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from dropbox.rest import ErrorResponse
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JSONListing(object):
+    """
+    The entries of a JSON response, decoded while the body is read.
+
+    The response is either an object whose items_key member is an array of
+    entries (e.g. a folder's metadata with its contents), or an array of
+    entries (e.g. search results). A JSONListing can only be iterated once.
+    The response is closed when iteration ends; close it explicitly (or use
+    a with block) when stopping early.
+
+    Attributes:
+        fields: The members of the response object other than the entries,
+            as far as they have been read.
+        count: The number of entries yielded so far.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, response, items_key='contents', convert=None, decoder=None):
+        """Initialize a JSONListing.
+
+        Args:
+            response: The dropbox.rest.RESTResponse (or any file-like object with
+                read(amt)) to read the body from.
+            items_key: The member of the response object holding the entries.
+            convert: A callable applied to each decoded entry before it is yielded. [optional]
+            decoder: The json.JSONDecoder (or compatible object with raw_decode)
+                to decode values with. [optional]
+        """
+        self.response = response
+        self.items_key = items_key
+        self.convert = convert
+        self.decoder = decoder or json.JSONDecoder()
+        self.fields = {}
+        self.count = 0
+        self._buffer = ''
+        self._pos = 0
+        self._offset = 0  # of _buffer in the body
+        self._eof = False
+        self._started = False
+
+    def __iter__(self):
+        assert not self._started, "a JSONListing can only be iterated once"
+        self._started = True
+        return self._entries()
+
+    def close(self):
+        close = getattr(self.response, 'close', None)
+        if close is not None:
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _entries(self):
+        try:
+            c = self._skip_whitespace()
+            if c == '[':
+                for entry in self._array():
+                    yield entry
+            elif c == '{':
+                for entry in self._object():
+                    yield entry
+            else:
+                self._error('expected an object or an array')
+            if self._skip_whitespace():
+                self._error('extra data after the response')
+        finally:
+            self.close()
+
+    def _object(self):
+        self._pos += 1
+        if self._skip_whitespace() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, basestring):
+                self._error('expected a member name')
+            self._expect(':')
+            if key == self.items_key and self._skip_whitespace() == '[':
+                for entry in self._array():
+                    yield entry
+            else:
+                self.fields[key] = self._value()
+            c = self._skip_whitespace()
+            if c != ',' and c != '}':
+                self._error("expected ',' or '}'")
+            self._pos += 1
+            if c == '}':
+                return
+
+    def _array(self):
+        self._pos += 1
+        if self._skip_whitespace() == ']':
+            self._pos += 1
+            return
+        convert = self.convert
+        while True:
+            entry = self._value()
+            self.count += 1
+            yield convert(entry) if convert is not None else entry
+            c = self._skip_whitespace()
+            if c != ',' and c != ']':
+                self._error("expected ',' or ']'")
+            self._pos += 1
+            if c == ']':
+                return
+
+    def _value(self):
+        """Decode the value at the current position, reading more of the body as needed."""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if self._eof:
+                    self._error('invalid value')
+            else:
+                # A value running up to the end of the buffer may be cut short (e.g. a number).
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            self._fill()
+
+    def _expect(self, c):
+        if self._skip_whitespace() != c:
+            self._error('expected %r' % c)
+        self._pos += 1
+
+    def _skip_whitespace(self):
+        """Skip whitespace and return the next character ('' at the end of the body)."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                return ''
+            self._fill()
+
+    def _fill(self):
+        data = self.response.read(self.CHUNK_SIZE)
+        if not data:
+            self._eof = True
+            return
+        # Drop what has been decoded already, so only the current value is kept.
+        self._offset += self._pos
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+
+    def _error(self, message):
+        status = getattr(self.response, 'status', 200)
+        headers = getattr(self.response, 'headers', {})
+        raise ErrorResponse(status, headers, 'Invalid JSON at byte %d: %s (%r)'
+                            % (self._offset + self._pos, message, self._buffer[self._pos:self._pos + 40]))
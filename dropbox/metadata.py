@@ -0,0 +1,307 @@
+"""
+Compact objects for metadata returned by the API.
+
+A DropboxClient created with typed_metadata=True returns these from
+metadata(), search() and revisions() instead of the dictionaries decoded
+from JSON:
+
+    client = DropboxClient(session, typed_metadata=True)
+    folder = client.metadata('/Photos')
+    for entry in folder.contents:
+        print entry.path, entry.bytes, entry.modified_time
+
+FileMetadata and FolderMetadata use __slots__ and share repeated strings
+(paths, icons, mime types...), and a MetadataList keeps its entries in
+columns, only creating an entry object when it is accessed. A large
+listing takes several times less memory than the equivalent dictionaries.
+
+All of them still work where a dictionary was expected: entry['path'],
+entry.get('is_dir'), 'hash' in folder, folder['contents'] and so on, with
+the keys the server sent. Use as_dict() to get plain dictionaries back
+(e.g. for json.dumps).
+"""
+
+import array
+import email.utils
+
+# The fields of a metadata entry, by the type they're stored as in a MetadataList.
+STRING_FIELDS = ('path', 'rev', 'size', 'modified', 'client_mtime', 'icon', 'root', 'mime_type')
+INT_FIELDS = ('bytes', 'revision')
+BOOL_FIELDS = ('is_dir', 'is_deleted', 'thumb_exists')
+FIELDS = STRING_FIELDS + INT_FIELDS + BOOL_FIELDS
+
+_FIELD_SET = frozenset(FIELDS)
+_NONE = -1  # stands for a missing value in a MetadataList's int and bool columns
+
+
+def _int_typecode():
+    """Return an array typecode that holds file sizes of 2 GiB and more.
+
+    C longs are 32 bits on Windows and Python 2's array has no 'q', so fall
+    back to doubles there, which are exact up to 2 ** 53.
+    """
+    for typecode in ('l', 'q'):
+        try:
+            if array.array(typecode).itemsize >= 8:
+                return typecode
+        except ValueError:
+            pass
+    return 'd'
+
+_INT_TYPECODE = _int_typecode()
+
+_interned = {}
+MAX_INTERNED = 200000
+
+
+def intern_string(s):
+    """Return a shared copy of s (str or unicode), so equal strings are stored once."""
+    if s is None:
+        return None
+    shared = _interned.get(s)
+    if shared is None:
+        if len(_interned) >= MAX_INTERNED:
+            _interned.clear()
+        shared = _interned[s] = s
+    return shared
+
+
+class Metadata(object):
+    """
+    The metadata of a file or folder, as attributes (None if the server
+    didn't send the field) and as a read-only mapping of the fields the
+    server did send.
+    """
+
+    __slots__ = FIELDS + ('_extra', '_modified_time')
+
+    KEYS = FIELDS
+
+    def __init__(self, fields):
+        """Initialize from a metadata dictionary as decoded from JSON."""
+        for name in STRING_FIELDS:
+            setattr(self, name, intern_string(fields.get(name)))
+        for name in INT_FIELDS + BOOL_FIELDS:
+            setattr(self, name, fields.get(name))
+        extra = None
+        for key in fields:
+            if key not in _FIELD_SET and key not in self.KEYS:
+                if extra is None:
+                    extra = {}
+                extra[key] = fields[key]
+        self._extra = extra
+        self._modified_time = None
+
+    @property
+    def modified_time(self):
+        """The modified field as seconds since the epoch, parsed on first access."""
+        if self._modified_time is None and self.modified is not None:
+            self._modified_time = _parse_time(self.modified)
+        return self._modified_time
+
+    @property
+    def name(self):
+        """The last component of the path."""
+        return self.path.rsplit('/', 1)[-1]
+
+    def as_dict(self):
+        """Return the metadata as a plain dictionary, like the one decoded from JSON."""
+        return dict(self.iteritems())
+
+    # The read-only mapping interface, for code written against dictionaries.
+
+    def __getitem__(self, key):
+        if key in self.KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        if key in self.KEYS:
+            return getattr(self, key) is not None
+        return self._extra is not None and key in self._extra
+
+    has_key = __contains__
+
+    def keys(self):
+        keys = [key for key in self.KEYS if getattr(self, key) is not None]
+        if self._extra is not None:
+            keys.extend(self._extra)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def iteritems(self):
+        for key in self.keys():
+            yield key, self._plain(self[key])
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return [value for key, value in self.iteritems()]
+
+    def __eq__(self, other):
+        if isinstance(other, Metadata):
+            other = other.as_dict()
+        return isinstance(other, dict) and self.as_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.path)
+
+    @staticmethod
+    def _plain(value):
+        if isinstance(value, (Metadata, MetadataList)):
+            return value.as_dict() if isinstance(value, Metadata) else value.as_list()
+        return value
+
+
+class FileMetadata(Metadata):
+    """The metadata of a file (or of a folder inside a listing, or of a revision)."""
+
+    __slots__ = ()
+
+
+class FolderMetadata(Metadata):
+    """The metadata of a folder; a listing also has hash and contents (a MetadataList)."""
+
+    __slots__ = ('hash', 'contents')
+
+    KEYS = FIELDS + ('hash', 'contents')
+
+    def __init__(self, fields):
+        Metadata.__init__(self, fields)
+        self.hash = fields.get('hash')
+        contents = fields.get('contents')
+        if contents is not None and not isinstance(contents, MetadataList):
+            contents = MetadataList(contents)
+        self.contents = contents
+
+
+class MetadataList(object):
+    """
+    A read-only sequence of metadata entries stored column by column. The
+    entry objects are created when they're accessed and not kept.
+    """
+
+    __slots__ = ('_strings', '_ints', '_bools', '_extras', '_folders', '_length')
+
+    def __init__(self, entries=()):
+        """Initialize from a list of metadata dictionaries (or Metadata objects)."""
+        self._strings = dict((name, []) for name in STRING_FIELDS)
+        self._ints = dict((name, array.array(_INT_TYPECODE)) for name in INT_FIELDS)
+        self._bools = dict((name, array.array('b')) for name in BOOL_FIELDS)
+        self._extras = None
+        self._folders = None
+        self._length = 0
+        for entry in entries:
+            self.append(entry)
+
+    def append(self, entry):
+        for name, column in self._strings.iteritems():
+            column.append(intern_string(entry.get(name)))
+        for name, column in self._ints.iteritems():
+            value = entry.get(name)
+            column.append(_NONE if value is None else value)
+        for name, column in self._bools.iteritems():
+            value = entry.get(name)
+            column.append(_NONE if value is None else bool(value))
+
+        extra = None
+        if isinstance(entry, Metadata):
+            extra = entry._extra
+            if isinstance(entry, FolderMetadata) and (entry.hash is not None or entry.contents is not None):
+                extra = dict(extra or {}, hash=entry.hash, contents=entry.contents)
+        else:
+            extra = dict((key, value) for key, value in entry.iteritems() if key not in _FIELD_SET) or None
+        if extra:
+            if self._extras is None:
+                self._extras = {}
+            self._extras[self._length] = extra
+        self._length += 1
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError('MetadataList index out of range')
+        fields = {}
+        for name, column in self._strings.iteritems():
+            if column[i] is not None:
+                fields[name] = column[i]
+        for name, column in self._ints.iteritems():
+            if column[i] != _NONE:
+                fields[name] = int(column[i])
+        for name, column in self._bools.iteritems():
+            if column[i] != _NONE:
+                fields[name] = bool(column[i])
+        if self._extras is not None and i in self._extras:
+            fields.update(self._extras[i])
+        return from_json(fields)
+
+    def __iter__(self):
+        for i in xrange(self._length):
+            yield self[i]
+
+    def as_list(self):
+        """Return the entries as a list of plain dictionaries."""
+        return [entry.as_dict() for entry in self]
+
+    def __eq__(self, other):
+        if isinstance(other, MetadataList):
+            other = other.as_list()
+        return isinstance(other, list) and self.as_list() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<MetadataList of %d entries>' % self._length
+
+
+def from_json(value):
+    """Convert decoded JSON metadata to the typed objects.
+
+    A metadata dictionary becomes a FileMetadata or FolderMetadata, a list of
+    them (e.g. search() or revisions() results) a MetadataList. Anything
+    else is returned unchanged.
+    """
+    if isinstance(value, list):
+        return MetadataList(value)
+    if isinstance(value, dict) and 'path' in value:
+        if value.get('is_dir'):
+            return FolderMetadata(value)
+        return FileMetadata(value)
+    return value
+
+
+def _parse_time(value):
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return email.utils.mktime_tz(parsed)
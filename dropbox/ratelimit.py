@@ -0,0 +1,225 @@
+"""
+Client-side throttling. A TokenBucket caps a rate (bytes or requests per
+second) across all the threads that share it. A RequestLimiter paces the
+requests of a RESTClientObject per host and per OAuth token, so that many
+DropboxClients in one process queue up instead of all running into the
+server's throttling at once:
+
+    RESTClient.IMPL.rate_limiter = RequestLimiter(
+        host_rates={DropboxSession.API_HOST: 40, DropboxSession.API_CONTENT_HOST: 15},
+        token_rate=5)
+"""
+
+import collections
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    A thread-safe token bucket that refills at rate tokens per second and
+    holds at most capacity tokens.
+
+    consume() never refuses a request: callers take what they need and, if
+    the bucket runs into debt, sleep until it has been paid back. That keeps
+    callers roughly in arrival order and lets a single request be larger
+    than the capacity.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """Initialize a TokenBucket.
+
+        Args:
+            rate: Tokens added per second.
+            capacity: The maximum burst size. [default: one second worth of tokens]
+        """
+        assert rate > 0, "rate must be positive"
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, amount=1):
+        """Take amount tokens, sleeping as long as needed to stay within the rate.
+
+        Returns:
+            The number of seconds spent waiting.
+        """
+        self._lock.acquire()
+        try:
+            self._refill()
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        finally:
+            self._lock.release()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def try_consume(self, amount=1):
+        """Take amount tokens if they are available right now.
+
+        Returns:
+            Whether the tokens were taken.
+        """
+        self._lock.acquire()
+        try:
+            self._refill()
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+        finally:
+            self._lock.release()
+
+    def delay(self, amount=1):
+        """Return the number of seconds until amount tokens are available (0 if they are)."""
+        self._lock.acquire()
+        try:
+            self._refill()
+            if self._tokens >= amount:
+                return 0.0
+            return (amount - self._tokens) / self.rate
+        finally:
+            self._lock.release()
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+
+class RequestLimiter(object):
+    """
+    Paces requests with a token bucket per host and, optionally, one per
+    OAuth token (i.e. per linked user).
+
+    Requests that have to wait are queued fairly: each host serves the
+    users with waiting requests round-robin, and each user's requests in
+    arrival order, so one busy user can't starve the others. A user that is
+    held back by its own token_rate doesn't hold up the rest of the queue.
+    """
+
+    def __init__(self, rate=20, host_rates=None, token_rate=None, burst=None):
+        """Initialize a RequestLimiter.
+
+        Args:
+            rate: Requests per second to a host that isn't in host_rates. [default 20]
+            host_rates: A dictionary mapping host names (e.g. DropboxSession.API_HOST)
+                to requests per second. [optional]
+            token_rate: Requests per second for each OAuth token on each host. [optional]
+            burst: The number of requests that may be sent at once after a quiet
+                period. [default: one second worth]
+        """
+        self.rate = rate
+        self.host_rates = dict(host_rates or {})
+        self.token_rate = token_rate
+        self.burst = burst
+        self._cond = threading.Condition(threading.Lock())
+        self._host_buckets = {}
+        self._token_buckets = {}
+        self._queues = {}  # host -> [(token, waiting tickets)] in round-robin order
+        self.requests = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def acquire(self, host, token=None):
+        """Block until a request to host on behalf of token may be sent.
+
+        Returns:
+            The number of seconds spent waiting.
+        """
+        start = time.time()
+        ticket = object()
+        self._cond.acquire()
+        try:
+            queue = self._queues.setdefault(host, [])
+            tickets = self._tickets(queue, token)
+            if tickets is None:
+                tickets = collections.deque()
+                queue.append((token, tickets))
+            tickets.append(ticket)
+            self._cond.notifyAll()  # the arrival may change whose turn it is
+            try:
+                while True:
+                    chosen, timeout = self._select(host, queue)
+                    if chosen == token and tickets[0] is ticket:
+                        break
+                    self._cond.wait(timeout)
+            except:
+                self._dequeue(queue, token, tickets, ticket)
+                self._cond.notifyAll()
+                raise
+
+            self._host_bucket(host).consume()
+            if self.token_rate:
+                self._token_bucket(host, token).consume()
+            self._dequeue(queue, token, tickets, ticket)
+            if not queue:
+                del self._queues[host]
+
+            waited = time.time() - start
+            self.requests += 1
+            if waited > 0.001:
+                self.waits += 1
+                self.wait_time += waited
+            self._cond.notifyAll()
+            return waited
+        finally:
+            self._cond.release()
+
+    def stats(self):
+        """Return a dictionary with the limiter's counters."""
+        self._cond.acquire()
+        try:
+            return {'requests': self.requests,
+                    'waits': self.waits,
+                    'wait_time': self.wait_time,
+                    'queued': sum(len(tickets) for queue in self._queues.values()
+                                  for _, tickets in queue),
+                    }
+        finally:
+            self._cond.release()
+
+    def _select(self, host, queue):
+        """Return the token whose turn it is (or None) and how long to wait otherwise."""
+        host_delay = self._host_bucket(host).delay()
+        if host_delay:
+            return None, host_delay
+        timeout = None
+        for token, _ in queue:
+            if not self.token_rate:
+                return token, None
+            token_delay = self._token_bucket(host, token).delay()
+            if not token_delay:
+                return token, None
+            timeout = token_delay if timeout is None else min(timeout, token_delay)
+        return None, timeout
+
+    @staticmethod
+    def _tickets(queue, token):
+        """Return the waiting tickets of token in a host's queue, or None."""
+        for queued, tickets in queue:
+            if queued == token:
+                return tickets
+        return None
+
+    def _dequeue(self, queue, token, tickets, ticket):
+        tickets.remove(ticket)
+        queue.remove((token, tickets))
+        if tickets:
+            queue.append((token, tickets))  # go to the back of the round-robin
+
+    def _host_bucket(self, host):
+        bucket = self._host_buckets.get(host)
+        if bucket is None:
+            rate = self.host_rates.get(host, self.rate)
+            bucket = self._host_buckets[host] = TokenBucket(rate, self.burst)
+        return bucket
+
+    def _token_bucket(self, host, token):
+        bucket = self._token_buckets.get((host, token))
+        if bucket is None:
+            bucket = self._token_buckets[(host, token)] = TokenBucket(self.token_rate, self.burst)
+        return bucket
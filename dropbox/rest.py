@@ -6,27 +6,339 @@ dropbox.client and dropbox.session modules. You shouldn't need to use this.
 import httplib
 import os
 # import pkg_resources
+import random
 import re
 try:
     import json
 except ImportError:
     import simplejson as json
+import select
 import socket
-# import ssl
+import stat
+import StringIO
+import sys
+import threading
+import time
 import urllib
 import urlparse
 
 SDK_VERSION = "1.3"
 
-class RESTClient(object):
+try:
+    import ssl
+except ImportError:
+    ssl = None  # e.g. Google App Engine; requests go through huTools.http.fetch
+
+_json_loads = json.loads
+
+
+def set_json_backend(backend):
+    """Decode JSON responses with another JSON library, e.g. a faster one.
+
+    Args:
+        backend: The name of a module with a loads() function (e.g. 'ujson' or
+            'simplejson'), such a module, or the decoding function itself. It
+            has to raise ValueError (or a subclass) for invalid input.
+            None goes back to the standard json module.
+
+    Raises:
+        ImportError: The named module isn't installed.
     """
-    An class with all static methods to perform JSON REST requests that is used internally
-    by the Dropbox Client API. It provides just enough gear to make requests
-    and get responses as JSON data (when applicable). All requests happen over SSL.
+    global _json_loads
+    if backend is None:
+        backend = json
+    elif isinstance(backend, basestring):
+        backend = __import__(backend, fromlist=['loads'])
+    _json_loads = getattr(backend, 'loads', backend)
+
+
+class ConnectionPool(object):
     """
+    A thread-safe pool of persistent HTTP/1.1 connections, kept per
+    (scheme, host, port). Connections are checked out for the duration of
+    a single request and handed back once the response has been read
+    completely, so consecutive calls to the same host skip the TCP connect
+    and the TLS handshake.
+
+    HTTPS connections are ProperHTTPSConnection objects, so the server
+    certificate is validated exactly as for a fresh connection.
+    """
+
+    def __init__(self, maxsize=8, idle_timeout=30, timeout=None):
+        """Initialize a ConnectionPool.
+
+        Args:
+            maxsize: The maximum number of idle connections kept per host. [default 8]
+                More connections than that are opened under load, but only
+                maxsize of them are kept around afterwards.
+            idle_timeout: Seconds after which an idle connection is considered
+                stale and is closed instead of reused. [default 30]
+            timeout: A socket timeout in seconds for new connections. [optional]
+        """
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.reconnects = 0
+
+    def get(self, scheme, host, port=None):
+        """Check out a connection to the given host.
+
+        Idle connections are health-checked before they are handed out;
+        connections that timed out or were closed by the server are dropped.
+        """
+        key = (scheme, host, port)
+        dead = []
+        conn = None
+        self._lock.acquire()
+        try:
+            idle = self._idle.get(key)
+            now = time.time()
+            while idle:
+                candidate, last_used = idle.pop()
+                if now - last_used > self.idle_timeout or not _is_connection_alive(candidate):
+                    self.stale += 1
+                    dead.append(candidate)
+                    continue
+                conn = candidate
+                break
+            if conn is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        finally:
+            self._lock.release()
+
+        for candidate in dead:
+            candidate.close()
+
+        if conn is None:
+            conn = self._new_connection(scheme, host, port)
+            conn.pool_key = key
+        return conn
+
+    def put(self, conn):
+        """Return a connection whose last response has been read completely."""
+        if conn.sock is None:
+            return  # the server asked us to close it
+
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault(conn.pool_key, [])
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.time()))
+                return
+        finally:
+            self._lock.release()
+        conn.close()
+
+    def discard(self, conn, reconnect=False):
+        """Close a connection that is in an unknown state instead of returning it.
+
+        Pass reconnect=True if the request is going to be retried on a new
+        connection because the server had closed this one while it was idle.
+        """
+        conn.close()
+        if reconnect:
+            self._lock.acquire()
+            try:
+                self.reconnects += 1
+            finally:
+                self._lock.release()
+
+    def clear(self):
+        """Close all idle connections."""
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for conns in idle.values():
+            for conn, last_used in conns:
+                conn.close()
+
+    def stats(self):
+        """Return a dictionary with the pool's hit/miss counters."""
+        self._lock.acquire()
+        try:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'stale': self.stale,
+                    'reconnects': self.reconnects,
+                    'idle': sum(len(conns) for conns in self._idle.values()),
+                    }
+        finally:
+            self._lock.release()
+
+    def _new_connection(self, scheme, host, port):
+        if scheme == 'https':
+            return ProperHTTPSConnection(host, port or httplib.HTTPS_PORT, timeout=self.timeout)
+        return httplib.HTTPConnection(host, port or httplib.HTTP_PORT, timeout=self.timeout)
+
+
+def _is_connection_alive(conn):
+    """An idle keep-alive connection must not have anything to read.
+
+    If its socket is readable, the server has either closed it or sent
+    something unexpected; either way it can't be reused.
+    """
+    sock = conn.sock
+    if sock is None:
+        return False
+    if getattr(sock, 'pending', None) and sock.pending():
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (select.error, socket.error, ValueError):
+        return False
+    return not readable
+
+
+UPLOAD_BLOCK_SIZE = 64 * 1024
+
+try:
+    _memoryview = memoryview
+except NameError:  # Python < 2.7
+    _memoryview = ()
+
+
+def _send_request(conn, method, path, body, headers):
+    """Send a request, streaming the body in blocks of UPLOAD_BLOCK_SIZE.
+
+    Strings are sent as-is. Buffers (mmap, bytearray, memoryview, buffer) are
+    sent as zero-copy slices. File-like objects are read block by block,
+    with a Content-Length taken from fstat() or seek()/tell() where possible
+    and chunked transfer encoding otherwise.
 
-    @staticmethod
-    def request(method, url, post_params=None, body=None, headers=None, raw_response=False):
+    Returns:
+        The number of body bytes sent.
+    """
+    if body is None or isinstance(body, basestring):
+        conn.request(method, path, body, headers)
+        return len(body or '')
+
+    length = _body_length(body)
+    conn.putrequest(method, path)
+    for header, value in headers.iteritems():
+        conn.putheader(header, value)
+    if length is None:
+        conn.putheader('Transfer-Encoding', 'chunked')
+    else:
+        conn.putheader('Content-Length', str(length))
+    conn.endheaders()
+
+    sent = 0
+    if length is None:
+        for block in _iter_body(body, None):
+            conn.send('%x\r\n' % len(block))
+            conn.send(block)
+            conn.send('\r\n')
+            sent += len(block)
+        conn.send('0\r\n\r\n')
+    else:
+        for block in _iter_body(body, length):
+            conn.send(block)
+            sent += len(block)
+        if sent != length:
+            raise ValueError('request body ended after %d of %d bytes' % (sent, length))
+    return sent
+
+
+def _body_length(body):
+    """Return the number of bytes left in body, or None if that can't be told up front."""
+    if not hasattr(body, 'read'):
+        return len(body)
+    try:
+        st = os.fstat(body.fileno())
+        if stat.S_ISREG(st.st_mode):
+            return st.st_size - body.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        pass
+    try:
+        pos = body.tell()
+        body.seek(0, 2)
+        end = body.tell()
+        body.seek(pos)
+        return end - pos
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+
+def _iter_body(body, length):
+    if not hasattr(body, 'read'):
+        for offset in xrange(0, length, UPLOAD_BLOCK_SIZE):
+            if isinstance(body, _memoryview):
+                yield body[offset:offset + UPLOAD_BLOCK_SIZE]
+            else:
+                yield buffer(body, offset, UPLOAD_BLOCK_SIZE)
+        return
+
+    remaining = length
+    while remaining is None or remaining > 0:
+        block_size = UPLOAD_BLOCK_SIZE if remaining is None else min(UPLOAD_BLOCK_SIZE, remaining)
+        block = body.read(block_size)
+        if not block:
+            break
+        if remaining is not None:
+            remaining -= len(block)
+        yield block
+
+
+def _body_position(body):
+    """Return the current position of a file-like body, so it can be rewound later."""
+    if hasattr(body, 'read') and hasattr(body, 'tell'):
+        try:
+            return body.tell()
+        except (IOError, OSError):
+            pass
+    return None
+
+
+def _rewind(body, position):
+    """Seek a file-like body back to where it was so the request can be resent."""
+    if not hasattr(body, 'read'):
+        return True
+    if position is None:
+        return False
+    try:
+        body.seek(position)
+    except (AttributeError, IOError, OSError):
+        return False
+    return True
+
+
+class RESTClientObject(object):
+    """
+    Performs JSON REST requests over persistent connections taken from a
+    ConnectionPool. RESTClient forwards to a shared instance of this class,
+    which is what DropboxClient and DropboxSession use unless they were
+    given another one.
+    """
+
+    def __init__(self, pool=None, retry_policy=None, rate_limiter=None, instrumentation=None):
+        """Initialize a RESTClientObject.
+
+        Args:
+            pool: The ConnectionPool to take connections from. [optional]
+                A new pool with default settings is created if omitted.
+            retry_policy: A RetryPolicy deciding which failed requests are retried. [optional]
+                Without one, every failure is raised right away.
+            rate_limiter: A dropbox.ratelimit.RequestLimiter every request (including
+                each retry) has to pass before it is sent. [optional]
+            instrumentation: A dropbox.instrumentation.Instrumentation that records
+                the timings, byte counts and status of every request. [optional]
+        """
+        self.pool = pool or ConnectionPool()
+        self.retry_policy = retry_policy
+        self.rate_limiter = rate_limiter
+        self.instrumentation = instrumentation
+
+    def request(self, method, url, post_params=None, body=None, headers=None, raw_response=False,
+                stream=False):
         """Perform a REST request and parse the response.
 
         Args:
@@ -35,31 +347,39 @@ class RESTClient(object):
             post_params: A dictionary of parameters to put in the body of the request.
                 This option may not be used if the body parameter is given.
             body: The body of the request. Typically, this value will be a string.
-                It may also be a file-like object in Python 2.6 and above. The body
-                parameter may not be used with the post_params parameter.
+                It may also be a file-like object, an mmap or any other buffer
+                (bytearray, memoryview), which is streamed in blocks rather than
+                read into memory. The body parameter may not be used with the
+                post_params parameter.
             headers: A dictionary of headers to send with the request.
-            raw_response: Whether to return the raw httplib.HTTPReponse object. [default False]
+            raw_response: Whether to return the raw response instead of parsing
+                it as JSON. [default False]
+                Use this for calls where you need to read metadata like status
+                or headers, or if the body is not JSON.
+            stream: Whether to return a dropbox.rest.RESTResponse that reads the
+                body from the socket on demand. [default False]
                 It's best enabled for requests that return large amounts of data that you
-                would want to .read() incrementally rather than loading into memory. Also
-                use this for calls where you need to read metadata like status or headers,
-                or if the body is not JSON.
+                would want to .read() incrementally rather than loading into memory.
 
         Returns:
             The JSON-decoded data from the server, unless raw_response is
-            specified, in which case an httplib.HTTPReponse object is returned instead.
+            specified, in which case a (status, headers, body) tuple is returned instead,
+            or stream is specified, in which case a RESTResponse is returned.
 
         Raises:
-            dropbox.rest.ErrorResponse: The returned HTTP status is not 200, or the body was
-                not parsed from JSON successfully.
+            dropbox.rest.ErrorResponse: The returned HTTP status is not 200 (or 206 for
+                Range requests), or the body was not parsed from JSON successfully.
             dropbox.rest.RESTSocketError: A socket.error was raised while contacting Dropbox.
+            dropbox.rest.CircuitOpenError: The retry policy's circuit breaker for the
+                host is open.
         """
-
-        import huTools.http
-
         post_params = post_params or {}
         headers = headers or {}
 
-        user_agent = 'PatchedDropboxPythonSDK/' + SDK_VERSION
+        host = urlparse.urlsplit(url)[1]
+        limiter = self.rate_limiter
+        if limiter is not None:
+            token = _oauth_token(url, headers, post_params)
 
         if post_params:
             if body:
@@ -67,43 +387,528 @@ class RESTClient(object):
             body = urllib.urlencode(post_params)
             headers['Content-type'] = 'application/x-www-form-urlencoded'
 
-        status, headers, response = huTools.http.fetch(url,
-                                                       content=body,
-                                                       method=method,
-                                                       headers=headers,
-                                                       ua=user_agent)
+        policy = self.retry_policy
+        if policy is None:
+            if limiter is not None:
+                limiter.acquire(host, token)
+            return self._request_once(method, url, body, headers, raw_response, stream)
 
-        if status != 200:
-            raise ErrorResponse(status, headers, response)
+        rewind_to = _body_position(body)
+        attempt = 0
+        while True:
+            policy.before_request(host, attempt)
+            if limiter is not None:
+                limiter.acquire(host, token)
+            try:
+                result = self._request_once(method, url, body, headers, raw_response, stream)
+            except (ErrorResponse, RESTSocketError), e:
+                policy.record_result(host, e)
+                delay = policy.retry_delay(method, url, attempt, e)
+                if delay is None or not _rewind(body, rewind_to):
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            policy.record_result(host, None)
+            return result
 
-        if raw_response:
-            return status, headers, response
-        else:
+    def _request_once(self, method, url, body, headers, raw_response, stream):
+        user_agent = 'PatchedDropboxPythonSDK/' + SDK_VERSION
+
+        instrumentation = self.instrumentation
+        sample = None
+        if instrumentation is not None:
+            sample = instrumentation.start(method, url, headers)
+
+        try:
+            if ssl is None:
+                response = self._fetch(method, url, body, headers, user_agent)
+            else:
+                headers['User-Agent'] = user_agent
+                response = self._pooled_request(method, url, body, headers, sample)
+            if sample is not None:
+                sample.status = response.status
+
+            if response.status not in (200, 206):
+                raise ErrorResponse(response.status, response.headers, _read_body(response, sample))
+
+            if stream:
+                if sample is not None:
+                    response.on_release = _stream_finisher(instrumentation, sample)
+                return response
+
+            data = _read_body(response, sample)
+            if raw_response:
+                result = response.status, response.headers, data
+            else:
+                started = time.time()
+                try:
+                    result = _json_loads(data)
+                except ValueError:
+                    raise ErrorResponse(response.status, response.headers, data)
+                if sample is not None:
+                    sample.timings['decode'] = time.time() - started
+        except Exception, e:
+            if sample is None:
+                raise
+            exc_info = sys.exc_info()
+            instrumentation.finish(sample, e)
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        if sample is not None:
+            instrumentation.finish(sample)
+        return result
+
+    def _pooled_request(self, method, url, body, headers, sample=None):
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+        host, port = netloc, None
+        if ':' in netloc:
+            host, port = netloc.rsplit(':', 1)
+            port = int(port)
+        if query:
+            path = '%s?%s' % (path, query)
+
+        rewind_to = _body_position(body)
+        while True:
+            conn = self.pool.get(scheme, host, port)
+            reused = conn.sock is not None
+            sent = None
             try:
-                return json.loads(response)
-            except ValueError:
-                raise ErrorResponse(status, headers, response)
+                if not reused:
+                    started = time.time()
+                    conn.connect()
+                    if sample is not None:
+                        sample.timings['connect'] = sample.timings.get('connect', 0) + time.time() - started
+                started = time.time()
+                sent = _send_request(conn, method, path, body, headers)
+                try:
+                    response = conn.getresponse(buffering=True)
+                except TypeError:
+                    response = conn.getresponse()  # Python < 2.7
+                if sample is not None:
+                    sample.timings['ttfb'] = time.time() - started
+                    sample.bytes_out = sent
+            except (socket.error, httplib.HTTPException), e:
+                # Once the whole request was written, the server may have acted on it
+                # before dropping the connection, so only resend it if that's harmless.
+                resend = sent is None or self._is_idempotent(method, url)
+                if reused and resend and not isinstance(e, socket.timeout) and _rewind(body, rewind_to):
+                    # The server closed the idle connection under us; a fresh one will do.
+                    self.pool.discard(conn, reconnect=True)
+                    continue
+                self.pool.discard(conn)
+                raise RESTSocketError(host, e)
+            except Exception:
+                # e.g. a body shorter than its Content-Length: the request was
+                # only partly written, so the connection can't be used again.
+                self.pool.discard(conn)
+                raise
+            break
 
-    @classmethod
-    def GET(cls, url, headers=None, raw_response=False):
-        """Perform a GET request using RESTClient.request"""
+        return RESTResponse(response.status, dict(response.getheaders()), response,
+                            conn=conn, pool=self.pool, host=host)
+
+    def _is_idempotent(self, method, url):
+        if self.retry_policy is not None:
+            return self.retry_policy.is_idempotent(method, url)
+        return method == 'GET' or endpoint_name(url) in RetryPolicy.IDEMPOTENT_ENDPOINTS
+
+    def _fetch(self, method, url, body, headers, user_agent):
+        import huTools.http
+        status, headers, content = huTools.http.fetch(url, content=body, method=method,
+                                                      headers=headers, ua=user_agent)
+        return RESTResponse(status, headers, StringIO.StringIO(content))
+
+    def GET(self, url, headers=None, raw_response=False):
+        """Perform a GET request using RESTClientObject.request"""
         assert type(raw_response) == bool
-        return cls.request("GET", url, headers=headers, raw_response=raw_response)
+        return self.request("GET", url, headers=headers, raw_response=raw_response)
 
-    @classmethod
-    def POST(cls, url, params=None, headers=None, raw_response=False):
-        """Perform a POST request using RESTClient.request"""
+    def POST(self, url, params=None, headers=None, raw_response=False):
+        """Perform a POST request using RESTClientObject.request"""
         assert type(raw_response) == bool
         if params is None:
             params = {}
 
-        return cls.request("POST", url, post_params=params, headers=headers, raw_response=raw_response)
+        return self.request("POST", url, post_params=params, headers=headers, raw_response=raw_response)
+
+    def PUT(self, url, body, headers=None, raw_response=False):
+        """Perform a PUT request using RESTClientObject.request"""
+        assert type(raw_response) == bool
+        return self.request("PUT", url, body=body, headers=headers, raw_response=raw_response)
+
+
+def _read_body(response, sample):
+    """Read a response's whole body, recording the transfer in sample (if not None)."""
+    if sample is None:
+        return response.read()
+    started = time.time()
+    data = response.read()
+    sample.timings['transfer'] = time.time() - started
+    sample.bytes_in = len(data)
+    return data
+
+
+def _stream_finisher(instrumentation, sample):
+    """Return an on_release callback that records a streamed response's transfer."""
+    started = time.time()
+
+    def finish(response):
+        sample.timings['transfer'] = time.time() - started
+        sample.bytes_in = response.bytes_read
+        instrumentation.finish(sample)
+    return finish
+
+
+_OAUTH_TOKEN_RE = re.compile(r'oauth_token="([^"]*)"')
+
+
+def _oauth_token(url, headers, post_params):
+    """Return the OAuth token a request is made with (or None), wherever it was put."""
+    match = _OAUTH_TOKEN_RE.search(headers.get('Authorization', ''))
+    if match:
+        return urllib.unquote(match.group(1))
+    if 'oauth_token' in post_params:
+        return post_params['oauth_token']
+    query = urlparse.parse_qs(urlparse.urlsplit(url)[3])
+    if 'oauth_token' in query:
+        return query['oauth_token'][0]
+    return None
+
+
+def endpoint_name(url):
+    """Return the API endpoint a URL or path refers to, without version, root and path.
+
+    For example '/metadata' for https://api.dropbox.com/1/metadata/dropbox/Photos
+    and '/fileops/move' for https://api.dropbox.com/1/fileops/move.
+    """
+    path = urlparse.urlsplit(url)[2]
+    parts = path.split('/', 4)
+    if len(parts) < 3:
+        return path
+    if parts[2] in ('fileops', 'oauth', 'account') and len(parts) > 3:
+        return '/%s/%s' % (parts[2], parts[3])
+    return '/' + parts[2]
+
+
+class RetryPolicy(object):
+    """
+    Decides whether a failed request is retried and how long to wait first.
+
+    - Only socket errors and responses with a status in retry_statuses are retried.
+    - Only idempotent requests are retried: GETs, and calls to the endpoints in
+      idempotent_endpoints. Writes like /fileops/move or /files_put are not,
+      since they may have taken effect even though the response was lost.
+    - The wait grows exponentially with full jitter, so clients that failed at
+      the same time don't retry in lockstep. A Retry-After header takes precedence.
+    - A retry budget caps retries to a fraction of the requests, so retries can't
+      multiply the load on a struggling server.
+    - A circuit breaker per host fails requests fast (CircuitOpenError) after
+      breaker_threshold consecutive failures, for breaker_cooldown seconds.
+      Then a single trial request is let through to probe the host.
+
+    One RetryPolicy can be shared by several RESTClientObjects.
+
+    Attributes (counters):
+        retries: Requests that were retried.
+        budget_exhausted: Retries that were skipped because the budget was spent.
+        breaker_trips: Times a circuit breaker opened.
+        breaker_rejections: Requests failed fast by an open circuit breaker.
+    """
+
+    IDEMPOTENT_ENDPOINTS = frozenset(['/metadata', '/files', '/thumbnails', '/search', '/delta',
+                                      '/revisions', '/media', '/shares', '/account/info',
+                                      '/chunked_upload'])
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30.0,
+                 retry_statuses=(500, 502, 503, 504), idempotent_endpoints=None,
+                 budget_ratio=0.2, budget_reserve=10,
+                 breaker_threshold=5, breaker_cooldown=30.0):
+        """Initialize a RetryPolicy.
+
+        Args:
+            max_retries: The maximum number of retries per request. [default 3]
+            backoff: The base delay in seconds; attempt n waits a random time
+                up to backoff * 2 ** n. [default 0.5]
+            max_backoff: The maximum delay in seconds, also applied to Retry-After. [default 30]
+            retry_statuses: The HTTP statuses that are retried. [default 500, 502, 503, 504]
+            idempotent_endpoints: The endpoints (see endpoint_name()) that are retried
+                whatever the HTTP method. [default IDEMPOTENT_ENDPOINTS]
+            budget_ratio: The number of retries each request earns. [default 0.2]
+            budget_reserve: The maximum number of retries saved up. [default 10]
+            breaker_threshold: Consecutive failures that open a host's breaker. [default 5]
+            breaker_cooldown: Seconds a breaker stays open. [default 30]
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        if idempotent_endpoints is None:
+            idempotent_endpoints = self.IDEMPOTENT_ENDPOINTS
+        self.idempotent_endpoints = frozenset(idempotent_endpoints)
+        self.budget_ratio = budget_ratio
+        self.budget_reserve = budget_reserve
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._lock = threading.Lock()
+        self._budget = float(budget_reserve)
+        self._breakers = {}
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.breaker_trips = 0
+        self.breaker_rejections = 0
+
+    def is_idempotent(self, method, url):
+        """Return whether a request may safely be sent more than once."""
+        return method == 'GET' or endpoint_name(url) in self.idempotent_endpoints
+
+    def is_failure(self, error):
+        """Return whether error means the host is in trouble (as opposed to e.g. a 404)."""
+        if isinstance(error, ErrorResponse):
+            return error.status in self.retry_statuses
+        return isinstance(error, RESTSocketError) and not isinstance(error, CircuitOpenError)
+
+    def backoff_delay(self, attempt):
+        """Return a random delay for the given (0-based) retry attempt."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def retry_delay(self, method, url, attempt, error):
+        """Return how many seconds to wait before retrying, or None not to retry."""
+        if attempt >= self.max_retries or not self.is_failure(error):
+            return None
+        if not self.is_idempotent(method, url):
+            return None
+
+        self._lock.acquire()
+        try:
+            if self._budget < 1:
+                self.budget_exhausted += 1
+                return None
+            self._budget -= 1
+            self.retries += 1
+        finally:
+            self._lock.release()
+
+        retry_after = None
+        if isinstance(error, ErrorResponse) and error.headers:
+            for header, value in error.headers.items():
+                if header.lower() == 'retry-after':
+                    try:
+                        retry_after = float(value)
+                    except ValueError:
+                        pass
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return self.backoff_delay(attempt)
+
+    def before_request(self, host, attempt):
+        """Called before every attempt; raises CircuitOpenError if host's breaker is open."""
+        now = time.time()
+        self._lock.acquire()
+        try:
+            if attempt == 0:
+                self._budget = min(self.budget_reserve, self._budget + self.budget_ratio)
+            breaker = self._breakers.get(host)
+            if breaker is None or breaker[1] is None:
+                return
+            failures, opened_until = breaker
+            if now >= opened_until:
+                # half-open: let this request through, keep the others out until it's done
+                self._breakers[host] = [failures, now + self.breaker_cooldown]
+                return
+            self.breaker_rejections += 1
+        finally:
+            self._lock.release()
+        raise CircuitOpenError(host, 'circuit breaker open after %d consecutive failures' % failures)
+
+    def record_result(self, host, error):
+        """Called after every attempt with the exception it raised, or None."""
+        failed = error is not None and self.is_failure(error)
+        if isinstance(error, CircuitOpenError):
+            return
+        self._lock.acquire()
+        try:
+            if not failed:
+                self._breakers.pop(host, None)
+                return
+            breaker = self._breakers.setdefault(host, [0, None])
+            breaker[0] += 1
+            if breaker[0] >= self.breaker_threshold:
+                if breaker[1] is None:
+                    self.breaker_trips += 1
+                breaker[1] = time.time() + self.breaker_cooldown
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Return a dictionary with the policy's counters."""
+        self._lock.acquire()
+        try:
+            return {'retries': self.retries,
+                    'budget_exhausted': self.budget_exhausted,
+                    'breaker_trips': self.breaker_trips,
+                    'breaker_rejections': self.breaker_rejections,
+                    'open_breakers': sorted(host for host, (failures, opened_until) in self._breakers.items()
+                                            if opened_until is not None),
+                    }
+        finally:
+            self._lock.release()
+
+
+class RESTResponse(object):
+    """
+    A file-like object for the body of a successful response that is read
+    from the socket on demand, so even very large downloads only ever hold
+    one chunk in memory.
+
+    The underlying connection goes back into the pool once the body has
+    been read completely. Closing the response early discards the
+    connection instead, so always close() it (or use it in a with block).
+
+    Attributes:
+        bytes_read: The number of body bytes read so far.
+        on_release: A callable that is passed the response once its body has
+            been read completely or it was closed. [optional]
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, status, headers, fp, conn=None, pool=None, host=None):
+        self.status = status
+        self.headers = headers
+        self._fp = fp
+        self._conn = conn
+        self._pool = pool
+        self._host = host
+        self.bytes_read = 0
+        self.on_release = None
+
+    def getheader(self, name, default=None):
+        """Return the value of the header name (case-insensitive), or default."""
+        name = name.lower()
+        for header, value in self.headers.iteritems():
+            if header.lower() == name:
+                return value
+        return default
+
+    def getheaders(self):
+        """Return a list of (header, value) tuples."""
+        return self.headers.items()
+
+    def read(self, amt=None):
+        """Read and return at most amt bytes of the body, or all of it if amt is omitted.
+
+        An empty string is returned once the body is exhausted.
+        """
+        if self._fp is None:
+            return ''
+        try:
+            if amt is None:
+                data = self._fp.read()
+            else:
+                data = self._fp.read(amt)
+        except (socket.error, httplib.HTTPException), e:
+            self._release(False)
+            raise RESTSocketError(self._host, e)
+
+        self.bytes_read += len(data)
+        isclosed = getattr(self._fp, 'isclosed', None)
+        if (isclosed and isclosed()) or not data or amt is None:
+            self._release(True)
+        return data
+
+    def readinto(self, b):
+        """Read up to len(b) bytes into the writable buffer b (e.g. a bytearray).
+
+        Returns:
+            The number of bytes read, 0 at the end of the body.
+        """
+        data = self.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def iter_content(self, chunk_size=None):
+        """Yield the body in chunks of at most chunk_size bytes."""
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        while True:
+            data = self.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+    def __iter__(self):
+        return self.iter_content()
+
+    def close(self):
+        """Close the response.
+
+        If the body wasn't read completely, the connection can't be reused and is closed too.
+        """
+        if self._fp is not None:
+            self._release(False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def _release(self, reusable):
+        fp, self._fp = self._fp, None
+        conn, self._conn = self._conn, None
+        if hasattr(fp, 'close'):
+            fp.close()
+        if conn is not None:
+            if reusable:
+                self._pool.put(conn)
+            else:
+                self._pool.discard(conn)
+        on_release, self.on_release = self.on_release, None
+        if on_release is not None:
+            on_release(self)
+
+
+class RESTClient(object):
+    """
+    An class with all static methods to perform JSON REST requests that is used internally
+    by the Dropbox Client API. It provides just enough gear to make requests
+    and get responses as JSON data (when applicable). All requests happen over SSL.
+
+    The calls are forwarded to RESTClient.IMPL, a RESTClientObject that owns
+    the process-wide ConnectionPool (see RESTClient.IMPL.pool.stats()). To
+    retry failed requests process-wide, set RESTClient.IMPL.retry_policy to a
+    RetryPolicy; to do it for a single DropboxClient, pass it a RESTClientObject
+    with its own retry_policy. Likewise, a dropbox.ratelimit.RequestLimiter set as
+    RESTClient.IMPL.rate_limiter paces the requests of all DropboxClients that
+    use the default RESTClient, and a dropbox.instrumentation.Instrumentation set
+    as RESTClient.IMPL.instrumentation records their timings.
+    """
+
+    IMPL = RESTClientObject()
+
+    @classmethod
+    def request(cls, *n, **kw):
+        """Perform a REST request and parse the response. See RESTClientObject.request()."""
+        return cls.IMPL.request(*n, **kw)
+
+    @classmethod
+    def GET(cls, *n, **kw):
+        """Perform a GET request using RESTClient.request"""
+        return cls.IMPL.GET(*n, **kw)
+
+    @classmethod
+    def POST(cls, *n, **kw):
+        """Perform a POST request using RESTClient.request"""
+        return cls.IMPL.POST(*n, **kw)
 
     @classmethod
-    def PUT(cls, url, body, headers=None, raw_response=False):
+    def PUT(cls, *n, **kw):
         """Perform a PUT request using RESTClient.request"""
-        assert type(raw_response) == bool
-        return cls.request("PUT", url, body=body, headers=headers, raw_response=raw_response)
+        return cls.IMPL.PUT(*n, **kw)
 
 class RESTSocketError(socket.error):
     """
@@ -115,6 +920,13 @@ class RESTSocketError(socket.error):
         msg = "Error connecting to \"%s\": %s" % (host, str(e))
         socket.error.__init__(self, msg)
 
+class CircuitOpenError(RESTSocketError):
+    """
+    Raised by dropbox.rest.RESTClient.request instead of contacting a host
+    whose circuit breaker is open because its recent requests kept failing.
+    """
+    pass
+
 class ErrorResponse(Exception):
     """
     Raised by dropbox.rest.RESTClient.request for requests that:
@@ -169,17 +981,17 @@ class ProperHTTPSConnection(httplib.HTTPConnection):
        2. The hostname in the certificate matches the hostname we're connecting to.
     """
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, timeout=None):
         httplib.HTTPConnection.__init__(self, host, port)
         self.ca_certs = TRUSTED_CERT_FILE
-        self.cert_reqs = 2  # ssl.CERT_REQUIRED
+        self.cert_reqs = ssl.CERT_REQUIRED
+        self.timeout = timeout
 
     def connect(self):
-        sock = create_connection((self.host, self.port))
-        self.sock = ssl.wrap_socket(sock, cert_reqs=self.cert_reqs, ca_certs=self.ca_certs)  # ?
+        sock = create_connection((self.host, self.port), self.timeout)
+        self.sock = ssl.wrap_socket(sock, cert_reqs=self.cert_reqs, ca_certs=self.ca_certs)
         cert = self.sock.getpeercert()
-        hostname = self.host.split(':', 0)[0]
-        match_hostname(cert, hostname)
+        match_hostname(cert, self.host)
 
 class CertificateError(ValueError):
     pass
@@ -231,7 +1043,7 @@ def match_hostname(cert, hostname):
     else:
         raise CertificateError("no appropriate commonName or subjectAltName fields were found")
 
-def create_connection(address):
+def create_connection(address, timeout=None):
     host, port = address
     err = None
     for res in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
@@ -239,6 +1051,8 @@ def create_connection(address):
         sock = None
         try:
             sock = socket.socket(af, socktype, proto)
+            if timeout is not None:
+                sock.settimeout(timeout)
             sock.connect(sa)
             return sock
 
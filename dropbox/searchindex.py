@@ -0,0 +1,391 @@
+"""
+An in-memory filename index that answers DropboxClient.search() locally.
+
+Fill it with a walk of the folders to search, then give it to a client,
+which keeps it current with metadata() results and its own writes:
+
+    search_index = SearchIndex(max_age=600)
+    client = DropboxClient(session, search_index=search_index)
+    search_index.fill(client, '/Photos')
+    client.search('/Photos', 'beach')               # no network
+    client.search('/Photos', 'be', prefix=True)     # names starting with 'be'
+
+Names are indexed by their trigrams (and their first one and two
+characters, for short prefixes), so a query only looks at the entries
+whose names can match. Searches below a folder that hasn't been filled, or
+was filled longer than max_age seconds ago, return None and the client
+asks the server instead. Changes made by other clients only show up after
+the next fill, or when applied from a delta feed with apply_delta().
+
+Paths are normalized with format_path() and compared case-insensitively,
+like on the server.
+"""
+
+import heapq
+import threading
+import time
+
+from dropbox import walker
+from dropbox.index import display_path, normalize_path
+
+_EMPTY = frozenset()
+
+
+def _parent(key):
+    return key.rsplit('/', 1)[0]
+
+
+def _name(key):
+    return key[key.rfind('/') + 1:]
+
+
+def _trigrams(s):
+    return set(s[i:i + 3] for i in xrange(len(s) - 2))
+
+
+def _plain(metadata):
+    """Return a metadata entry as a dictionary without its folder contents."""
+    if not isinstance(metadata, dict):
+        metadata = metadata.as_dict()
+    if 'contents' in metadata:
+        metadata = dict(metadata)
+        del metadata['contents']
+    return metadata
+
+
+class SearchIndex(object):
+    """
+    A map from remote paths to their metadata with a trigram index over
+    the lowercased names. It is safe to share between threads.
+    """
+
+    def __init__(self, max_age=None):
+        """Initialize a SearchIndex.
+
+        Args:
+            max_age: How many seconds a fill is trusted for. [optional]
+                Searches below folders filled longer ago than that go to the
+                server. None means filled folders never go stale.
+        """
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = {}   # key -> (updated, metadata)
+        self._children = {}  # folder key -> set of child keys
+        self._grams = {}     # trigram -> set of keys
+        self._heads = {}     # first one and two characters -> set of keys
+        self._filled = {}    # folder key -> time its subtree was filled
+
+    def fill(self, client, path='/', max_workers=8, file_limit=10000):
+        """Index everything below a folder with a walk (see dropbox.walker.walk).
+
+        Entries below path that the walk didn't see are forgotten, and
+        searches below path are answered locally from then on. If a folder
+        can't be listed, the error is raised and path isn't marked as filled.
+
+        Args:
+            client: The DropboxClient to list folders with. If its search_index
+                is this index, the listings are recorded as they arrive.
+            path: The folder to index. [default '/']
+            max_workers: The maximum number of metadata() calls in flight. [default 8]
+            file_limit: The file_limit passed to metadata(). [default 10000]
+        """
+        started = time.time()
+        attached = getattr(client, 'search_index', None) is self
+        for entry in walker.walk(client, path, max_workers, file_limit=file_limit):
+            if not attached:
+                self.update(entry)
+
+        key = normalize_path(path)
+        self._lock.acquire()
+        try:
+            stale = [child for child in self._subtree(key)
+                     if child != key and child in self._entries and self._entries[child][0] < started]
+            for child in stale:
+                if child in self._entries:
+                    self._remove(child)
+            self._filled[key] = started
+        finally:
+            self._lock.release()
+
+    def covers(self, path, max_age=None):
+        """Return whether searches below path can be answered locally.
+
+        Args:
+            max_age: Overrides the index's max_age for this check. [optional]
+        """
+        key = normalize_path(path)
+        if max_age is None:
+            max_age = self.max_age
+        self._lock.acquire()
+        try:
+            return self._covers(key, max_age)
+        finally:
+            self._lock.release()
+
+    def search(self, path, query, limit=None, prefix=False, max_age=None):
+        """Find the files and folders below path whose names match query.
+
+        Like the server, a name matches if it contains every word of query,
+        ignoring case. Queries shorter than three characters are allowed,
+        but words that short can't use the trigram index.
+
+        Args:
+            path: The folder to search within.
+            query: The words to search for.
+            limit: The maximum number of entries to return. [optional]
+                None means all of them.
+            prefix: Match the names that start with query instead. [default False]
+            max_age: Overrides the index's max_age for this search. [optional]
+
+        Returns:
+            A list of metadata dictionaries sorted by path (shared with the
+            index, so don't modify them), or None if path isn't covered by a
+            fresh fill or isn't an indexed folder, or query is empty.
+        """
+        key = normalize_path(path)
+        if isinstance(query, str):
+            query = query.decode('utf8')
+        query = query.lower()
+        words = [query] if prefix else query.split()
+        if not words or not words[0]:
+            return None
+        if max_age is None:
+            max_age = self.max_age
+
+        self._lock.acquire()
+        try:
+            if not self._covers(key, max_age):
+                return None
+            if key in self._entries and not self._entries[key][1].get('is_dir'):
+                return None
+            if key not in self._entries and key not in self._filled:
+                return None
+
+            candidates = self._candidates(words, prefix)
+            start = key + '/'
+            if prefix:
+                matches = [k for k in candidates
+                           if k.startswith(query, k.rfind('/') + 1) and k.startswith(start)]
+            elif len(words) == 1:
+                word = words[0]
+                matches = [k for k in candidates
+                           if k.find(word, k.rfind('/') + 1) >= 0 and k.startswith(start)]
+            else:
+                matches = [k for k in candidates
+                           if k.startswith(start) and all(word in _name(k) for word in words)]
+            if limit is not None and limit * 10 < len(matches):
+                matches = heapq.nsmallest(limit, matches)
+            else:
+                matches.sort()
+                if limit is not None:
+                    del matches[limit:]
+            entries = self._entries
+            return [entries[k][1] for k in matches]
+        finally:
+            self._lock.release()
+
+    def update(self, metadata):
+        """Record a metadata dictionary (or dropbox.metadata object) as returned by the API.
+
+        If it is a folder listing, the folder's children are replaced with
+        the listed ones. Deleted entries are removed from the index.
+        """
+        now = time.time()
+        key = normalize_path(metadata['path'])
+        self._lock.acquire()
+        try:
+            if metadata.get('is_deleted'):
+                self._remove(key)
+            else:
+                self._add(key, _plain(metadata), now)
+
+            if 'contents' in metadata:
+                listed = set()
+                for child in metadata['contents']:
+                    child_key = normalize_path(child['path'])
+                    if child.get('is_deleted'):
+                        self._remove(child_key)
+                    else:
+                        self._add(child_key, _plain(child), now)
+                        listed.add(child_key)
+                for child_key in list(self._children.get(key, ())):
+                    if child_key not in listed:
+                        self._remove(child_key)
+        finally:
+            self._lock.release()
+
+    def remove(self, path):
+        """Forget path and everything below it (e.g. after a delete)."""
+        self._lock.acquire()
+        try:
+            self._remove(normalize_path(path))
+        finally:
+            self._lock.release()
+
+    def move(self, from_path, to_path, metadata=None):
+        """Move the indexed subtree at from_path to to_path.
+
+        Args:
+            metadata: The metadata returned by the move, recorded for to_path. [optional]
+                Its path is used as the destination, as the server may have
+                renamed it.
+        """
+        self._transfer(from_path, to_path, metadata, keep=False)
+
+    def copy(self, from_path, to_path, metadata=None):
+        """Copy the indexed subtree at from_path to to_path.
+
+        Args:
+            metadata: The metadata returned by the copy, recorded for to_path. [optional]
+                Its path is used as the destination, as the server may have
+                renamed it.
+        """
+        self._transfer(from_path, to_path, metadata, keep=True)
+
+    def apply_delta(self, path, metadata):
+        """Apply one entry of a DropboxClient.delta() page (see dropbox.delta.DeltaFeed)."""
+        if metadata is None:
+            self.remove(path)
+        else:
+            self.update(metadata)
+
+    def invalidate(self, path='/'):
+        """Stop answering searches locally below path until it is filled again."""
+        key = normalize_path(path)
+        self._lock.acquire()
+        try:
+            self._invalidate(key)
+            for filled in self._filled.keys():
+                if filled.startswith(key + '/'):
+                    del self._filled[filled]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._children.clear()
+            self._grams.clear()
+            self._heads.clear()
+            self._filled.clear()
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _covers(self, key, max_age):
+        now = time.time()
+        while True:
+            filled = self._filled.get(key)
+            if filled is not None and (max_age is None or now - filled <= max_age):
+                return True
+            if not key:
+                return False
+            key = _parent(key)
+
+    def _invalidate(self, key):
+        """Forget the fills of key and of the folders containing it."""
+        while True:
+            self._filled.pop(key, None)
+            if not key:
+                return
+            key = _parent(key)
+
+    def _candidates(self, words, prefix):
+        """Return the keys whose names may match, from the smallest gram sets."""
+        if prefix and len(words[0]) < 3:
+            return self._heads.get(words[0], _EMPTY)
+        grams = set()
+        for word in words:
+            grams.update(_trigrams(word))
+        if not grams:
+            return self._entries
+        sets = [self._grams.get(gram, _EMPTY) for gram in grams]
+        if prefix:
+            sets.append(self._heads.get(words[0][:2], _EMPTY))
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def _subtree(self, key):
+        keys, stack = [], [key]
+        while stack:
+            key = stack.pop()
+            if key in self._entries or key in self._children:
+                keys.append(key)
+            stack.extend(self._children.get(key, ()))
+        return keys
+
+    def _add(self, key, metadata, now):
+        existing = self._entries.get(key)
+        if existing is None:
+            name = _name(key)
+            for gram in _trigrams(name):
+                self._grams.setdefault(gram, set()).add(key)
+            for head in set((name[:1], name[:2])):
+                self._heads.setdefault(head, set()).add(key)
+            if key:
+                self._children.setdefault(_parent(key), set()).add(key)
+        elif existing[1].get('is_dir') and not metadata.get('is_dir'):
+            for child in list(self._children.get(key, ())):
+                self._remove(child)
+        self._entries[key] = (now, metadata)
+
+    def _remove(self, key):
+        for removed in self._subtree(key):
+            self._children.pop(removed, None)
+            if self._entries.pop(removed, None) is None:
+                continue
+            name = _name(removed)
+            for gram in _trigrams(name):
+                self._discard(self._grams, gram, removed)
+            for head in set((name[:1], name[:2])):
+                self._discard(self._heads, head, removed)
+        if key:
+            self._discard(self._children, _parent(key), key)
+
+    @staticmethod
+    def _discard(sets, name, key):
+        keys = sets.get(name)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del sets[name]
+
+    def _transfer(self, from_path, to_path, metadata, keep):
+        if metadata is not None:
+            to_path = metadata['path']
+        to_display_path = display_path(to_path)
+        from_key, to_key = normalize_path(from_path), normalize_path(to_path)
+        start = len(from_key)
+        now = time.time()
+        self._lock.acquire()
+        try:
+            source = self._entries.get(from_key)
+            is_dir = metadata.get('is_dir') if metadata is not None else source and source[1].get('is_dir')
+            # Only a subtree the index knows completely can be transferred,
+            # otherwise the folders containing the destination are no longer filled.
+            complete = not is_dir or self._covers(from_key, self.max_age)
+            moved = []
+            if complete:
+                for key in self._subtree(from_key):
+                    if key != from_key and key in self._entries:
+                        entry = dict(self._entries[key][1])
+                        entry['path'] = to_display_path + entry['path'][start:]
+                        moved.append((to_key + key[start:], entry))
+            if not keep:
+                self._remove(from_key)
+            self._remove(to_key)
+            if metadata is not None:
+                self._add(to_key, _plain(metadata), now)
+            elif source is not None:
+                entry = dict(source[1])
+                entry['path'] = to_display_path
+                self._add(to_key, entry, now)
+            for key, entry in moved:
+                self._add(key, entry, now)
+            if not complete:
+                self._invalidate(to_key)
+        finally:
+            self._lock.release()
@@ -8,19 +8,49 @@ A DropboxSession object must be passed to a dropbox.client.DropboxClient object
 initialization.
 """
 
+import binascii
+import hashlib
+import hmac
+import random
+import time
 import urllib
 import oauth
 
 from dropbox import rest
 
+SIGNATURE_METHODS = {
+    'PLAINTEXT': oauth.OAuthSignatureMethod_PLAINTEXT,
+    'HMAC-SHA1': oauth.OAuthSignatureMethod_HMAC_SHA1,
+}
+
+QUOTE_CACHE_SIZE = 4096
+
+_quoted = {}
+
+
+def quote(target):
+    """urllib.quote() target (unicode is encoded as UTF-8 first), memoizing the result.
+
+    The cache holds up to QUOTE_CACHE_SIZE targets and is emptied when it is full.
+    """
+    quoted = _quoted.get(target)
+    if quoted is None:
+        if len(_quoted) >= QUOTE_CACHE_SIZE:
+            _quoted.clear()
+        quoted = _quoted[target] = urllib.quote(target.encode('utf8') if isinstance(target, unicode)
+                                                else target)
+    return quoted
+
 class DropboxSession(object):
     API_VERSION = 1
 
+    API_SCHEME = "https"
     API_HOST = "api.dropbox.com"
     WEB_HOST = "www.dropbox.com"
     API_CONTENT_HOST = "api-content.dropbox.com"
 
-    def __init__(self, consumer_key, consumer_secret, access_type, locale=None):
+    def __init__(self, consumer_key, consumer_secret, access_type, locale=None, rest_client=rest.RESTClient,
+                 signature_method='PLAINTEXT'):
         """Initialize a DropboxSession object.
 
         Your consumer key and secret are available
@@ -37,14 +67,28 @@ class DropboxSession(object):
                 languages in the future. If you send a language the server doesn't
                 support, messages will remain in English. Look for these translated
                 messages in rest.ErrorResponse exceptions as e.user_error_msg.
+            rest_client: The REST client used for the OAuth calls. [optional]
+                Defaults to dropbox.rest.RESTClient, whose connection pool is
+                shared with DropboxClient objects.
+            signature_method: How requests are signed: 'PLAINTEXT' or 'HMAC-SHA1',
+                or an oauth.OAuthSignatureMethod instance. [default 'PLAINTEXT']
+                PLAINTEXT relies on SSL to protect the secrets; HMAC-SHA1 never
+                sends them.
         """
         assert access_type in ['dropbox', 'app_folder'], "expected access_type of 'dropbox' or 'app_folder'"
         self.consumer = oauth.OAuthConsumer(consumer_key, consumer_secret)
         self.token = None
         self.request_token = None
-        self.signature_method = oauth.OAuthSignatureMethod_PLAINTEXT()
+        if isinstance(signature_method, basestring):
+            assert signature_method in SIGNATURE_METHODS, "expected signature_method of %s" % \
+                ' or '.join("'%s'" % name for name in sorted(SIGNATURE_METHODS))
+            signature_method = SIGNATURE_METHODS[signature_method]()
+        self.signature_method = signature_method
         self.root = 'sandbox' if access_type == 'app_folder' else 'dropbox'
         self.locale = locale
+        self.rest_client = rest_client
+        self._signers = {}
+        self._endpoints = {}
 
     def is_linked(self):
         """Return whether the DropboxSession has an access token attached."""
@@ -84,10 +128,7 @@ class DropboxSession(object):
         Returns:
             The path and parameters components of an API URL.
         """
-        if type(target) == unicode:
-            target = target.encode("utf8")
-
-        target_path = urllib.quote(target)
+        target_path = quote(target)
         params = params or {}
         params = params.copy()
 
@@ -102,7 +143,7 @@ class DropboxSession(object):
     def build_url(self, host, target, params=None):
         """Build an API URL.
 
-        This method adds scheme and hostname to the path
+        This method adds scheme (API_SCHEME) and hostname to the path
         returned from build_path.
 
         Args:
@@ -112,7 +153,31 @@ class DropboxSession(object):
         Returns:
             The full API URL.
         """
-        return "https://%s%s" % (host, self.build_path(target, params))
+        return "%s://%s%s" % (self.API_SCHEME, host, self.build_path(target, params))
+
+    def build_endpoint_url(self, host, endpoint, rooted=False):
+        """Return the URL of an API endpoint, without parameters.
+
+        The URLs are computed once per host and root and then reused, so
+        that the calls of a DropboxClient only have to append the quoted path.
+
+        Args:
+            host: The API host (e.g. API_HOST).
+            endpoint: The endpoint with leading slash (e.g. '/metadata').
+            rooted: Whether to append the root ('dropbox' or 'sandbox'), for
+                endpoints that take a path.
+
+        Returns:
+            The URL, e.g. 'https://api.dropbox.com/1/metadata/dropbox'.
+        """
+        key = (self.API_SCHEME, host, endpoint, rooted and self.root)
+        url = self._endpoints.get(key)
+        if url is None:
+            if rooted:
+                endpoint = '%s/%s' % (endpoint, self.root)
+            url = self._endpoints[key] = "%s://%s/%d%s" % (self.API_SCHEME, host, self.API_VERSION,
+                                                           quote(endpoint))
+        return url
 
     def build_authorize_url(self, request_token, oauth_callback=None):
         """Build a request token authorization URL.
@@ -157,7 +222,7 @@ class DropboxSession(object):
         url = self.build_url(self.API_HOST, '/oauth/request_token')
         headers, params = self.build_access_headers('POST', url)
 
-        status, headers, response = rest.RESTClient.POST(url, headers=headers, params=params, raw_response=True)
+        status, headers, response = self.rest_client.POST(url, headers=headers, params=params, raw_response=True)
         self.request_token = oauth.OAuthToken.from_string(response)
         return self.request_token
 
@@ -186,7 +251,7 @@ class DropboxSession(object):
         url = self.build_url(self.API_HOST, '/oauth/access_token')
         headers, params = self.build_access_headers('POST', url, request_token=request_token)
 
-        status, headers, response = rest.RESTClient.POST(url, headers=headers, params=params, raw_response=True)
+        status, headers, response = self.rest_client.POST(url, headers=headers, params=params, raw_response=True)
         self.token = oauth.OAuthToken.from_string(response)
         return self.token
 
@@ -204,12 +269,24 @@ class DropboxSession(object):
             of header names and values appropriate for passing into dropbox.rest.RESTClient
             and params is a dictionary like the one that was passed in, but augmented with
             oauth-related parameters as appropriate.
+
+        For PLAINTEXT and HMAC-SHA1, what doesn't change between requests
+        (the PLAINTEXT signature, the keyed HMAC, the constant part of the
+        header) is cached per (consumer, token).
         """
         if params is None:
             params = {}
         else:
             params = params.copy()
 
+        token = request_token if request_token else self.token
+
+        signer_class = _SIGNERS.get(type(self.signature_method))
+        if signer_class is not None:
+            if '?' in resource_url:
+                params.update(oauth.OAuthRequest._split_url_string(resource_url.split('?', 1)[1]))
+            return self._signer(signer_class, token).sign(method, resource_url, params)
+
         oauth_params = {
             'oauth_consumer_key': self.consumer.key,
             'oauth_timestamp': oauth.generate_timestamp(),
@@ -217,8 +294,6 @@ class DropboxSession(object):
             'oauth_version': oauth.OAuthRequest.version,
         }
 
-        token = request_token if request_token else self.token
-
         if token:
             oauth_params['oauth_token'] = token.key
 
@@ -228,3 +303,118 @@ class DropboxSession(object):
         oauth_request.sign_request(self.signature_method, self.consumer, token)
 
         return oauth_request.to_header(), params
+
+    def _signer(self, signer_class, token):
+        key = (signer_class, self.consumer.key, self.consumer.secret,
+               token and token.key, token and token.secret)
+        signer = self._signers.get(key)
+        if signer is None:
+            if len(self._signers) >= 16:
+                self._signers.clear()
+            signer = self._signers[key] = signer_class(self.consumer, token)
+        return signer
+
+
+class _Signer(object):
+    """
+    Signs requests for one (consumer, token) pair. Everything that doesn't
+    change between requests, including the constant part of the
+    Authorization header, is computed once.
+    """
+
+    name = None
+
+    def __init__(self, consumer, token):
+        self.params = {
+            'oauth_consumer_key': consumer.key,
+            'oauth_version': oauth.OAuthRequest.version,
+            'oauth_signature_method': self.name,
+        }
+        if token:
+            self.params['oauth_token'] = token.key
+
+    def sign(self, method, url, params):
+        """Add the OAuth parameters to params and return (header_dict, params)."""
+        extra = [k for k in params if k[:6] == 'oauth_' and k not in self.params
+                 and k not in ('oauth_timestamp', 'oauth_nonce')]
+        timestamp = int(time.time())
+        nonce = '%08d' % int(random.random() * 100000000)
+        params.update(self.params)
+        params['oauth_timestamp'] = timestamp
+        params['oauth_nonce'] = nonce
+
+        header = '%s, oauth_timestamp="%d", oauth_nonce="%s"%s' % (
+            self.header, timestamp, nonce, self.signature(method, url, params))
+        if extra:
+            header += _header_params(dict((k, params[k]) for k in extra))
+        return {'Authorization': header}, params
+
+    def signature(self, method, url, params):
+        """Sign the request, returning what to append to the header for it."""
+        raise NotImplementedError
+
+
+class _PlaintextSigner(_Signer):
+    """PLAINTEXT signatures only depend on the two secrets, so they are constant."""
+
+    name = 'PLAINTEXT'
+
+    def __init__(self, consumer, token):
+        _Signer.__init__(self, consumer, token)
+        self.params['oauth_signature'] = '%s&%s' % (oauth.escape(consumer.secret),
+                                                    oauth.escape(token.secret) if token else '')
+        self.header = 'OAuth realm=""' + _header_params(self.params)
+
+    def signature(self, method, url, params):
+        return ''
+
+
+class _HmacSha1Signer(_Signer):
+    """
+    HMAC-SHA1 signatures cover the method, URL and all parameters. The HMAC
+    is keyed once and copied per request, and the constant parameters are
+    escaped once.
+    """
+
+    name = 'HMAC-SHA1'
+
+    def __init__(self, consumer, token):
+        _Signer.__init__(self, consumer, token)
+        self.header = 'OAuth realm=""' + _header_params(self.params)
+        key = '%s&%s' % (oauth.escape(consumer.secret), oauth.escape(token.secret) if token else '')
+        self._hmac = hmac.new(key, digestmod=hashlib.sha1)
+        self._escaped = [(_escape(k), _escape(v)) for k, v in self.params.iteritems()]
+
+    def signature(self, method, url, params):
+        pairs = list(self._escaped)
+        for k, v in params.iteritems():
+            if k not in self.params and k != 'oauth_signature':
+                pairs.append((_escape(k), _escape(v)))
+        pairs.sort()
+        normalized = '&'.join(['%s=%s' % pair for pair in pairs])
+
+        base_url = url.split('?', 1)[0]
+        if base_url.count(':') > 1:  # drop a default port
+            base_url = oauth.OAuthRequest(http_url=base_url).get_normalized_http_url()
+
+        hashed = self._hmac.copy()
+        hashed.update('%s&%s&%s' % (_escape(method.upper()), _escape(base_url), _escape(normalized)))
+        signature = binascii.b2a_base64(hashed.digest())[:-1]
+        params['oauth_signature'] = signature
+        return ', oauth_signature="%s"' % oauth.escape(signature)
+
+
+_SIGNERS = {
+    oauth.OAuthSignatureMethod_PLAINTEXT: _PlaintextSigner,
+    oauth.OAuthSignatureMethod_HMAC_SHA1: _HmacSha1Signer,
+}
+
+
+def _escape(s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    return urllib.quote(str(s), '~')
+
+
+def _header_params(params):
+    return ''.join(', %s="%s"' % (k, oauth.escape(str(v))) for k, v in sorted(params.items()))
@@ -0,0 +1,342 @@
+"""
+Uploads that skip what Dropbox already has.
+
+A SyncUploader remembers, in a local SQLite sidecar database (SyncState),
+the content hash of every file it uploaded and the rev the upload got.
+A file is only sent again if its content changed or someone else changed
+the remote copy, and content that already exists at another remote path is
+copied there on the server instead of uploaded:
+
+    state = SyncState('/var/lib/backup/dropbox-sync.db')
+    uploader = SyncUploader(client, state, max_workers=8)
+    report = uploader.upload_tree('/home/me/Documents', '/Backup/Documents')
+    print report.counts(), report.bytes_uploaded
+
+Local files are only hashed when their size or modification time changed
+since the last run, so re-running a backup of a mostly unchanged tree reads
+and sends almost nothing.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from dropbox.index import normalize_path
+from dropbox.rest import ErrorResponse
+from dropbox.workers import WorkerPool
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS local_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS remote_files (
+    path TEXT PRIMARY KEY,
+    display_path TEXT NOT NULL,
+    rev TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS remote_files_hash ON remote_files (hash);
+"""
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_hash(local_path):
+    """Return the hex SHA-256 digest of a local file's content."""
+    digest = hashlib.sha256()
+    f = open(local_path, 'rb')
+    try:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+class SyncState(object):
+    """
+    The sidecar database of a SyncUploader: content hashes of local files
+    (keyed by path, size and modification time) and the content hash and rev
+    of every remote file it uploaded or copied. It is safe to share between
+    threads.
+    """
+
+    def __init__(self, filename=':memory:'):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def local_hash(self, local_path):
+        """Return (size, hash) of a local file, hashing it only if it changed since last time."""
+        local_path = os.path.abspath(local_path)
+        st = os.stat(local_path)
+        rows = self._query('SELECT hash FROM local_files WHERE path = ? AND size = ? AND mtime = ?',
+                           (local_path, st.st_size, st.st_mtime))
+        if rows:
+            return st.st_size, rows[0][0]
+        digest = file_hash(local_path)
+        self._execute('INSERT OR REPLACE INTO local_files VALUES (?, ?, ?, ?)',
+                      (local_path, st.st_size, st.st_mtime, digest))
+        return st.st_size, digest
+
+    def remote(self, remote_path):
+        """Return (rev, size, hash) recorded for remote_path, or None."""
+        rows = self._query('SELECT rev, size, hash FROM remote_files WHERE path = ?',
+                           (normalize_path(remote_path),))
+        return rows[0] if rows else None
+
+    def find(self, content_hash, size):
+        """Return [(display_path, rev)] of the remote files recorded with this content."""
+        return self._query('SELECT display_path, rev FROM remote_files WHERE hash = ? AND size = ?',
+                           (content_hash, size))
+
+    def record(self, metadata, content_hash):
+        """Record that the remote file described by metadata has the given content."""
+        self._execute('INSERT OR REPLACE INTO remote_files VALUES (?, ?, ?, ?, ?)',
+                      (normalize_path(metadata['path']), metadata['path'], metadata['rev'],
+                       metadata['bytes'], content_hash))
+
+    def forget(self, remote_path):
+        self._execute('DELETE FROM remote_files WHERE path = ?', (normalize_path(remote_path),))
+
+    def _query(self, sql, args):
+        self._lock.acquire()
+        try:
+            return self._db.execute(sql, args).fetchall()
+        finally:
+            self._lock.release()
+
+    def _execute(self, sql, args):
+        self._lock.acquire()
+        try:
+            self._db.execute(sql, args)
+            self._db.commit()
+        finally:
+            self._lock.release()
+
+
+class SyncResult(object):
+    """The outcome of syncing one file.
+
+    Attributes:
+        local_path, remote_path: The file.
+        action: SKIPPED (the remote file is up to date), COPIED (the content was
+            copied from another remote path) or UPLOADED; None on failure.
+        metadata: The remote file's metadata, None on failure.
+        error: The exception syncing failed with, None on success.
+        bytes: The number of bytes uploaded.
+    """
+
+    SKIPPED = 'skipped'
+    COPIED = 'copied'
+    UPLOADED = 'uploaded'
+
+    def __init__(self, local_path, remote_path, action=None, metadata=None, error=None, bytes=0):
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.action = action
+        self.metadata = metadata
+        self.error = error
+        self.bytes = bytes
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        return {'local_path': self.local_path,
+                'remote_path': self.remote_path,
+                'action': self.action,
+                'ok': self.ok,
+                'error': str(self.error) if self.error is not None else None,
+                'bytes': self.bytes,
+                }
+
+
+class SyncReport(object):
+    """The outcome of SyncUploader.upload_tree().
+
+    Attributes:
+        results: A list of SyncResult objects, one per local file.
+        elapsed: The wall-clock time the sync took, in seconds.
+    """
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def bytes_uploaded(self):
+        return sum(result.bytes for result in self.results)
+
+    def counts(self):
+        """Return a dictionary mapping actions (and 'failed') to numbers of files."""
+        counts = {SyncResult.SKIPPED: 0, SyncResult.COPIED: 0, SyncResult.UPLOADED: 0, 'failed': 0}
+        for result in self.results:
+            counts[result.action if result.ok else 'failed'] += 1
+        return counts
+
+    def as_dict(self):
+        result = self.counts()
+        result.update({'bytes': self.bytes_uploaded,
+                       'elapsed': self.elapsed,
+                       'results': [r.as_dict() for r in self.results],
+                       })
+        return result
+
+
+class SyncUploader(object):
+    """
+    Uploads local files unless Dropbox already has their content.
+
+    For each file:
+
+    1. If the remote file still has the rev recorded when this uploader last
+       wrote it, and the local content hash matches, it is skipped.
+    2. Otherwise, if the content was recorded at another remote path that
+       still has the recorded rev, and nothing exists at the destination yet,
+       it is copied there with file_copy.
+    3. Otherwise it is uploaded, replacing the remote file.
+
+    Remote files that weren't written by a SyncUploader with the same
+    SyncState are always uploaded once, since their content is unknown.
+    """
+
+    def __init__(self, client, state, max_workers=8):
+        """Initialize a SyncUploader.
+
+        Args:
+            client: The DropboxClient to upload with.
+            state: The SyncState to keep hashes and revs in.
+            max_workers: The number of files synced at the same time by upload_tree(). [default 8]
+        """
+        self.client = client
+        self.state = state
+        self.max_workers = max_workers
+
+    def upload(self, local_path, remote_path):
+        """Sync one file, raising on errors.
+
+        Returns:
+            A SyncResult.
+        """
+        return self._sync(local_path, remote_path, None)
+
+    def _sync(self, local_path, remote_path, listing):
+        size, content_hash = self.state.local_hash(local_path)
+        remote = self._remote_metadata(remote_path, listing)
+
+        if remote is not None:
+            known = self.state.remote(remote_path)
+            if known is not None and known[0] == remote['rev'] and known[2] == content_hash:
+                return SyncResult(local_path, remote_path, SyncResult.SKIPPED, remote)
+        else:
+            for source_path, rev in self.state.find(content_hash, size):
+                source = self._remote_metadata(source_path, listing)
+                if source is None or source['rev'] != rev:
+                    continue
+                try:
+                    metadata = self.client.file_copy(source_path, remote_path)
+                except ErrorResponse, e:
+                    if e.status != 404:
+                        raise
+                    continue
+                self.state.record(metadata, content_hash)
+                return SyncResult(local_path, remote_path, SyncResult.COPIED, metadata)
+
+        f = open(local_path, 'rb')
+        try:
+            if remote is not None:
+                metadata = self.client.put_file(remote_path, f, parent_rev=remote['rev'])
+            else:
+                metadata = self.client.put_file(remote_path, f, overwrite=True)
+        finally:
+            f.close()
+        self.state.record(metadata, content_hash)
+        return SyncResult(local_path, remote_path, SyncResult.UPLOADED, metadata, bytes=size)
+
+    def upload_tree(self, local_root, remote_root):
+        """Sync every file below local_root to the same relative path below remote_root.
+
+        The remote tree is listed once up front (with DropboxClient.walk)
+        instead of asking for every file's metadata. Failures are recorded
+        in the report rather than raised.
+
+        Returns:
+            A SyncReport.
+        """
+        start = time.time()
+        listing = self._list(remote_root)
+
+        files = []
+        for directory, dirnames, filenames in os.walk(local_root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                local_path = os.path.join(directory, name)
+                relative = os.path.relpath(local_path, local_root).replace(os.sep, '/')
+                files.append((local_path, remote_root.rstrip('/') + '/' + relative))
+
+        pool = WorkerPool(self.max_workers)
+        try:
+            futures = [pool.submit(self._upload_safely, local_path, remote_path, listing)
+                       for local_path, remote_path in files]
+            results = [future.result() for future in futures]
+        finally:
+            pool.shutdown()
+        return SyncReport(results, time.time() - start)
+
+    def _upload_safely(self, local_path, remote_path, listing):
+        try:
+            return self._sync(local_path, remote_path, listing)
+        except Exception, e:
+            return SyncResult(local_path, remote_path, error=e)
+
+    def _list(self, remote_root):
+        """Return (root, {normalized path: metadata}) for the files below remote_root."""
+        files = {}
+        try:
+            for entry in self.client.walk(remote_root, max_workers=self.max_workers):
+                if not entry.get('is_dir'):
+                    files[normalize_path(entry['path'])] = entry
+        except ErrorResponse, e:
+            if e.status != 404:
+                raise
+        return normalize_path(remote_root), files
+
+    def _remote_metadata(self, remote_path, listing):
+        """Return the metadata of the remote file at remote_path, or None if there is none.
+
+        Paths below the root of listing (a result of _list()) are looked up in
+        it; others are asked for.
+        """
+        key = normalize_path(remote_path)
+        if listing is not None:
+            root, files = listing
+            if root == '' or key.startswith(root + '/'):
+                return files.get(key)
+        try:
+            metadata = self.client.metadata(remote_path, list=False)
+        except ErrorResponse, e:
+            if e.status != 404:
+                raise
+            return None
+        if metadata.get('is_deleted') or metadata.get('is_dir'):
+            return None
+        return metadata
+
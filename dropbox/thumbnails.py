@@ -0,0 +1,385 @@
+"""
+Thumbnails for many images at once, cached on disk.
+
+A ThumbnailService fetches the thumbnails of a list of images concurrently
+and keeps them in a ThumbnailCache, a size-bounded LRU on the local disk,
+so rendering the same page again costs no requests at all:
+
+    cache = ThumbnailCache('/var/cache/myapp/thumbnails', max_bytes=200 * 1024 * 1024)
+    service = ThumbnailService(client, cache, max_workers=8)
+    listing = client.metadata('/Photos')
+    for result in service.fetch(listing['contents'], size='medium'):
+        if result.ok:
+            render(result.metadata['path'], result.data)
+
+Thumbnails are cached per (path, rev, size, format). Pass metadata
+dictionaries (e.g. the contents of a folder listing) rather than paths
+where possible: their rev tells whether a cached thumbnail is still
+current. For plain paths the rev is taken from the DropboxClient's
+MetadataIndex if it has one; otherwise the cached thumbnail is used while
+it is younger than the service's max_age. Either way, a thumbnail that
+is downloaded replaces those of older revs, which are deleted.
+"""
+
+import hashlib
+try:
+    import json
+except ImportError:
+    import simplejson as json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from dropbox.index import normalize_path
+from dropbox.workers import Future, WorkerPool
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbnails (
+    path TEXT NOT NULL,
+    size TEXT NOT NULL,
+    format TEXT NOT NULL,
+    rev TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    metadata TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (path, size, format)
+);
+CREATE INDEX IF NOT EXISTS thumbnails_used ON thumbnails (used);
+"""
+
+
+class ThumbnailCache(object):
+    """
+    A thread-safe on-disk LRU of thumbnails, bounded by their total size.
+
+    Each thumbnail is a file in directory; an SQLite database next to them
+    (thumbnails.db) records the path, rev, size, format and metadata it
+    belongs to and when it was last used. Only the newest rev of each
+    (path, size, format) is kept.
+
+    Attributes (counters):
+        hits: Thumbnails served from the cache.
+        misses: Lookups that found nothing current in the cache.
+        evictions: Thumbnails deleted to stay within max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024):
+        """Initialize a ThumbnailCache.
+
+        Args:
+            directory: The directory to keep the thumbnails in. It is created if needed.
+            max_bytes: The maximum total size of the cached thumbnails. [default 100 MiB]
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'thumbnails.db'), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Forget thumbnails whose files were deleted behind our back.
+        for path, size, format, filename in self._db.execute(
+                'SELECT path, size, format, filename FROM thumbnails').fetchall():
+            if not os.path.exists(self._file(filename)):
+                self._db.execute('DELETE FROM thumbnails WHERE path = ? AND size = ? AND format = ?',
+                                 (path, size, format))
+        self._db.commit()
+        self.size = self._db.execute('SELECT COALESCE(SUM(bytes), 0) FROM thumbnails').fetchone()[0]
+
+    def get(self, path, size, format, rev=None, max_age=None):
+        """Return (data, metadata) of a cached thumbnail, or None.
+
+        Args:
+            path: The path of the image.
+            size, format: As for DropboxClient.thumbnail().
+            rev: The image's current rev. [optional]
+                A thumbnail of another rev is not returned.
+            max_age: Without a rev, the number of seconds after which a cached
+                thumbnail isn't returned any more. [optional]
+        """
+        key = (normalize_path(path), size, format.upper())
+        self._lock.acquire()
+        try:
+            row = self._db.execute('SELECT rev, filename, metadata, fetched, bytes FROM thumbnails '
+                                   'WHERE path = ? AND size = ? AND format = ?', key).fetchone()
+            if row is None or (rev is not None and row[0] != rev) or \
+                    (rev is None and max_age is not None and time.time() - row[3] > max_age):
+                self.misses += 1
+                return None
+            # Read under the lock: put() and eviction replace a row before removing its file.
+            try:
+                f = open(self._file(row[1]), 'rb')
+                try:
+                    data = f.read()
+                finally:
+                    f.close()
+            except IOError:
+                self._db.execute('DELETE FROM thumbnails WHERE path = ? AND size = ? AND format = ?', key)
+                self._db.commit()
+                self.size -= row[4]
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE thumbnails SET used = ? WHERE path = ? AND size = ? AND format = ?',
+                             (time.time(),) + key)
+            self._db.commit()
+            self.hits += 1
+        finally:
+            self._lock.release()
+        return data, json.loads(row[2])
+
+    def put(self, path, size, format, data, metadata):
+        """Cache a thumbnail of the image described by metadata (which has its rev).
+
+        Thumbnails of other revs of the same image, size and format are
+        replaced, and the least recently used thumbnails are evicted to stay
+        within max_bytes.
+        """
+        key = (normalize_path(path), size, format.upper())
+        rev = metadata['rev']
+        filename = '%s.%s' % (hashlib.sha1(json.dumps(key + (rev,))).hexdigest(),
+                              'png' if key[2] == 'PNG' else 'jpg')
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            if os.name == 'nt' and os.path.exists(self._file(filename)):
+                os.remove(self._file(filename))
+            os.rename(tmp_path, self._file(filename))
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        now = time.time()
+        obsolete = []
+        self._lock.acquire()
+        try:
+            old = self._db.execute('SELECT filename, bytes FROM thumbnails '
+                                   'WHERE path = ? AND size = ? AND format = ?', key).fetchone()
+            if old is not None:
+                self.size -= old[1]
+                if old[0] != filename:
+                    obsolete.append(old[0])
+            self._db.execute('INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             key + (rev, filename, len(data), json.dumps(metadata), now, now))
+            self.size += len(data)
+            obsolete.extend(self._evict())
+            self._db.commit()
+        finally:
+            self._lock.release()
+        self._remove_files(obsolete)
+
+    def invalidate(self, path):
+        """Delete the cached thumbnails of path in all sizes and formats."""
+        self._lock.acquire()
+        try:
+            rows = self._db.execute('SELECT filename, bytes FROM thumbnails WHERE path = ?',
+                                    (normalize_path(path),)).fetchall()
+            self._db.execute('DELETE FROM thumbnails WHERE path = ?', (normalize_path(path),))
+            self._db.commit()
+            self.size -= sum(row[1] for row in rows)
+        finally:
+            self._lock.release()
+        self._remove_files([row[0] for row in rows])
+
+    def clear(self):
+        """Delete all cached thumbnails."""
+        self._lock.acquire()
+        try:
+            rows = self._db.execute('SELECT filename FROM thumbnails').fetchall()
+            self._db.execute('DELETE FROM thumbnails')
+            self._db.commit()
+            self.size = 0
+        finally:
+            self._lock.release()
+        self._remove_files([row[0] for row in rows])
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self):
+        self._lock.acquire()
+        try:
+            return self._db.execute('SELECT COUNT(*) FROM thumbnails').fetchone()[0]
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Return a dictionary with the cache's counters and size."""
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'bytes': self.size,
+                'entries': len(self),
+                }
+
+    def _evict(self):
+        """Drop least recently used rows until size fits; returns their filenames. Needs the lock."""
+        evicted = []
+        while self.size > self.max_bytes:
+            row = self._db.execute('SELECT path, size, format, filename, bytes FROM thumbnails '
+                                   'ORDER BY used LIMIT 1').fetchone()
+            if row is None:
+                break
+            self._db.execute('DELETE FROM thumbnails WHERE path = ? AND size = ? AND format = ?', row[:3])
+            self.size -= row[4]
+            self.evictions += 1
+            evicted.append(row[3])
+        return evicted
+
+    def _file(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _remove_files(self, filenames):
+        for filename in filenames:
+            try:
+                os.remove(self._file(filename))
+            except OSError:
+                pass
+
+
+class ThumbnailResult(object):
+    """The thumbnail of one image.
+
+    Attributes:
+        path: The path of the image.
+        data: The thumbnail image data, None on failure.
+        metadata: The metadata of the image, None on failure.
+        error: The exception fetching failed with (e.g. an ErrorResponse with
+            status 404 or 415 for files without thumbnails), None on success.
+        cached: Whether the thumbnail was served from the cache.
+    """
+
+    def __init__(self, path, data=None, metadata=None, error=None, cached=False):
+        self.path = path
+        self.data = data
+        self.metadata = metadata
+        self.error = error
+        self.cached = cached
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return '<ThumbnailResult %r %d bytes%s>' % (self.path, len(self.data),
+                                                         ' (cached)' if self.cached else '')
+        return '<ThumbnailResult %r %s>' % (self.path, self.error)
+
+
+class ThumbnailService(object):
+    """
+    Fetches thumbnails concurrently through a ThumbnailCache.
+
+    Downloads run on a WorkerPool owned by the service, so call close()
+    (or use it in a with block) when done. Concurrent requests for the same
+    thumbnail share one download.
+    """
+
+    def __init__(self, client, cache, max_workers=8, max_age=None):
+        """Initialize a ThumbnailService.
+
+        Args:
+            client: The DropboxClient to download thumbnails with.
+            cache: The ThumbnailCache to keep them in.
+            max_workers: The number of thumbnails downloaded at the same time. [default 8]
+            max_age: Seconds after which a cached thumbnail of an image whose rev
+                isn't known is downloaded again. [optional]
+                None means it is used until it is evicted or replaced.
+        """
+        self.client = client
+        self.cache = cache
+        self.max_age = max_age
+        self._pool = WorkerPool(max_workers)
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def get(self, image, size='large', format='JPEG'):
+        """Return the ThumbnailResult for one image (a path or a metadata dictionary)."""
+        return self.fetch([image], size, format)[0]
+
+    def fetch(self, images, size='large', format='JPEG'):
+        """Return the thumbnails of many images, downloading the ones not cached concurrently.
+
+        Args:
+            images: Paths or metadata dictionaries (with 'path' and 'rev') of the images.
+            size, format: As for DropboxClient.thumbnail().
+
+        Returns:
+            A list of ThumbnailResult objects, in the order of images. Failures
+            are recorded in them rather than raised.
+        """
+        return [future.result() for future in self.prefetch(images, size, format)]
+
+    def prefetch(self, images, size='large', format='JPEG'):
+        """Start getting the thumbnails of images without waiting for them.
+
+        Returns:
+            A list of dropbox.workers.Future objects, one per image, whose
+            results are ThumbnailResult objects.
+        """
+        format = format.upper()
+        futures = []
+        for image in images:
+            path, rev = self._path_and_rev(image)
+            cached = self.cache.get(path, size, format, rev, self.max_age if rev is None else None)
+            if cached is not None:
+                future = Future()
+                future.set_result(ThumbnailResult(path, cached[0], cached[1], cached=True))
+            else:
+                future = self._download(path, size, format)
+            futures.append(future)
+        return futures
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _path_and_rev(self, image):
+        if isinstance(image, basestring):
+            index = getattr(self.client, 'index', None)
+            return image, index.rev(image) if index is not None else None
+        return image['path'], image.get('rev')
+
+    def _download(self, path, size, format):
+        key = (normalize_path(path), size, format)
+        self._lock.acquire()
+        try:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = self._pool.submit(self._fetch_one, key, path, size, format)
+        finally:
+            self._lock.release()
+        return future
+
+    def _fetch_one(self, key, path, size, format):
+        try:
+            response, metadata = self.client.thumbnail_and_metadata(path, size, format)
+            data = response[2]
+            self.cache.put(path, size, format, data, metadata)
+            return ThumbnailResult(path, data, metadata)
+        except Exception, e:
+            return ThumbnailResult(path, error=e)
+        finally:
+            self._lock.acquire()
+            try:
+                self._inflight.pop(key, None)
+            finally:
+                self._lock.release()
@@ -0,0 +1,476 @@
+"""
+Moves many files between the local disk and Dropbox at once.
+
+A dropbox.transfer.TransferManager takes a batch of upload and download
+jobs, runs them on a pool of worker threads that share the DropboxClient's
+connections and returns a TransferReport with the outcome of every job:
+
+    manager = TransferManager(client, max_workers=16, bandwidth=4 * 1024 * 1024)
+    for name in os.listdir('photos'):
+        manager.add_upload(os.path.join('photos', name), '/Photos/' + name)
+    report = manager.run()
+    for result in report.failed:
+        print result.job, result.error
+
+A dropbox.transfer.SegmentedDownloader fetches a single large file as
+several concurrent Range requests, which fills a high-latency link better
+than one stream, and resumes an interrupted download where it stopped:
+
+    SegmentedDownloader(client, '/Videos/talk.mp4', 'talk.mp4', segments=8).download()
+"""
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+import os
+import tempfile
+import threading
+import time
+
+from dropbox.ratelimit import TokenBucket
+from dropbox.rest import RESTResponse, RetryPolicy
+from dropbox.workers import WorkerPool
+
+
+class TransferJob(object):
+    """A single upload or download."""
+
+    UPLOAD = 'upload'
+    DOWNLOAD = 'download'
+
+    def __init__(self, direction, local_path, remote_path, overwrite=False, rev=None):
+        assert direction in (self.UPLOAD, self.DOWNLOAD), "expected a direction of 'upload' or 'download'"
+        self.direction = direction
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.overwrite = overwrite
+        self.rev = rev
+
+    def __repr__(self):
+        if self.direction == self.UPLOAD:
+            return '<TransferJob upload %r -> %r>' % (self.local_path, self.remote_path)
+        return '<TransferJob download %r -> %r>' % (self.remote_path, self.local_path)
+
+
+class TransferResult(object):
+    """The outcome of a TransferJob.
+
+    Attributes:
+        job: The TransferJob.
+        metadata: The metadata of the uploaded or downloaded file, None on failure.
+        error: The exception the job failed with, None on success.
+        bytes: The number of bytes transferred.
+        elapsed: The number of seconds the job took.
+    """
+
+    def __init__(self, job, metadata=None, error=None, bytes=0, elapsed=0.0):
+        self.job = job
+        self.metadata = metadata
+        self.error = error
+        self.bytes = bytes
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        return {'direction': self.job.direction,
+                'local_path': self.job.local_path,
+                'remote_path': self.job.remote_path,
+                'ok': self.ok,
+                'error': str(self.error) if self.error is not None else None,
+                'bytes': self.bytes,
+                'elapsed': self.elapsed,
+                }
+
+
+class TransferReport(object):
+    """The outcome of TransferManager.run().
+
+    Attributes:
+        results: A list of TransferResult objects in the order the jobs were added.
+        elapsed: The wall-clock time the whole batch took, in seconds.
+    """
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def bytes_transferred(self):
+        return sum(result.bytes for result in self.results)
+
+    @property
+    def throughput(self):
+        """Bytes per second over the whole batch."""
+        if not self.elapsed:
+            return 0.0
+        return self.bytes_transferred / self.elapsed
+
+    def as_dict(self):
+        return {'jobs': len(self.results),
+                'succeeded': len(self.succeeded),
+                'failed': len(self.failed),
+                'bytes': self.bytes_transferred,
+                'elapsed': self.elapsed,
+                'throughput': self.throughput,
+                'results': [result.as_dict() for result in self.results],
+                }
+
+
+class TransferManager(object):
+    """
+    Runs a batch of TransferJobs on a bounded pool of worker threads.
+
+    All workers go through the same DropboxClient, so they share its
+    connection pool; give that pool at least max_workers idle connections
+    per host (see dropbox.rest.ConnectionPool) to avoid reconnecting.
+    """
+
+    def __init__(self, client, max_workers=8, bandwidth=None, progress=None):
+        """Initialize a TransferManager.
+
+        Args:
+            client: The DropboxClient to transfer files with.
+            max_workers: The number of transfers running at the same time. [default 8]
+            bandwidth: A cap on the combined transfer rate of all jobs, in bytes
+                per second. [optional]
+            progress: A callable that is passed (bytes_transferred, jobs_done, jobs_total)
+                whenever a chunk was transferred or a job finished. It is called
+                from the worker threads. [optional]
+        """
+        self.client = client
+        self.max_workers = max_workers
+        self.bandwidth = bandwidth
+        self.progress = progress
+        self.jobs = []
+        self._lock = threading.Lock()
+        self._bucket = None
+        self._bytes = 0
+        self._jobs_done = 0
+        self._jobs_total = 0
+
+    def add_upload(self, local_path, remote_path, overwrite=False):
+        """Queue an upload of local_path to remote_path (see DropboxClient.put_file)."""
+        job = TransferJob(TransferJob.UPLOAD, local_path, remote_path, overwrite=overwrite)
+        self.jobs.append(job)
+        return job
+
+    def add_download(self, remote_path, local_path, rev=None):
+        """Queue a download of remote_path to local_path (see DropboxClient.get_file_to_path)."""
+        job = TransferJob(TransferJob.DOWNLOAD, local_path, remote_path, rev=rev)
+        self.jobs.append(job)
+        return job
+
+    def run(self, jobs=None):
+        """Run the queued jobs (or the given list of TransferJobs) and wait for them.
+
+        A failing job doesn't stop the others; its exception is recorded in its
+        TransferResult.
+
+        Returns:
+            A TransferReport.
+        """
+        if jobs is None:
+            jobs, self.jobs = self.jobs, []
+
+        self._bucket = TokenBucket(self.bandwidth) if self.bandwidth else None
+        self._bytes = 0
+        self._jobs_done = 0
+        self._jobs_total = len(jobs)
+
+        start = time.time()
+        pool = WorkerPool(self.max_workers)
+        try:
+            futures = [pool.submit(self._run_job, job) for job in jobs]
+            results = [future.result() for future in futures]
+        finally:
+            pool.shutdown()
+        return TransferReport(results, time.time() - start)
+
+    def _run_job(self, job):
+        counter = [0]
+
+        def transferred(n):
+            counter[0] += n
+            if self._bucket is not None and n > 0:
+                self._bucket.consume(n)
+            self._report(n, 0)
+
+        start = time.time()
+        try:
+            if job.direction == TransferJob.UPLOAD:
+                f = open(job.local_path, 'rb')
+                try:
+                    metadata = self.client.put_file(job.remote_path, _CountingFile(f, transferred),
+                                                    overwrite=job.overwrite)
+                finally:
+                    f.close()
+            else:
+                directory = os.path.dirname(job.local_path)
+                if directory and not os.path.isdir(directory):
+                    try:
+                        os.makedirs(directory)
+                    except OSError:
+                        if not os.path.isdir(directory):
+                            raise
+                metadata = self.client.get_file_to_path(job.remote_path, job.local_path, rev=job.rev,
+                                                        callback=transferred)
+        except Exception, e:
+            result = TransferResult(job, error=e, bytes=counter[0], elapsed=time.time() - start)
+        else:
+            result = TransferResult(job, metadata, bytes=counter[0], elapsed=time.time() - start)
+        self._report(0, 1)
+        return result
+
+    def _report(self, nbytes, njobs):
+        self._lock.acquire()
+        try:
+            self._bytes += nbytes
+            self._jobs_done += njobs
+            snapshot = (self._bytes, self._jobs_done, self._jobs_total)
+        finally:
+            self._lock.release()
+        if self.progress:
+            self.progress(*snapshot)
+
+
+class _CountingFile(object):
+    """Wraps a file and reports the size of every block read from it.
+
+    Seeking back before data that was already reported (when a request is
+    resent after a reconnect) reports the rewound distance as a negative size.
+    """
+
+    def __init__(self, f, callback):
+        self._f = f
+        self._callback = callback
+        self._read_to = None  # the position up to which reads were reported
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        if data:
+            self._callback(len(data))
+            self._read_to = self._f.tell()
+        return data
+
+    def tell(self):
+        return self._f.tell()
+
+    def seek(self, offset, whence=0):
+        result = self._f.seek(offset, whence)
+        if self._read_to is not None:
+            rewound = self._read_to - self._f.tell()
+            if rewound > 0:
+                self._read_to -= rewound
+                self._callback(-rewound)
+        return result
+
+    def fileno(self):
+        return self._f.fileno()
+
+
+class SegmentedDownloader(object):
+    """
+    Downloads one file as several byte ranges at once into a preallocated
+    local file.
+
+    Each segment is written through its own file object (Python 2 has no
+    os.pwrite), so the segments don't share a file position. Progress is
+    saved to a small state file next to the download (to_path + '.segments')
+    every few MiB; if a download is interrupted, the next download() of the
+    same rev continues each segment where it stopped. A segment whose
+    request or body read fails is retried from the last byte written.
+    """
+
+    STATE_SUFFIX = '.segments'
+    MIN_SEGMENT_SIZE = 1024 * 1024
+    SAVE_INTERVAL = 4 * 1024 * 1024
+
+    def __init__(self, client, from_path, to_path, segments=4, rev=None, retry_policy=None,
+                 chunk_size=RESTResponse.CHUNK_SIZE, progress=None):
+        """Initialize a SegmentedDownloader.
+
+        Args:
+            client: The DropboxClient to download with.
+            from_path: The path of the file in Dropbox.
+            to_path: The local path to write the file to.
+            segments: The number of ranges downloaded at the same time. [default 4]
+                Files smaller than MIN_SEGMENT_SIZE per segment use fewer segments.
+            rev: The rev of the file to download. [default: the latest one]
+            retry_policy: A dropbox.rest.RetryPolicy whose max_retries, is_failure()
+                and backoff_delay() decide how failed segments are retried.
+                [default RetryPolicy()]
+            chunk_size: The size of each segment's read buffer in bytes. [default 64 KiB]
+            progress: A callable that is passed the number of bytes after each
+                chunk was written. It is called from the worker threads. [optional]
+        """
+        self.client = client
+        self.from_path = from_path
+        self.to_path = to_path
+        self.segments = segments
+        self.rev = rev
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self._lock = threading.Lock()
+        self._state = None
+        self._unsaved = 0
+
+    def download(self):
+        """Download the file, resuming a previous interrupted download of the same rev.
+
+        Returns:
+            A dictionary containing the metadata of the downloaded file.
+
+        Raises:
+            A dropbox.rest.ErrorResponse or dropbox.rest.RESTSocketError if a
+            segment still fails after its retries. The state file is kept, so
+            calling download() again resumes.
+        """
+        metadata = self.client.metadata(self.from_path, list=False, rev=self.rev)
+        size = metadata['bytes']
+        rev = metadata['rev']
+
+        self._state = self._load_state(rev, size)
+        if self._state is None:
+            self._state = {'rev': rev, 'size': size, 'ranges': self._plan(size)}
+            out = open(self.to_path, 'wb')
+            try:
+                out.truncate(size)
+            finally:
+                out.close()
+            self._save_state()
+
+        pending = [i for i, (pos, end) in enumerate(self._state['ranges']) if pos < end]
+        pool = WorkerPool(max(1, len(pending)))
+        try:
+            futures = [pool.submit(self._download_segment, rev, i) for i in pending]
+            errors = [future.exception() for future in futures]
+        finally:
+            pool.shutdown()
+            self._save_state()
+
+        for future, error in zip(futures, errors):
+            if error is not None:
+                future.result()  # re-raise with its traceback
+        os.remove(self.to_path + self.STATE_SUFFIX)
+        return metadata
+
+    def _plan(self, size):
+        count = max(1, min(self.segments, size // self.MIN_SEGMENT_SIZE))
+        bounds = [size * i // count for i in range(count + 1)]
+        return [[bounds[i], bounds[i + 1]] for i in range(count)]
+
+    def _download_segment(self, rev, i):
+        buf = bytearray(self.chunk_size)
+        attempt = 0
+        # Unbuffered, so that a saved position never covers bytes still in a Python buffer.
+        out = open(self.to_path, 'r+b', 0)
+        try:
+            while True:
+                pos, end = self._state['ranges'][i]
+                if pos >= end:
+                    return
+                try:
+                    response = self.client.get_file(self.from_path, rev, stream=True,
+                                                    start=pos, length=end - pos)
+                    try:
+                        if response.status != 206 and pos != 0:
+                            raise IOError('the server ignored the Range header')
+                        out.seek(pos)
+                        while pos < end:
+                            # Never read past the segment, in case the server sent more.
+                            chunk = buf if end - pos >= len(buf) else bytearray(end - pos)
+                            n = response.readinto(chunk)
+                            if not n:
+                                break
+                            out.write(buffer(chunk, 0, n))
+                            pos += n
+                            self._advance(i, pos, n)
+                    finally:
+                        response.close()
+                    if pos < end:
+                        raise IOError('segment ended after %d of %d bytes' % (pos, end))
+                except Exception, e:
+                    policy = self.retry_policy
+                    if attempt >= policy.max_retries or not (policy.is_failure(e) or isinstance(e, IOError)):
+                        raise
+                    time.sleep(policy.backoff_delay(attempt))
+                    attempt += 1
+        finally:
+            out.close()
+
+    def _advance(self, i, pos, n):
+        self._lock.acquire()
+        try:
+            self._state['ranges'][i][0] = pos
+            self._unsaved += n
+            save = self._unsaved >= self.SAVE_INTERVAL
+            if save:
+                self._unsaved = 0
+        finally:
+            self._lock.release()
+        if save:
+            self._save_state()
+        if self.progress:
+            self.progress(n)
+
+    def _load_state(self, rev, size):
+        """Return the saved state if it belongs to this rev and the partial file is there."""
+        try:
+            f = open(self.to_path + self.STATE_SUFFIX, 'rb')
+            try:
+                state = json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return None
+        if state.get('rev') != rev or state.get('size') != size:
+            return None
+        if not os.path.exists(self.to_path) or os.path.getsize(self.to_path) != size:
+            return None
+        return state
+
+    def _save_state(self):
+        """Replace the state file atomically, so a crash never leaves a truncated one."""
+        state_path = self.to_path + self.STATE_SUFFIX
+        self._lock.acquire()
+        try:
+            # The segments' writes are unbuffered but may still be in the OS cache;
+            # they must be on disk before a state that counts them is.
+            out = open(self.to_path, 'r+b', 0)
+            try:
+                out.flush()
+                os.fsync(out.fileno())
+            finally:
+                out.close()
+            directory = os.path.dirname(os.path.abspath(state_path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.segments-')
+            try:
+                f = os.fdopen(fd, 'wb')
+                try:
+                    json.dump(self._state, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                finally:
+                    f.close()
+                if os.name == 'nt' and os.path.exists(state_path):
+                    os.remove(state_path)  # rename doesn't replace on Windows
+                os.rename(tmp_path, state_path)
+            except:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        finally:
+            self._lock.release()
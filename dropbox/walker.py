@@ -0,0 +1,110 @@
+"""
+Enumerates a whole Dropbox folder tree by listing many folders at once.
+
+    for entry in client.walk('/Photos', max_workers=16, prune='*.tmp'):
+        print entry['path'], entry['bytes']
+
+Use it with a dropbox.cache.MetadataCache on the client to make repeated
+walks over mostly unchanged trees cheap.
+"""
+
+import fnmatch
+import posixpath
+import Queue
+import sys
+import threading
+
+from dropbox.rest import ErrorResponse
+from dropbox.workers import WorkerPool
+
+MAX_FILE_LIMIT = 25000  # the most entries the server lists for a single folder
+
+
+def walk(client, path, max_workers=8, prune=None, file_limit=10000, include_deleted=False,
+         on_error=None):
+    """Yield the metadata of every file and folder below path.
+
+    Folders are listed concurrently, with at most max_workers requests in
+    flight, and entries are yielded as soon as their folder's listing
+    arrives, so the order is not deterministic. A folder's entry is always
+    yielded before the entries inside it.
+
+    Args:
+        client: The DropboxClient to list folders with.
+        path: The folder to walk. Its own metadata isn't yielded.
+        max_workers: The maximum number of metadata() calls in flight. [default 8]
+        prune: Entries to skip, together with everything below them. [optional]
+            Either a glob pattern, a list of glob patterns or a callable that is
+            passed an entry's metadata and returns True to skip it. Patterns
+            containing a slash are matched against the full path, others against
+            the last path component; matching is case-insensitive like Dropbox paths.
+        file_limit: The file_limit passed to metadata(). [default 10000]
+            A folder that has more entries than that (a 406) is listed again
+            with the server's maximum of 25,000.
+        include_deleted: Whether to include deleted files and folders. [default False]
+            Deleted folders are not descended into.
+        on_error: A callable that is passed (folder_path, exception) for folders
+            that can't be listed. [optional]
+            Without it, the first such error is raised and the walk stops.
+    """
+    if prune is not None and not callable(prune):
+        prune = _glob_predicate(prune)
+
+    pool = WorkerPool(max_workers)
+    results = Queue.Queue()
+    stopped = threading.Event()
+
+    def list_folder(folder_path):
+        if stopped.isSet():
+            return
+        try:
+            try:
+                metadata = client.metadata(folder_path, file_limit=file_limit,
+                                           include_deleted=include_deleted)
+            except ErrorResponse, e:
+                if e.status != 406 or file_limit >= MAX_FILE_LIMIT:
+                    raise
+                metadata = client.metadata(folder_path, file_limit=MAX_FILE_LIMIT,
+                                           include_deleted=include_deleted)
+        except Exception:
+            results.put((folder_path, None, sys.exc_info()))
+        else:
+            results.put((folder_path, metadata, None))
+
+    pending = 1
+    pool.submit(list_folder, path)
+    try:
+        while pending:
+            folder_path, metadata, exc_info = results.get()
+            pending -= 1
+            if exc_info is not None:
+                if on_error is None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                on_error(folder_path, exc_info[1])
+                continue
+
+            for entry in metadata.get('contents', ()):
+                if prune is not None and prune(entry):
+                    continue
+                yield entry
+                if entry.get('is_dir') and not entry.get('is_deleted'):
+                    pool.submit(list_folder, entry['path'])
+                    pending += 1
+    finally:
+        stopped.set()
+        pool.shutdown(wait=False)
+
+
+def _glob_predicate(patterns):
+    if isinstance(patterns, basestring):
+        patterns = [patterns]
+    patterns = [pattern.lower() for pattern in patterns]
+
+    def predicate(entry):
+        path = entry['path'].lower()
+        name = posixpath.basename(path)
+        for pattern in patterns:
+            if fnmatch.fnmatchcase(path if '/' in pattern else name, pattern):
+                return True
+        return False
+    return predicate
@@ -0,0 +1,158 @@
+"""
+A small thread pool used by the modules that run several Dropbox calls at
+once (dropbox.transfer and friends). All the threads share the connection
+pool of the DropboxClient they call, so make sure that pool keeps at least
+as many idle connections per host as there are workers.
+"""
+
+import Queue
+import sys
+import threading
+
+
+class Future(object):
+    """The result of a call submitted to a WorkerPool."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        """Return whether the call has finished."""
+        return self._event.isSet()
+
+    def result(self, timeout=None):
+        """Wait for the call to finish and return its result.
+
+        If the call raised an exception, it is re-raised here with its
+        original traceback.
+
+        Raises:
+            WorkerTimeout: The call didn't finish within timeout seconds.
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """Wait for the call to finish and return the exception it raised, or None."""
+        self._wait(timeout)
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def add_done_callback(self, fn):
+        """Call fn(future) once the call has finished (right away if it already has)."""
+        self._lock.acquire()
+        try:
+            if not self._event.isSet():
+                self._callbacks.append(fn)
+                return
+        finally:
+            self._lock.release()
+        fn(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exc_info(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        self._lock.acquire()
+        try:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for fn in callbacks:
+            fn(self)
+
+    def _wait(self, timeout):
+        self._event.wait(timeout)
+        if not self._event.isSet():
+            raise WorkerTimeout('call did not finish within %s seconds' % timeout)
+
+
+class WorkerTimeout(Exception):
+    """Raised by Future.result() and Future.exception() when the timeout expires."""
+    pass
+
+
+class WorkerPool(object):
+    """
+    A fixed-size pool of daemon threads that run submitted calls in FIFO
+    order. Threads are started lazily, up to max_workers.
+
+        pool = WorkerPool(8)
+        futures = [pool.submit(client.metadata, path) for path in paths]
+        listings = [f.result() for f in futures]
+        pool.shutdown()
+    """
+
+    def __init__(self, max_workers=8):
+        assert max_workers > 0, "max_workers must be at least 1"
+        self.max_workers = max_workers
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) and return a Future for its result."""
+        future = Future()
+        self._lock.acquire()
+        try:
+            if self._shutdown:
+                raise RuntimeError('cannot submit to a WorkerPool after shutdown()')
+            self._queue.put((future, fn, args, kwargs))
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work)
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+        finally:
+            self._lock.release()
+        return future
+
+    def shutdown(self, wait=True):
+        """Stop accepting calls; the workers exit once the queue is drained."""
+        self._lock.acquire()
+        try:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            for thread in self._threads:
+                self._queue.put(None)
+        finally:
+            self._lock.release()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            try:
+                result = fn(*args, **kwargs)
+            except:
+                future.set_exc_info(sys.exc_info())
+            else:
+                future.set_result(result)
+            del item, future, fn, args, kwargs
+
@@ -0,0 +1,60 @@
+"""
+Tests for dropbox.client.ChunkedUploader and parameter encoding.
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+import urllib
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dropbox.client import DropboxClient, _urlencode
+from dropbox.fakeserver import FakeDropboxServer
+from dropbox.rest import RESTClientObject
+from dropbox.session import DropboxSession
+
+
+class ChunkedUploaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeDropboxServer().start()
+        rest_client = RESTClientObject()
+        session = DropboxSession('consumer_key', 'consumer_secret', 'dropbox', rest_client=rest_client)
+        session.set_token('token_key', 'token_secret')
+        self.server.configure(session)
+        self.client = DropboxClient(session, rest_client=rest_client)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def upload(self, data, length=None, chunk_size=4):
+        uploader = self.client.get_chunked_uploader(StringIO(data), length)
+        uploader.upload_chunked(chunk_size)
+        return uploader.finish('/upload.txt')
+
+    def test_upload(self):
+        self.assertEqual(self.upload('0123456789')['bytes'], 10)
+        self.assertEqual(self.server.store.read('dropbox', '/upload.txt')[1], '0123456789')
+
+    def test_empty_file(self):
+        self.assertEqual(self.upload('', 0)['bytes'], 0)
+        self.assertEqual(self.server.store.read('dropbox', '/upload.txt')[1], '')
+
+    def test_empty_file_without_length(self):
+        self.assertEqual(self.upload('')['bytes'], 0)
+
+
+class UrlencodeTest(unittest.TestCase):
+
+    def test_matches_urllib(self):
+        for params in [{'a': 'b c', 'd': 1, 'e': True}, {'a': ['b', 'c']}, {'a': None}]:
+            self.assertEqual(_urlencode(params), urllib.urlencode(params))
+            self.assertEqual(_urlencode(params), urllib.urlencode(params))
+
+
+if __name__ == '__main__':
+    unittest.main()
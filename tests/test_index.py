@@ -0,0 +1,48 @@
+"""
+Tests for DropboxClient.path_exists() with a dropbox.index.MetadataIndex.
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dropbox.client import DropboxClient
+from dropbox.fakeserver import FakeDropboxServer
+from dropbox.index import MetadataIndex
+from dropbox.rest import RESTClientObject
+from dropbox.session import DropboxSession
+
+
+class PathExistsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeDropboxServer().start()
+        rest_client = RESTClientObject()
+        session = DropboxSession('consumer_key', 'consumer_secret', 'dropbox', rest_client=rest_client)
+        session.set_token('token_key', 'token_secret')
+        self.server.configure(session)
+        self.client = DropboxClient(session, rest_client=rest_client, index=MetadataIndex())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_root_with_empty_index(self):
+        metadata = self.client.path_exists('/')
+        self.assertNotEqual(metadata, None)
+        self.assertTrue(metadata['is_dir'])
+
+    def test_indexed_file(self):
+        self.server.store.write('dropbox', '/a/b.txt', 'abc')
+        self.client.metadata('/a')
+        requests = self.server.stats()['requests']
+        self.assertEqual(self.client.path_exists('/a/b.txt')['bytes'], 3)
+        self.assertEqual(self.client.path_exists('/a/c.txt'), None)
+        self.assertEqual(self.server.stats()['requests'], requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
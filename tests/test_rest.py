@@ -0,0 +1,117 @@
+"""
+Tests for dropbox.rest.RESTClientObject's connection reuse.
+
+    python -m unittest discover tests
+"""
+
+import os
+import socket
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dropbox.rest import RESTClientObject, RESTSocketError, RetryPolicy
+
+_RESPONSE = ('HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+             'Content-Length: 12\r\n\r\n{"ok": true}')
+
+
+class DroppingServer(object):
+    """
+    A raw HTTP server that answers the first request on a connection (keeping
+    it alive), then reads the second one and closes the connection without
+    answering. Requests on later connections are answered normally.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self._sock = socket.socket()
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(5)
+        self.port = self._sock.getsockname()[1]
+        self._connections = 0
+        thread = threading.Thread(target=self._serve)
+        thread.setDaemon(True)
+        thread.start()
+
+    def close(self):
+        self._sock.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn = self._sock.accept()[0]
+            except socket.error:
+                return
+            self._connections += 1
+            first_connection = self._connections == 1
+            f = conn.makefile('rb')
+            try:
+                handled = 0
+                while True:
+                    request = self._read_request(f)
+                    if request is None:
+                        break
+                    self.requests.append(request)
+                    handled += 1
+                    if first_connection and handled == 2:
+                        break
+                    conn.sendall(_RESPONSE)
+            finally:
+                f.close()
+                conn.close()
+
+    @staticmethod
+    def _read_request(f):
+        request_line = f.readline()
+        if not request_line:
+            return None
+        length = 0
+        while True:
+            line = f.readline()
+            if line in ('\r\n', '\n', ''):
+                break
+            name, value = line.split(':', 1)
+            if name.lower() == 'content-length':
+                length = int(value)
+        return request_line.split()[:2] + [f.read(length)]
+
+
+class ReusedConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = DroppingServer()
+        self.base = 'http://127.0.0.1:%d/1' % self.server.port
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_post_dropped_after_sending_is_not_resent(self):
+        rest_client = RESTClientObject()
+        rest_client.GET(self.base + '/metadata/dropbox/', {})
+        self.assertRaises(RESTSocketError, rest_client.POST, self.base + '/fileops/move',
+                          {'root': 'dropbox', 'from_path': '/c', 'to_path': '/d'})
+        moves = [request for request in self.server.requests if request[1] == '/1/fileops/move']
+        self.assertEqual(len(moves), 1)
+        self.assertEqual(rest_client.pool.stats()['reconnects'], 0)
+
+    def test_non_idempotent_per_retry_policy_is_not_resent(self):
+        rest_client = RESTClientObject(retry_policy=RetryPolicy(max_retries=0))
+        rest_client.GET(self.base + '/metadata/dropbox/', {})
+        self.assertRaises(RESTSocketError, rest_client.POST, self.base + '/fileops/copy',
+                          {'root': 'dropbox', 'from_path': '/c', 'to_path': '/d'})
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_idempotent_request_is_resent(self):
+        rest_client = RESTClientObject()
+        rest_client.GET(self.base + '/metadata/dropbox/', {})
+        self.assertEqual(rest_client.POST(self.base + '/search/dropbox/', {'query': 'abc'}), {'ok': True})
+        searches = [request for request in self.server.requests if request[1] == '/1/search/dropbox/']
+        self.assertEqual(len(searches), 2)
+        self.assertEqual(rest_client.pool.stats()['reconnects'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Tests for dropbox.thumbnails.ThumbnailCache.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dropbox.thumbnails import ThumbnailCache
+
+
+class ThumbnailCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ThumbnailCache(self.directory)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def test_missing_file_only_drops_its_entry(self):
+        self.cache.put('/a.jpg', 'small', 'JPEG', 'small', {'rev': '1'})
+        self.cache.put('/a.jpg', 'large', 'JPEG', 'large', {'rev': '1'})
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.jpg'):
+                os.remove(os.path.join(self.directory, filename))
+                break
+        results = [self.cache.get('/a.jpg', size, 'JPEG') for size in ('small', 'large')]
+        self.assertEqual([result is None for result in results].count(True), 1)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.stats()['bytes'], 5)
+
+    def test_get_during_rev_replacement(self):
+        self.cache.put('/a.jpg', 'small', 'JPEG', 'rev 0', {'rev': '0'})
+        errors = []
+
+        def put():
+            for i in range(1, 200):
+                self.cache.put('/a.jpg', 'small', 'JPEG', 'rev %d' % i, {'rev': str(i)})
+
+        def get():
+            for i in range(400):
+                result = self.cache.get('/a.jpg', 'small', 'JPEG')
+                if result is None:
+                    errors.append(i)
+                elif result[0] != 'rev ' + result[1]['rev']:
+                    errors.append(result)
+
+        threads = [threading.Thread(target=put), threading.Thread(target=get)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.cache.get('/a.jpg', 'small', 'JPEG')[0], 'rev 199')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Tests for dropbox.transfer.SegmentedDownloader.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dropbox.client import DropboxClient
+from dropbox.fakeserver import FakeDropboxServer
+from dropbox.rest import RESTClientObject
+from dropbox.session import DropboxSession
+from dropbox.transfer import SegmentedDownloader
+
+
+class SegmentedDownloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeDropboxServer().start()
+        rest_client = RESTClientObject()
+        session = DropboxSession('consumer_key', 'consumer_secret', 'dropbox', rest_client=rest_client)
+        session.set_token('token_key', 'token_secret')
+        self.server.configure(session)
+        self.client = DropboxClient(session, rest_client=rest_client)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_data_is_synced_before_each_state_save(self):
+        data = os.urandom(3 * 1024 * 1024)
+        self.server.store.write('dropbox', '/big.bin', data)
+        to_path = os.path.join(self.directory, 'big.bin')
+        downloader = SegmentedDownloader(self.client, '/big.bin', to_path, segments=3)
+        downloader.SAVE_INTERVAL = 256 * 1024
+
+        synced = []
+        fsync = os.fsync
+        def recording_fsync(fd):
+            synced.append(os.fstat(fd).st_ino)
+            fsync(fd)
+        os.fsync = recording_fsync
+        try:
+            downloader.download()
+        finally:
+            os.fsync = fsync
+
+        self.assertEqual(open(to_path, 'rb').read(), data)
+        self.assertFalse(os.path.exists(to_path + SegmentedDownloader.STATE_SUFFIX))
+        data_inode = os.stat(to_path).st_ino
+        # Every state file written is preceded by a sync of the data file.
+        self.assertTrue(len(synced) > 2)
+        for i in range(0, len(synced), 2):
+            self.assertEqual(synced[i], data_inode)
+            self.assertNotEqual(synced[i + 1], data_inode)
+
+
+if __name__ == '__main__':
+    unittest.main()